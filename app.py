@@ -3,9 +3,13 @@ from streamlit_option_menu import option_menu
 import os
 import extra_streamlit_components as stx
 from backend.database import db
+from backend.migrations import apply_baseline, migrate
 from backend.auth_service import AuthService
 from backend.post_service import PostService
+from backend.feed import new_feed_seed
+from backend.loaders import start_request_scope
 from backend.user_service import UserService
+from backend.utils import resolve_variant
 from components.card import render_card
 
 # Page Config
@@ -181,6 +185,9 @@ st.markdown("""
 # Cookie Manager for persistent session
 cookie_manager = stx.CookieManager()
 
+# Each rerun of this script is one render pass with its own batched user loader
+start_request_scope()
+
 # Initialize Session State Logic
 if 'is_logged_in' not in st.session_state:
     st.session_state['is_logged_in'] = False
@@ -190,6 +197,9 @@ if 'selected_post_id' not in st.session_state:
     st.session_state['selected_post_id'] = None
 if 'show_login_view' not in st.session_state:
     st.session_state['show_login_view'] = False
+if 'feed_seed' not in st.session_state:
+    # Keeps the shuffled recommend feed stable across reruns of this session
+    st.session_state['feed_seed'] = new_feed_seed()
 
 # Check cookies for existing session
 if not st.session_state['is_logged_in']:
@@ -206,17 +216,13 @@ def init_db():
     conn = db.connect()
     if conn:
         try:
-            with open('schema.sql', 'r', encoding='utf-8') as f:
-                schema = f.read()
-            # Split by command (simple split by semicolon might be fragile but works for this schema)
-            commands = schema.split(';')
-            with conn.cursor() as cursor:
-                for cmd in commands:
-                    if cmd.strip():
-                        cursor.execute(cmd)
+            apply_baseline(conn, 'schema.sql')
+            migrate(conn)
             st.success("数据库初始化成功！")
         except Exception as e:
             st.error(f"数据库初始化失败: {e}")
+        finally:
+            conn.close()
 
 def view_post_details(post_id):
     st.session_state['selected_post_id'] = post_id
@@ -250,7 +256,7 @@ with st.sidebar:
         c1, c2, c3 = st.columns([1,2,1])
         with c2:
              if user.get('avatar_url') and os.path.exists(user['avatar_url']):
-                st.image(user['avatar_url'], width=80, use_container_width=False)
+                st.image(resolve_variant(user['avatar_url'], 160), width=80, use_container_width=False)
              else:
                 st.markdown("<div style='font-size: 50px; text-align: center;'>👤</div>", unsafe_allow_html=True)
         
@@ -312,12 +318,12 @@ if st.session_state['selected_post_id']:
     if st.button("← 返回首页"):
         go_back_home()
         
-    post = PostService.get_post_by_id(st.session_state['selected_post_id'])
+    post = PostService.get_post_detail(st.session_state['selected_post_id'], include_comments=True)
     if post:
         col1, col2 = st.columns([1, 1])
         with col1:
             if post['image_url'] and os.path.exists(post['image_url']):
-                st.image(post['image_url'])
+                st.image(resolve_variant(post['image_url'], 1080))
             else:
                 st.image("https://via.placeholder.com/400x500?text=No+Image")
         
@@ -353,8 +359,7 @@ if st.session_state['selected_post_id']:
             
             st.markdown("---")
             st.subheader("评论")
-            comments = PostService.get_comments(post['id'])
-            for c in comments:
+            for c in post['comments']:
                 st.markdown(f"**{c['nickname']}:** {c['content']}")
             
             if st.session_state['is_logged_in']:
@@ -425,7 +430,8 @@ else:
         # let's pass it to get_posts.
         posts = PostService.get_posts(
             search_query=search_query if search_query else None,
-            category=selected_category
+            category=selected_category,
+            seed=st.session_state['feed_seed']
         )
         
         if not posts:
@@ -477,7 +483,7 @@ else:
         col_left, col_right = st.columns([1, 3])
         with col_left:
             if user.get('avatar_url') and os.path.exists(user['avatar_url']):
-                st.image(user['avatar_url'], width=150)
+                st.image(resolve_variant(user['avatar_url'], 300), width=150)
             else:
                 st.image("https://via.placeholder.com/150", width=150)
             
@@ -524,7 +530,7 @@ else:
                     c1, c2, c3 = st.columns([1, 4, 2])
                     with c1:
                         if f_user.get('avatar_url') and os.path.exists(f_user['avatar_url']):
-                             st.image(f_user['avatar_url'], width=50)
+                             st.image(resolve_variant(f_user['avatar_url'], 64), width=50)
                         else:
                              st.markdown("👤")
                     with c2:
@@ -538,20 +544,21 @@ else:
                 st.info("还没有关注任何人")
 
         with tab_followers:
-            followers = UserService.get_followers(user['id'])
+            # Includes whether I follow each of them back, in the same query
+            followers = UserService.get_followers(user['id'], user['id'])
             if followers:
                 for f_user in followers:
                     c1, c2, c3 = st.columns([1, 4, 2])
                     with c1:
                         if f_user.get('avatar_url') and os.path.exists(f_user['avatar_url']):
-                             st.image(f_user['avatar_url'], width=50)
+                             st.image(resolve_variant(f_user['avatar_url'], 64), width=50)
                         else:
                              st.markdown("👤")
                     with c2:
                          st.write(f"**{f_user['nickname']}**")
                     with c3:
                          # Check if I follow them back?
-                         if UserService.is_following(user['id'], f_user['id']):
+                         if f_user['is_following']:
                              st.button("互相关注", disabled=True, key=f"mutual_{f_user['id']}")
                          else:
                              if st.button("回粉", key=f"follow_back_{f_user['id']}", type="primary"):
@@ -0,0 +1,107 @@
+"""
+异步服务层
+把同步的 pymysql 服务方法放到专用线程池中执行，供 FastAPI 的 async 路由 await，
+避免慢查询阻塞事件循环。
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .auth_service import AuthService
+from .message_service import MessageService
+from .post_service import PostService
+from .search_service import SearchService
+from .user_service import UserService
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_db_executor():
+    """Thread pool that runs blocking service calls.
+
+    Sized to the connection pool by default: more threads than connections
+    would only queue inside ``ConnectionPool.acquire``.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                workers = int(os.getenv('DB_EXECUTOR_WORKERS', os.getenv('DB_POOL_MAX_SIZE', 10)))
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='db-worker')
+    return _executor
+
+async def run_in_db_executor(func, *args, **kwargs):
+    """Run a blocking callable on the DB executor, preserving context variables."""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, func, *args, **kwargs)
+    return await loop.run_in_executor(get_db_executor(), call)
+
+class AsyncService:
+    """Awaitable view of a synchronous service class.
+
+    Methods are looked up on every call, so ``AsyncPostService.get_posts(...)``
+    always runs whatever ``PostService.get_posts`` currently is.
+    """
+
+    def __init__(self, service):
+        self._service = service
+
+    def __getattr__(self, name):
+        attr = getattr(self._service, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            return await run_in_db_executor(getattr(self._service, name), *args, **kwargs)
+
+        call.__name__ = name
+        call.__doc__ = attr.__doc__
+        return call
+
+    def __repr__(self):
+        return f"AsyncService({self._service.__name__})"
+
+class AsyncAuthServiceProxy(AsyncService):
+    """``AsyncService(AuthService)`` with login and registration split around the password hash.
+
+    The database steps run on the DB executor; the bcrypt step in between is
+    awaited on the password process pool, so a login storm queues (or is shed
+    with PasswordHasherBusy) there instead of filling the DB executor.
+    """
+
+    async def login_user(self, username, password):
+        user, error = await run_in_db_executor(AuthService.get_credentials, username)
+        if error:
+            return None, error
+        if not user or not await AuthService.verify_password_async(password, user['password_hash']):
+            return None, "用户名或密码错误"
+        # 移除密码哈希，不返回给客户端
+        password_hash = user.pop('password_hash')
+        if AuthService.needs_rehash(password_hash):
+            await self._rehash_password(user['id'], password, password_hash)
+        return user, "Login successful"
+
+    async def _rehash_password(self, user_id, password, old_hash):
+        try:
+            new_hash = await AuthService.hash_password_async(password)
+        except Exception as e:
+            print(f"Skipping password rehash: {e}")
+            return
+        await run_in_db_executor(AuthService.update_password_hash, user_id, new_hash, old_hash)
+
+    async def register_user(self, username, password, nickname=None, avatar_file=None):
+        valid, msg = AuthService.validate_registration(username, password, nickname, avatar_file)
+        if not valid:
+            return False, msg
+        # 先哈希密码：繁忙时在保存头像之前就拒绝
+        password_hash = await AuthService.hash_password_async(password)
+        return await run_in_db_executor(AuthService.create_user, username, password_hash, nickname, avatar_file)
+
+AsyncAuthService = AsyncAuthServiceProxy(AuthService)
+AsyncPostService = AsyncService(PostService)
+AsyncMessageService = AsyncService(MessageService)
+AsyncUserService = AsyncService(UserService)
+AsyncSearchService = AsyncService(SearchService)
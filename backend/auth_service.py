@@ -1,22 +1,41 @@
-import bcrypt
 from .database import db
-from .utils import save_image
+from .passwords import password_hasher
+from .utils import MAX_BATCH_IDS, save_image
+from .cache import MISSING, invalidate_tags, user_cache
+from .loaders import current_loader
+
+USERS_BY_IDS_SQL = "SELECT id, username, nickname, avatar_url FROM users WHERE id IN ({placeholders})"
 
 class AuthService:
     @staticmethod
     def hash_password(password):
-        """Hash a password using bcrypt."""
-        salt = bcrypt.gensalt()
-        return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+        """Hash a password using bcrypt (on the password process pool).
+
+        Raises PasswordHasherBusy when too many hashes are queued.
+        """
+        return password_hasher.hash(password)
     
     @staticmethod
     def verify_password(password, password_hash):
-        """Verify a password against a hash."""
-        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+        """Verify a password against a hash. Raises PasswordHasherBusy like ``hash_password``."""
+        return password_hasher.verify(password, password_hash)
 
     @staticmethod
-    def register_user(username, password, nickname=None, avatar_file=None):
-        """Register a new user."""
+    async def hash_password_async(password):
+        """``hash_password`` for async callers: awaits the pool without blocking a thread."""
+        return await password_hasher.hash_async(password)
+
+    @staticmethod
+    async def verify_password_async(password, password_hash):
+        return await password_hasher.verify_async(password, password_hash)
+
+    @staticmethod
+    def needs_rehash(password_hash):
+        return password_hasher.needs_rehash(password_hash)
+
+    @staticmethod
+    def validate_registration(username, password, nickname=None, avatar_file=None):
+        """Check registration input before anything is hashed or saved."""
         # 输入验证
         if not username or len(username.strip()) < 3:
             return False, "用户名至少需要3个字符"
@@ -32,12 +51,25 @@ class AuthService:
         # 头像为必填项
         if not avatar_file:
             return False, "请上传头像"
-        
+        return True, ""
+
+    @staticmethod
+    def register_user(username, password, nickname=None, avatar_file=None):
+        """Register a new user."""
+        valid, msg = AuthService.validate_registration(username, password, nickname, avatar_file)
+        if not valid:
+            return False, msg
+        # 先哈希密码：繁忙时在保存头像之前就拒绝
+        password_hash = AuthService.hash_password(password)
+        return AuthService.create_user(username, password_hash, nickname, avatar_file)
+
+    @staticmethod
+    def create_user(username, password_hash, nickname, avatar_file):
+        """Save the avatar and insert a validated registration with its password hash."""
         # 清理输入
         username = username.strip()
-        if nickname:
-            nickname = nickname.strip()
-        
+        nickname = nickname.strip() if nickname else username
+
         # 处理头像
         avatar_url = None
         try:
@@ -47,65 +79,156 @@ class AuthService:
         except Exception as e:
             return False, "头像上传失败"
 
-        conn = db.get_connection()
-        if not conn:
-            return False, "Database connection failed"
+        with db.connection() as conn:
+            if not conn:
+                return False, "Database connection failed"
 
-        password_hash = AuthService.hash_password(password)
-        nickname = nickname or username
-        
-        try:
-            with conn.cursor() as cursor:
-                # 检查用户名是否已存在
-                check_sql = "SELECT id FROM users WHERE username = %s"
-                cursor.execute(check_sql, (username,))
-                if cursor.fetchone():
-                    return False, "用户名已存在，请选择其他用户名"
+            try:
+                with conn.cursor() as cursor:
+                    # 检查用户名是否已存在
+                    check_sql = "SELECT id FROM users WHERE username = %s"
+                    cursor.execute(check_sql, (username,))
+                    if cursor.fetchone():
+                        return False, "用户名已存在，请选择其他用户名"
                 
-                # 用户名不存在，执行插入
-                sql = "INSERT INTO users (username, password_hash, nickname, avatar_url) VALUES (%s, %s, %s, %s)"
-                cursor.execute(sql, (username, password_hash, nickname, avatar_url))
-            return True, "Registration successful"
-        except Exception as e:
-            return False, "Registration failed"
+                    # 用户名不存在，执行插入
+                    sql = "INSERT INTO users (username, password_hash, nickname, avatar_url) VALUES (%s, %s, %s, %s)"
+                    cursor.execute(sql, (username, password_hash, nickname, avatar_url))
+                return True, "Registration successful"
+            except Exception as e:
+                return False, "Registration failed"
 
     @staticmethod
-    def login_user(username, password):
-        """Authenticate a user."""
-        conn = db.get_connection()
-        if not conn:
-            return None, "Database connection failed"
+    def get_credentials(username):
+        """``(user row including password_hash or None, error message or None)``."""
+        with db.connection() as conn:
+            if not conn:
+                return None, "Database connection failed"
         
+            try:
+                with conn.cursor() as cursor:
+                    # 先获取用户信息（包括密码哈希）
+                    sql = "SELECT id, username, nickname, avatar_url, password_hash FROM users WHERE username = %s"
+                    cursor.execute(sql, (username,))
+                    return cursor.fetchone(), None
+            except Exception as e:
+                return None, "登录失败"
+
+    @staticmethod
+    def login_user(username, password):
+        """Authenticate a user.
+
+        The password is checked after the connection is returned to the pool.
+        Raises PasswordHasherBusy when the password pool is saturated.
+        """
+        user, error = AuthService.get_credentials(username)
+        if error:
+            return None, error
+        if not user or not AuthService.verify_password(password, user['password_hash']):
+            return None, "用户名或密码错误"
+        # 移除密码哈希，不返回给客户端
+        password_hash = user.pop('password_hash')
+        if AuthService.needs_rehash(password_hash):
+            AuthService._rehash_password(user['id'], password, password_hash)
+        return user, "Login successful"
+
+    @staticmethod
+    def _rehash_password(user_id, password, old_hash):
+        """Re-hash with the current BCRYPT_ROUNDS; best effort, login succeeds regardless."""
         try:
-            with conn.cursor() as cursor:
-                # 先获取用户信息（包括密码哈希）
-                sql = "SELECT id, username, nickname, avatar_url, password_hash FROM users WHERE username = %s"
-                cursor.execute(sql, (username,))
-                user = cursor.fetchone()
-                
-                if user and AuthService.verify_password(password, user['password_hash']):
-                    # 移除密码哈希，不返回给客户端
-                    del user['password_hash']
-                    return user, "Login successful"
-                return None, "用户名或密码错误"
+            new_hash = password_hasher.hash(password)
         except Exception as e:
-            return None, "登录失败"
+            print(f"Skipping password rehash: {e}")
+            return
+        AuthService.update_password_hash(user_id, new_hash, old_hash)
 
     @staticmethod
-    def get_user_by_id(user_id):
-        """Get user info by ID."""
-        conn = db.get_connection()
-        if not conn:
-            return None
+    def update_password_hash(user_id, new_hash, old_hash):
+        """Store a re-hashed password, unless it was changed since ``old_hash`` was verified."""
+        with db.connection() as conn:
+            if not conn:
+                return
+            try:
+                with conn.cursor() as cursor:
+                    # Only replace the hash that was verified (a concurrent password change wins)
+                    cursor.execute(
+                        "UPDATE users SET password_hash = %s WHERE id = %s AND password_hash = %s",
+                        (new_hash, user_id, old_hash)
+                    )
+                password_hasher.record_rehash()
+            except Exception as e:
+                print(f"Error rehashing password: {e}")
+
+    @staticmethod
+    def get_user_by_id(user_id, use_cache=True):
+        """Get user info by ID.
 
+        Rows are cached for USER_CACHE_TTL seconds; ``update_user_profile``
+        drops the entry. ``use_cache=False`` always queries (and refreshes it).
+        """
         try:
-            with conn.cursor() as cursor:
-                sql = "SELECT id, username, nickname, avatar_url FROM users WHERE id = %s"
-                cursor.execute(sql, (user_id,))
-                return cursor.fetchone()
-        except Exception as e:
-            print(f"Error fetching user: {e}")
+            user_id = int(user_id)  # cookie and JWT ids may arrive as strings
+        except (TypeError, ValueError):
             return None
+        loader = current_loader()
+        if use_cache and loader is not None:
+            # Batched with the other users requested in this request
+            return loader.load(user_id)
+        if use_cache:
+            cached = user_cache.get(user_id, MISSING)
+            if cached is not MISSING:
+                return dict(cached)
+
+        with db.connection() as conn:
+            if not conn:
+                return None
+
+            try:
+                with conn.cursor() as cursor:
+                    sql = "SELECT id, username, nickname, avatar_url FROM users WHERE id = %s"
+                    cursor.execute(sql, (user_id,))
+                    user = cursor.fetchone()
+            except Exception as e:
+                print(f"Error fetching user: {e}")
+                return None
+        if user:
+            user_cache.set(user_id, dict(user), tags={f"user:{user_id}"})
+        return user
+
+    @staticmethod
+    def get_users_by_ids(user_ids):
+        """Get ``{user_id: user}`` for ``user_ids``; missing users are left out.
+
+        Cached users are served from the users cache, the rest with one
+        ``WHERE id IN (...)`` query per MAX_BATCH_IDS ids.
+        """
+        users = {}
+        missing = []
+        for user_id in dict.fromkeys(int(uid) for uid in user_ids):
+            cached = user_cache.get(user_id, MISSING)
+            if cached is MISSING:
+                missing.append(user_id)
+            else:
+                users[user_id] = dict(cached)
+        if not missing:
+            return users
+
+        with db.connection() as conn:
+            if not conn:
+                return users
+
+            try:
+                with conn.cursor() as cursor:
+                    for start in range(0, len(missing), MAX_BATCH_IDS):
+                        chunk = missing[start:start + MAX_BATCH_IDS]
+                        placeholders = ", ".join(["%s"] * len(chunk))
+                        cursor.execute(USERS_BY_IDS_SQL.format(placeholders=placeholders), tuple(chunk))
+                        for user in cursor.fetchall():
+                            users[user['id']] = user
+                            user_cache.set(user['id'], dict(user), tags={f"user:{user['id']}"})
+            except Exception as e:
+                print(f"Error fetching users: {e}")
+        return users
 
     @staticmethod
     def update_user_profile(user_id, nickname, avatar_file=None):
@@ -116,29 +239,39 @@ class AuthService:
         if len(nickname) > 50:
             return False, "昵称不能超过50个字符"
         
-        conn = db.get_connection()
-        if not conn:
-            return False, "Database connection failed"
-
-        try:
-            avatar_url = None
-            if avatar_file:
+        # Save the avatar (and its variants) before borrowing a pooled connection
+        avatar_url = None
+        if avatar_file:
+            try:
                 avatar_url = save_image(avatar_file)
+            except ValueError as e:
+                return False, str(e)  # 文件验证错误
+            except Exception as e:
+                print(f"Avatar upload error: {e}")
+                return False, "Update failed"
 
-            with conn.cursor() as cursor:
-                # 验证用户是否存在
-                cursor.execute("SELECT id FROM users WHERE id = %s", (user_id,))
-                if not cursor.fetchone():
-                    return False, "用户不存在"
+        with db.connection() as conn:
+            if not conn:
+                return False, "Database connection failed"
+
+            try:
+                with conn.cursor() as cursor:
+                    # 验证用户是否存在
+                    cursor.execute("SELECT id FROM users WHERE id = %s", (user_id,))
+                    if not cursor.fetchone():
+                        return False, "用户不存在"
                 
-                if avatar_url:
-                    sql = "UPDATE users SET nickname = %s, avatar_url = %s WHERE id = %s"
-                    cursor.execute(sql, (nickname.strip(), avatar_url, user_id))
-                else:
-                    sql = "UPDATE users SET nickname = %s WHERE id = %s"
-                    cursor.execute(sql, (nickname.strip(), user_id))
-            return True, "Profile updated successfully"
-        except ValueError as e:
-            return False, str(e)  # 文件验证错误
-        except Exception as e:
-            return False, "Update failed"
+                    if avatar_url:
+                        sql = "UPDATE users SET nickname = %s, avatar_url = %s WHERE id = %s"
+                        cursor.execute(sql, (nickname.strip(), avatar_url, user_id))
+                    else:
+                        sql = "UPDATE users SET nickname = %s WHERE id = %s"
+                        cursor.execute(sql, (nickname.strip(), user_id))
+                # Cached users, feed pages and post details carry the nickname and avatar
+                invalidate_tags(f"user:{user_id}")
+                loader = current_loader()
+                if loader is not None:
+                    loader.forget(user_id)
+                return True, "Profile updated successfully"
+            except Exception as e:
+                return False, "Update failed"
@@ -0,0 +1,155 @@
+"""
+进程内缓存
+带 TTL 和 LRU 淘汰的线程安全缓存，条目可以打上标签（如 ``post:12``、``user:3``），
+写操作按标签精确失效相关条目。缓存只在当前进程内有效（FastAPI 与 Streamlit 各自一份），
+跨进程的一致性由较短的 TTL 兜底。
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+# name -> TTLCache, for the /api/system/cache stats endpoint and tests
+CACHES = {}
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire after ``ttl`` seconds."""
+
+    def __init__(self, name, max_entries=1024, ttl=30.0):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, value, tags)
+        self._tags = {}  # tag -> set of keys
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+        CACHES[name] = self
+
+    def _drop(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def get(self, key, default=None):
+        """Return the cached value, or ``default`` when absent or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return default
+            if entry[0] <= time.monotonic():
+                self._drop(key)
+                self._expirations += 1
+                self._misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None, tags=()):
+        """Store ``value``; ``tags`` let ``invalidate_tags`` drop it later."""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        tags = frozenset(tags)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (expires_at, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self._evictions += 1
+
+    def invalidate(self, key):
+        """Drop a single key."""
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+                self._invalidations += 1
+
+    def invalidate_tags(self, *tags):
+        """Drop every entry carrying any of ``tags``. Returns the number dropped."""
+        with self._lock:
+            keys = set()
+            for tag in tags:
+                keys |= self._tags.get(tag, set())
+            for key in keys:
+                self._drop(key)
+            self._invalidations += len(keys)
+            return len(keys)
+
+    def update_tagged(self, tag, update):
+        """Call ``update(value)`` on every live entry carrying ``tag``, to patch it in place.
+        Returns the number of entries updated."""
+        with self._lock:
+            keys = self._tags.get(tag, ())
+            for key in keys:
+                update(self._entries[key][1])
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+                'invalidations': self._invalidations,
+            }
+
+def cache_stats():
+    """Stats of every registered cache, keyed by name."""
+    return {name: cache.stats() for name, cache in CACHES.items()}
+
+def invalidate_tags(*tags):
+    """Drop entries carrying any of ``tags`` from every registered cache."""
+    return sum(cache.invalidate_tags(*tags) for cache in CACHES.values())
+
+# Feed pages of PostService.get_posts / get_posts_page
+feed_cache = TTLCache(
+    'feed',
+    max_entries=int(os.getenv('FEED_CACHE_SIZE', 512)),
+    ttl=float(os.getenv('FEED_CACHE_TTL', 30)),
+)
+
+# Immutable part of a post detail (body, images, author) and brief "not found" markers
+post_detail_cache = TTLCache(
+    'post_detail',
+    max_entries=int(os.getenv('POST_DETAIL_CACHE_SIZE', 1024)),
+    ttl=float(os.getenv('POST_DETAIL_CACHE_TTL', 300)),
+)
+POST_DETAIL_NEGATIVE_TTL = float(os.getenv('POST_DETAIL_NEGATIVE_TTL', 5))
+
+# AuthService.get_user_by_id rows (id, username, nickname, avatar_url), tagged user:{id}
+user_cache = TTLCache(
+    'users',
+    max_entries=int(os.getenv('USER_CACHE_SIZE', 4096)),
+    ttl=float(os.getenv('USER_CACHE_TTL', 60)),
+)
+
+# Verified JWT payloads keyed by the token's SHA-256, never kept past the token's expiry
+token_cache = TTLCache(
+    'tokens',
+    max_entries=int(os.getenv('TOKEN_CACHE_SIZE', 4096)),
+    ttl=float(os.getenv('TOKEN_CACHE_TTL', 300)),
+)
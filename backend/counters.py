@@ -0,0 +1,253 @@
+"""
+写回计数器
+点赞时只在内存中累加 likes_count 的增量，由后台线程定期合并成一条 UPDATE 批量写回，
+避免热门笔记的每次点赞都争抢同一行的 InnoDB 行锁。
+
+- likes / comment_likes 表仍然同步写入，是计数的真实来源；进程异常退出丢失的增量
+  可以用 ``python -m backend.maintenance reconcile-likes`` 重新统计修复
+- 读取 likes_count 的地方通过 ``merge()`` 叠加尚未写回的增量，计数不会滞后
+- 写回失败时增量会放回缓冲区，下一轮重试；进程正常退出时（atexit）会最后写回一次
+- 每个增量都带着点赞事务中读到的行纪元（``likes_epoch``）。重新统计会把纪元加一，
+  写回时只应用纪元仍然相同的增量：已被重新统计计入的增量无论在哪个进程的缓冲区里都会被丢弃，
+  不会重复计数
+"""
+import atexit
+import os
+import threading
+import time
+from .database import db
+
+# name -> CounterBuffer, for the stats endpoint, maintenance jobs and tests
+COUNTERS = {}
+
+FLUSH_INTERVAL = float(os.getenv('COUNTER_FLUSH_INTERVAL', 1.0))
+# Rows per UPDATE statement when flushing
+FLUSH_CHUNK_SIZE = 500
+
+def _total(deltas_by_epoch):
+    return sum(deltas_by_epoch.values()) if deltas_by_epoch else 0
+
+class CounterBuffer:
+    """Pending ``+/-`` deltas for one integer column, flushed in batches."""
+
+    def __init__(self, name, table, column, epoch_column='likes_epoch', flush_interval=FLUSH_INTERVAL):
+        self.name = name
+        self.table = table
+        self.column = column
+        self.epoch_column = epoch_column
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # Serializes flushes, so one batch of deltas is in flight at a time
+        self._flush_lock = threading.Lock()
+        self._deltas = {}  # row_id -> {epoch: delta}
+        self._in_flight = {}  # the batch being written by flush()
+        self._generation = 0  # bumped when a flush starts and ends: odd while one runs
+        self._listeners = []
+        self._thread = None
+        self._stop = threading.Event()
+        self._flushes = 0
+        self._rows_flushed = 0
+        self._failures = 0
+        self._last_error = None
+        self._last_flush_at = None
+        COUNTERS[name] = self
+
+    def epoch_query(self, row_id):
+        """SQL and params reading ``row_id``'s epoch to tag its delta with, share-locked
+        until the caller's transaction ends so a concurrent recount waits for it.
+        Returns no row if the row is gone."""
+        return f"SELECT {self.epoch_column} AS epoch FROM {self.table} WHERE id = %s LOCK IN SHARE MODE", (row_id,)
+
+    def add(self, row_id, delta=1, epoch=0):
+        """Buffer a change of ``delta`` to ``row_id``'s counter, made under ``epoch``."""
+        with self._lock:
+            by_epoch = self._deltas.setdefault(row_id, {})
+            value = by_epoch.get(epoch, 0) + delta
+            if value:
+                by_epoch[epoch] = value
+            else:
+                by_epoch.pop(epoch, None)
+                if not by_epoch:
+                    del self._deltas[row_id]
+        self._ensure_started()
+
+    def pending(self, row_id):
+        """Delta not yet written to the database for ``row_id``."""
+        with self._lock:
+            return _total(self._deltas.get(row_id))
+
+    def merge(self, rows, id_key='id', cached=False):
+        """Add pending deltas to the counter column of ``rows`` in place.
+
+        ``cached=True`` is for rows kept in a cache that an ``on_flush``
+        listener patches: deltas being written right now count too, until the
+        listener has folded them in.
+        """
+        with self._lock:
+            if not self._deltas and not (cached and self._in_flight):
+                return rows
+            for row in rows:
+                row_id = row.get(id_key)
+                delta = _total(self._deltas.get(row_id))
+                if cached:
+                    delta += _total(self._in_flight.get(row_id))
+                if delta and row.get(self.column) is not None:
+                    row[self.column] += delta
+        return rows
+
+    def generation(self):
+        """Flush generation: odd while a batch is being written.
+
+        Rows read between two equal, even generations saw no flush commit, so a
+        cache patched by an ``on_flush`` listener can store them.
+        """
+        with self._lock:
+            return self._generation
+
+    def on_flush(self, callback):
+        """Call ``callback({row_id: delta})`` after each successful flush, before
+        ``merge(cached=True)`` stops adding those deltas."""
+        self._listeners.append(callback)
+
+    def flush(self):
+        """Write all pending deltas. Returns the number of rows updated."""
+        with self._flush_lock:
+            with self._lock:
+                deltas, self._deltas = self._deltas, {}
+                self._in_flight = deltas
+                if deltas:
+                    self._generation += 1
+            if not deltas:
+                return 0
+            try:
+                self._write(deltas)
+            except Exception as e:
+                # Put the deltas back so the next flush retries them
+                with self._lock:
+                    for row_id, by_epoch in deltas.items():
+                        pending = self._deltas.setdefault(row_id, {})
+                        for epoch, delta in by_epoch.items():
+                            pending[epoch] = pending.get(epoch, 0) + delta
+                    self._in_flight = {}
+                    self._generation += 1
+                self._failures += 1
+                self._last_error = str(e)
+                print(f"Error flushing {self.name} counters: {e}")
+                return 0
+            with self._lock:
+                totals = {row_id: _total(by_epoch) for row_id, by_epoch in deltas.items()}
+                for callback in self._listeners:
+                    try:
+                        callback(totals)
+                    except Exception as e:
+                        print(f"Error in {self.name} flush listener: {e}")
+                self._in_flight = {}
+                self._generation += 1
+            self._flushes += 1
+            self._rows_flushed += len(deltas)
+            self._last_flush_at = time.time()
+            return len(deltas)
+
+    def _write(self, deltas):
+        """Apply ``deltas`` in one transaction: a failed chunk rolls back the
+        ones before it, so putting the whole batch back can't apply any twice."""
+        ids = sorted(deltas)  # primary key order keeps concurrent flushes from deadlocking
+        with db.connection() as conn:
+            if not conn:
+                raise RuntimeError("Database connection failed")
+            with conn.cursor() as cursor:
+                conn.begin()
+                try:
+                    self._write_chunks(cursor, ids, deltas)
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+
+    def _write_chunks(self, cursor, ids, deltas):
+        for start in range(0, len(ids), FLUSH_CHUNK_SIZE):
+            chunk = ids[start:start + FLUSH_CHUNK_SIZE]
+            # A delta only applies while the row is still in the epoch it was made in
+            params, cases = [], []
+            for row_id in chunk:
+                for epoch, delta in sorted(deltas[row_id].items()):
+                    cases.append(f"WHEN id = %s AND {self.epoch_column} = %s THEN %s")
+                    params.extend((row_id, epoch, delta))
+            placeholders = ", ".join(["%s"] * len(chunk))
+            sql = (
+                f"UPDATE {self.table} SET {self.column} = {self.column} + CASE {' '.join(cases)} ELSE 0 END "
+                f"WHERE id IN ({placeholders})"
+            )
+            cursor.execute(sql, (*params, *chunk))
+
+    def reconcile(self, conn, recount_sql, first_id, last_id):
+        """Reset counters of ids ``first_id..last_id`` from their source rows.
+
+        ``recount_sql`` sets the column to the true count for the ids between
+        its ``%(first_id)s`` and ``%(last_id)s`` parameters and increments the
+        epoch column, which voids the deltas any process still buffers for
+        those rows (they are included in the recount). The rows are locked
+        first, the same order a like takes, so the two queue instead of
+        deadlocking. Returns the number of rows the recount changed.
+        """
+        with conn.cursor() as cursor:
+            conn.begin()
+            try:
+                cursor.execute(
+                    f"SELECT id FROM {self.table} WHERE id BETWEEN %s AND %s FOR UPDATE", (first_id, last_id)
+                )
+                cursor.execute(recount_sql, {'first_id': first_id, 'last_id': last_id})
+                changed = cursor.rowcount
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return changed
+
+    def clear(self):
+        """Drop pending deltas without writing them."""
+        with self._lock:
+            self._deltas.clear()
+            self._in_flight = {}
+
+    def stats(self):
+        with self._lock:
+            pending_rows = len(self._deltas)
+        return {
+            'pending_rows': pending_rows,
+            'flush_interval': self.flush_interval,
+            'flushes': self._flushes,
+            'rows_flushed': self._rows_flushed,
+            'failures': self._failures,
+            'last_error': self._last_error,
+            'last_flush_at': self._last_flush_at,
+        }
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name=f"{self.name}-flusher", daemon=True
+                    )
+                    self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def stop(self):
+        """Stop the background flusher and write what is pending."""
+        self._stop.set()
+        self.flush()
+
+def flush_all():
+    return sum(counter.flush() for counter in COUNTERS.values())
+
+def counter_stats():
+    return {name: counter.stats() for name, counter in COUNTERS.items()}
+
+post_likes = CounterBuffer('post_likes', 'posts', 'likes_count')
+comment_likes = CounterBuffer('comment_likes', 'comments', 'likes_count')
+
+atexit.register(flush_all)
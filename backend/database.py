@@ -1,60 +1,365 @@
 import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
 import pymysql
+from pymysql.constants import CLIENT
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+
+class PoolTimeoutError(Exception):
+    """Raised when no pooled connection became available before the checkout timeout."""
+
+
+class ConnectionPool:
+    """Thread-safe pool of pymysql connections.
+
+    Connections are borrowed with ``acquire()`` and handed back with ``release()``.
+    On borrow a connection is recycled once it is older than ``max_lifetime`` and
+    pinged when it has been idle for ``ping_interval`` seconds or more, so callers
+    never receive a connection the server has already dropped.
+    """
+
+    STATS_WINDOW = 10.0  # seconds used for the checkouts-per-second rate
+
+    def __init__(self, connect, min_size=1, max_size=10, timeout=10.0,
+                 max_lifetime=3600.0, ping_interval=1.0, idle_timeout=300.0):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self._connect = connect
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.ping_interval = ping_interval
+        self.idle_timeout = idle_timeout
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (conn, last_used), most recently used on the right
+        self._born = {}  # id(conn) -> creation time
+        self._size = 0  # open connections, idle + in use
+        self._waiting = 0
+        self._closed = False
+        self._warmed = False
+
+        self._checkouts = 0
+        self._recent_checkouts = deque(maxlen=100000)
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._timeouts = 0
+        self._recycled = 0
+        self._health_check_failures = 0
+
+    # --- Connection lifecycle ---
+    def _create(self):
+        conn = self._connect()
+        self._born[id(conn)] = time.monotonic()
+        return conn
+
+    def _destroy(self, conn):
+        self._born.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _warmup(self):
+        """Open ``min_size`` connections the first time the pool is used."""
+        self._warmed = True
+        for _ in range(self.min_size):
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._create()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                return
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def _validate(self, conn, last_used):
+        """Return a healthy connection, replacing ``conn`` when it is too old or dead."""
+        now = time.monotonic()
+        if self.max_lifetime and now - self._born.get(id(conn), now) > self.max_lifetime:
+            self._destroy(conn)
+            with self._cond:
+                self._recycled += 1
+            return self._create()
+        if now - last_used >= self.ping_interval:
+            try:
+                conn.ping(reconnect=False)
+            except Exception:
+                self._destroy(conn)
+                with self._cond:
+                    self._health_check_failures += 1
+                return self._create()
+        return conn
+
+    # --- Public API ---
+    def acquire(self, timeout=None):
+        """Borrow a connection, waiting up to ``timeout`` seconds for one to free up."""
+        if not self._warmed:
+            self._warmup()
+
+        start = time.monotonic()
+        deadline = start + (self.timeout if timeout is None else timeout)
+        conn = None
+        last_used = None
+        with self._cond:
+            if self._closed:
+                raise PoolTimeoutError("Connection pool is closed")
+            self._waiting += 1
+            try:
+                while True:
+                    if self._idle:
+                        conn, last_used = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeoutError(
+                            f"Timed out after {self.timeout}s waiting for a database connection"
+                        )
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+
+        try:
+            if conn is None:
+                conn = self._create()
+            else:
+                conn = self._validate(conn, last_used)
+        except Exception:
+            # The slot was reserved for us but no usable connection came out of it
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        waited = time.monotonic() - start
+        with self._cond:
+            self._checkouts += 1
+            self._recent_checkouts.append(time.monotonic())
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+        return conn
+
+    def release(self, conn, discard=False):
+        """Return a borrowed connection; broken or discarded connections are closed."""
+        if not discard:
+            try:
+                if not conn.open:
+                    discard = True
+                elif conn.server_status & pymysql.constants.SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+                    # Never hand a half-finished transaction to the next borrower
+                    conn.rollback()
+            except Exception:
+                discard = True
+
+        if discard:
+            self._destroy(conn)
+
+        stale = []
+        with self._cond:
+            if discard or self._closed:
+                self._size -= 1
+                if not discard:
+                    stale.append(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            # Shrink back towards min_size once the extra connections sit unused
+            now = time.monotonic()
+            while (len(self._idle) > self.min_size and self.idle_timeout
+                   and now - self._idle[0][1] > self.idle_timeout):
+                stale.append(self._idle.popleft()[0])
+                self._size -= 1
+            self._cond.notify()
+        for old in stale:
+            self._destroy(old)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Borrow a connection for the duration of a ``with`` block."""
+        conn = self.acquire(timeout)
+        discard = False
+        try:
+            yield conn
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    def close(self):
+        """Close idle connections; connections still in use are closed on release."""
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            self._destroy(conn)
+
+    def stats(self):
+        """Snapshot of pool usage for sizing and monitoring."""
+        with self._cond:
+            now = time.monotonic()
+            while self._recent_checkouts and now - self._recent_checkouts[0] > self.STATS_WINDOW:
+                self._recent_checkouts.popleft()
+            idle = len(self._idle)
+            return {
+                'size': self._size,
+                'in_use': self._size - idle,
+                'idle': idle,
+                'waiting': self._waiting,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'checkouts': self._checkouts,
+                'checkouts_per_sec': round(len(self._recent_checkouts) / self.STATS_WINDOW, 2),
+                'avg_wait_ms': round(self._total_wait / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+                'max_wait_ms': round(self._max_wait * 1000, 3),
+                'timeouts': self._timeouts,
+                'recycled': self._recycled,
+                'health_check_failures': self._health_check_failures,
+            }
+
+
+def fetch_batch(cursor, statements):
+    """Run ``[(sql, params), ...]`` in a single round trip.
+
+    Returns one list of rows per statement. Needs a connection borrowed with
+    ``db.connection(batch=True)``, the only ones opened with ``CLIENT.MULTI_STATEMENTS``.
+    """
+    sql = ";\n".join(statement.strip().rstrip(';') for statement, _ in statements)
+    params = tuple(param for _, statement_params in statements for param in statement_params)
+    cursor.execute(sql, params)
+    results = [list(cursor.fetchall())]
+    for _ in statements[1:]:
+        cursor.nextset()
+        results.append(list(cursor.fetchall()))
+    return results
+
+
 class Database:
     _instance = None
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(Database, cls).__new__(cls)
-            cls._instance.connection = None
+            cls._instance._pool = None
+            cls._instance._batch_pool = None
+            cls._instance._pool_lock = threading.Lock()
         return cls._instance
 
+    def _open_connection(self, multi_statements=False):
+        return pymysql.connect(
+            host=os.getenv('DB_HOST', 'localhost'),
+            user=os.getenv('DB_USER', 'root'),
+            password=os.getenv('DB_PASSWORD', ''),
+            database=os.getenv('DB_NAME', 'mini_redbook'),
+            port=int(os.getenv('DB_PORT', 3306)),
+            cursorclass=pymysql.cursors.DictCursor,
+            autocommit=True,
+            # Lets fetch_batch() send several statements in one round trip. Only
+            # the batch pool has it, so an injected "; ..." can't run elsewhere.
+            client_flag=CLIENT.MULTI_STATEMENTS if multi_statements else 0
+        )
+
+    @property
+    def pool(self):
+        """The process-wide connection pool, created on first use."""
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ConnectionPool(
+                        self._open_connection,
+                        min_size=int(os.getenv('DB_POOL_MIN_SIZE', 1)),
+                        max_size=int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+                        timeout=float(os.getenv('DB_POOL_TIMEOUT', 10)),
+                        max_lifetime=float(os.getenv('DB_POOL_MAX_LIFETIME', 3600)),
+                        ping_interval=float(os.getenv('DB_POOL_PING_INTERVAL', 1)),
+                    )
+        return self._pool
+
+    @property
+    def batch_pool(self):
+        """A small pool of multi-statement connections for ``fetch_batch``, created on first use."""
+        if self._batch_pool is None:
+            with self._pool_lock:
+                if self._batch_pool is None:
+                    self._batch_pool = ConnectionPool(
+                        lambda: self._open_connection(multi_statements=True),
+                        min_size=0,
+                        max_size=int(os.getenv('DB_BATCH_POOL_MAX_SIZE', 4)),
+                        timeout=float(os.getenv('DB_POOL_TIMEOUT', 10)),
+                        max_lifetime=float(os.getenv('DB_POOL_MAX_LIFETIME', 3600)),
+                        ping_interval=float(os.getenv('DB_POOL_PING_INTERVAL', 1)),
+                    )
+        return self._batch_pool
+
+    @contextmanager
+    def connection(self, batch=False):
+        """Borrow a pooled connection for a ``with`` block.
+
+        ``batch=True`` borrows from the multi-statement pool, for ``fetch_batch``.
+        Yields ``None`` when no connection can be obtained so callers can keep
+        the ``if not conn`` guard they use for other connection failures.
+        """
+        try:
+            pool = self.batch_pool if batch else self.pool
+            conn = pool.acquire()
+        except (pymysql.MySQLError, PoolTimeoutError) as e:
+            print(f"Error connecting to database: {e}")
+            conn = None
+        if conn is None:
+            yield None
+            return
+
+        discard = False
+        try:
+            yield conn
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            discard = True
+            raise
+        finally:
+            pool.release(conn, discard=discard)
+
     def connect(self):
-        """Establish a database connection."""
+        """Open a standalone (unpooled) connection; the caller is responsible for closing it."""
         try:
-            if self.connection and self.connection.open:
-                return self.connection
-            
-            self.connection = pymysql.connect(
-                host=os.getenv('DB_HOST', 'localhost'),
-                user=os.getenv('DB_USER', 'root'),
-                password=os.getenv('DB_PASSWORD', ''),
-                database=os.getenv('DB_NAME', 'mini_redbook'),
-                port=int(os.getenv('DB_PORT', 3306)),
-                cursorclass=pymysql.cursors.DictCursor,
-                autocommit=True
-            )
-            return self.connection
+            return self._open_connection()
         except pymysql.MySQLError as e:
             print(f"Error connecting to database: {e}")
             return None
 
     def get_connection(self):
-        """Get the current connection, reconnecting if necessary."""
+        """Open a standalone connection for scripts; request handlers should use ``connection()``."""
         return self.connect()
 
+    def pool_stats(self):
+        """Usage statistics of the connection pool."""
+        return self.pool.stats()
+
     def close(self):
-        """Close the database connection."""
-        if self.connection and self.connection.open:
-            self.connection.close()
+        """Close the pooled connections."""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+        if self._batch_pool is not None:
+            self._batch_pool.close()
+            self._batch_pool = None
 
 # Global DB instance
 db = Database()
-
-
-
-
-
-
-
-
-
-
-
-
-
@@ -0,0 +1,89 @@
+"""
+推荐流随机排序引擎
+每篇公开笔记在 post_shuffle 表中有 SHUFFLE_BUCKETS 个随机键，每个桶是全部笔记的一种随机排列。
+一个会话用 seed 选定桶和起始位置，按 (shuffle_key, post_id) 顺序读取并在末尾回绕，
+因此同一 seed 下翻页顺序稳定、不重复，每页只需一次（最多两次）索引范围扫描。
+"""
+import random
+
+# Must match the number of buckets backfilled by migrations/0002_post_shuffle.sql
+SHUFFLE_BUCKETS = 8
+SHUFFLE_KEY_SPACE = 2 ** 31
+
+def new_feed_seed():
+    """Random seed identifying one shuffled ordering of the feed."""
+    return random.getrandbits(32)
+
+def assign_shuffle_keys(cursor, post_id):
+    """Give a new post a random position in every shuffle bucket."""
+    rows = [(bucket, random.randrange(SHUFFLE_KEY_SPACE), post_id) for bucket in range(SHUFFLE_BUCKETS)]
+    cursor.executemany(
+        "INSERT INTO post_shuffle (bucket, shuffle_key, post_id) VALUES (%s, %s, %s)",
+        rows
+    )
+
+def _bucket_and_start(seed):
+    return seed % SHUFFLE_BUCKETS, (seed // SHUFFLE_BUCKETS) % SHUFFLE_KEY_SPACE
+
+RECOMMEND_POSTS_SQL = """
+    SELECT p.*, u.nickname, u.avatar_url, s.shuffle_key
+    FROM post_shuffle s
+    JOIN posts p ON p.id = s.post_id
+    JOIN users u ON p.user_id = u.id
+    WHERE s.bucket = %s AND p.is_private = FALSE
+"""
+
+def recommend_range_query(bucket, limit, lower=None, upper=None, after=None):
+    """SQL and params reading up to ``limit`` public posts of a bucket in shuffle order.
+
+    ``lower``/``upper`` bound shuffle_key as [lower, upper); ``after`` is the
+    (shuffle_key, post_id) of the last row already returned.
+    """
+    sql_parts = [RECOMMEND_POSTS_SQL]
+    params = [bucket]
+    if lower is not None:
+        sql_parts.append("AND s.shuffle_key >= %s")
+        params.append(lower)
+    if upper is not None:
+        sql_parts.append("AND s.shuffle_key < %s")
+        params.append(upper)
+    if after is not None:
+        sql_parts.append("AND (s.shuffle_key > %s OR (s.shuffle_key = %s AND s.post_id > %s))")
+        params.extend([after[0], after[0], after[1]])
+    sql_parts.append("ORDER BY s.shuffle_key, s.post_id LIMIT %s")
+    params.append(limit)
+    return " ".join(sql_parts), tuple(params)
+
+def _fetch_range(cursor, bucket, limit, lower=None, upper=None, after=None):
+    cursor.execute(*recommend_range_query(bucket, limit, lower, upper, after))
+    return list(cursor.fetchall())
+
+def fetch_recommend_page(cursor, limit, state):
+    """Fetch one page of the shuffled recommend feed.
+
+    ``state`` is ``{'seed': int}`` for the first page, or the ``next_state``
+    returned by the previous call. Returns ``(posts, next_state)``; ``next_state``
+    is None once every post has been returned.
+    """
+    seed = int(state['seed'])
+    bucket, start = _bucket_and_start(seed)
+    wrapped = bool(state.get('wrapped'))
+    after = (state['key'], state['id']) if state.get('key') is not None else None
+
+    posts = []
+    if not wrapped:
+        posts = _fetch_range(cursor, bucket, limit, lower=start, after=after)
+        if len(posts) < limit:
+            # Reached the end of the key space: continue from the beginning up to the start key
+            wrapped = True
+            after = None
+    if wrapped and len(posts) < limit:
+        posts += _fetch_range(cursor, bucket, limit - len(posts), upper=start, after=after)
+
+    next_state = None
+    if len(posts) == limit and posts:
+        last = posts[-1]
+        next_state = {'seed': seed, 'key': last['shuffle_key'], 'id': last['id'], 'wrapped': wrapped}
+    for post in posts:
+        post.pop('shuffle_key', None)
+    return posts, next_state
@@ -2,13 +2,17 @@
 JWT认证模块
 用于API的身份验证和授权
 """
+import hashlib
 import os
+import time
+from collections import Counter
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from .auth_service import AuthService
+from .async_service import AsyncAuthService
+from .cache import MISSING, token_cache, user_cache
 
 # JWT配置
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-in-production")  # 生产环境必须更改
@@ -17,6 +21,9 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7天
 
 security = HTTPBearer()
 
+# How authenticated requests were resolved; see auth_stats()
+_stats = Counter()
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """创建JWT访问令牌"""
     to_encode = data.copy()
@@ -29,12 +36,46 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 def verify_token(token: str) -> Optional[dict]:
-    """验证JWT令牌"""
+    """验证JWT令牌
+
+    验证通过的载荷按令牌的 SHA-256 缓存，同一令牌在 TOKEN_CACHE_TTL 内（且不超过其过期时间）
+    不再重复验签。
+    """
+    key = hashlib.sha256(token.encode('utf-8')).hexdigest()
+    payload = token_cache.get(key, MISSING)
+    if payload is not MISSING:
+        if payload.get('exp') is None or payload['exp'] > time.time():
+            _stats['token_cache_hits'] += 1
+            return payload
+        token_cache.invalidate(key)
+    _stats['token_decodes'] += 1
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
     except JWTError:
         return None
+    ttl = token_cache.ttl
+    if payload.get('exp') is not None:
+        ttl = min(ttl, payload['exp'] - time.time())
+    if ttl > 0:
+        token_cache.set(key, payload, ttl=ttl)
+    return payload
+
+def _cache_key(user_id):
+    try:
+        return int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+def auth_stats():
+    """Counters of authenticated requests: token cache hits vs. signature checks,
+    user cache hits vs. lookups that reached MySQL."""
+    return {
+        'requests': _stats['requests'],
+        'token_cache_hits': _stats['token_cache_hits'],
+        'token_decodes': _stats['token_decodes'],
+        'user_cache_hits': _stats['user_cache_hits'],
+        'user_db_lookups': _stats['user_db_lookups'],
+    }
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """从JWT令牌获取当前用户"""
@@ -53,7 +94,15 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             detail="无效的认证令牌",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    user = AuthService.get_user_by_id(user_id)
+    # Cached users are served on the event loop without a database round trip
+    _stats['requests'] += 1
+    user = user_cache.get(_cache_key(user_id), MISSING)
+    if user is not MISSING:
+        _stats['user_cache_hits'] += 1
+        user = dict(user)
+    else:
+        _stats['user_db_lookups'] += 1
+        user = await AsyncAuthService.get_user_by_id(user_id, use_cache=False)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -70,8 +119,3 @@ async def get_current_user_optional(credentials: Optional[HTTPAuthorizationCrede
         return await get_current_user(credentials)
     except HTTPException:
         return None
-
-
-
-
-
@@ -0,0 +1,92 @@
+"""
+请求级批量加载
+``UserLoader`` 收集一次请求（或 Streamlit 的一次渲染）中需要的用户 ID，
+在第一次真正取值时用一条 ``WHERE id IN (...)`` 查询全部取回，并在本次请求内记住结果：
+
+    loader = current_loader()
+    loader.prime(post['user_id'] for post in posts)   # 只登记，不查询
+    author = loader.load(posts[0]['user_id'])          # 一次查询取回全部已登记的用户
+
+当前请求的 loader 保存在 contextvar 中，``run_in_db_executor`` 会把它带到数据库线程；
+``AuthService.get_user_by_id`` 在有 loader 时自动经由它读取。
+"""
+import contextvars
+import threading
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar('user_loader', default=None)
+
+def _fetch_users(user_ids):
+    from .auth_service import AuthService
+    return AuthService.get_users_by_ids(user_ids)
+
+def _normalize(user_id):
+    try:
+        return int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+class UserLoader:
+    """Batches and memoizes user lookups for the lifetime of one request."""
+
+    def __init__(self, fetch=_fetch_users):
+        self._fetch = fetch
+        self._lock = threading.Lock()
+        self._memo = {}  # user_id -> user row, or None when it does not exist
+        self._queued = set()
+        self.batches = 0
+
+    def prime(self, user_ids):
+        """Register ids to be fetched with the next batch."""
+        with self._lock:
+            for user_id in map(_normalize, user_ids):
+                if user_id is not None and user_id not in self._memo:
+                    self._queued.add(user_id)
+
+    def load(self, user_id):
+        """User row of ``user_id`` (None if missing), fetching queued ids in the same query."""
+        user_id = _normalize(user_id)
+        if user_id is None:
+            return None
+        return self.load_many([user_id])[user_id]
+
+    def load_many(self, user_ids):
+        """``{user_id: row or None}`` for ``user_ids``, in one query for whatever is not memoized."""
+        user_ids = [uid for uid in dict.fromkeys(map(_normalize, user_ids)) if uid is not None]
+        with self._lock:
+            missing = self._queued | {uid for uid in user_ids if uid not in self._memo}
+            if missing:
+                found = self._fetch(sorted(missing))
+                for uid in missing:
+                    self._memo[uid] = found.get(uid)
+                self._queued.clear()
+                self.batches += 1
+            return {uid: dict(self._memo[uid]) if self._memo[uid] else None for uid in user_ids}
+
+    def forget(self, user_id):
+        """Drop a memoized user, e.g. after the row changed within this request."""
+        with self._lock:
+            self._memo.pop(_normalize(user_id), None)
+
+def current_loader():
+    """The loader of the current request, or None outside a request scope."""
+    return _current.get()
+
+@contextmanager
+def request_scope():
+    """Run a block (one HTTP request) with its own ``UserLoader``."""
+    token = _current.set(UserLoader())
+    try:
+        yield _current.get()
+    finally:
+        _current.reset(token)
+
+def start_request_scope():
+    """Install a fresh loader for the rest of the current context.
+
+    For script-style callers such as a Streamlit render pass, where the
+    whole script is the scope and the next run starts a new one.
+    """
+    loader = UserLoader()
+    _current.set(loader)
+    return loader
@@ -0,0 +1,239 @@
+"""
+数据修复任务
+按主键分批重新统计冗余计数，每批一条 UPDATE，可随时重复执行。
+
+用法:
+    python -m backend.maintenance reconcile-likes [--batch-size 1000]
+    python -m backend.maintenance reconcile-unread [--batch-size 1000] [--every 300]
+    python -m backend.maintenance reconcile-follows [--batch-size 1000]
+    python -m backend.maintenance backfill-image-variants [--batch-size 1000]
+    python -m backend.maintenance prune-follow-events [--batch-size 1000] [--every 3600]
+"""
+import argparse
+import os
+import sys
+import time
+from PIL import Image
+from .counters import comment_likes, post_likes
+from .database import db
+from .utils import list_variants, make_variants
+
+RECOUNT_POST_LIKES = """
+    UPDATE posts p
+    LEFT JOIN (
+        SELECT post_id, COUNT(*) AS count FROM likes
+        WHERE post_id BETWEEN %(first_id)s AND %(last_id)s GROUP BY post_id
+    ) l ON l.post_id = p.id
+    SET p.likes_count = COALESCE(l.count, 0),
+        p.likes_epoch = p.likes_epoch + 1
+    WHERE p.id BETWEEN %(first_id)s AND %(last_id)s
+"""
+
+RECOUNT_COMMENT_LIKES = """
+    UPDATE comments c
+    LEFT JOIN (
+        SELECT comment_id, COUNT(*) AS count FROM comment_likes
+        WHERE comment_id BETWEEN %(first_id)s AND %(last_id)s GROUP BY comment_id
+    ) l ON l.comment_id = c.id
+    SET c.likes_count = COALESCE(l.count, 0),
+        c.likes_epoch = c.likes_epoch + 1
+    WHERE c.id BETWEEN %(first_id)s AND %(last_id)s
+"""
+
+# Unread messages of a conversation side are those above its read watermark
+RECOUNT_CONVERSATION_UNREAD = """
+    UPDATE conversations c
+    SET unread_low = (
+            SELECT COUNT(*) FROM messages m
+            WHERE m.sender_id = c.user_high AND m.receiver_id = c.user_low AND m.id > c.read_low
+        ),
+        unread_high = (
+            SELECT COUNT(*) FROM messages m
+            WHERE m.sender_id = c.user_low AND m.receiver_id = c.user_high AND m.id > c.read_high
+        )
+    WHERE c.user_low BETWEEN %(first_id)s AND %(last_id)s
+"""
+
+RECOUNT_UNREAD = """
+    INSERT INTO user_counters (user_id, unread_messages, unread_notifications)
+    SELECT u.id,
+           (SELECT COALESCE(SUM(unread_low), 0) FROM conversations WHERE user_low = u.id)
+           + (SELECT COALESCE(SUM(unread_high), 0) FROM conversations WHERE user_high = u.id),
+           (SELECT COUNT(*) FROM notifications n WHERE n.receiver_id = u.id AND n.is_read = FALSE)
+    FROM users u WHERE u.id BETWEEN %(first_id)s AND %(last_id)s
+    ON DUPLICATE KEY UPDATE
+        unread_messages = VALUES(unread_messages),
+        unread_notifications = VALUES(unread_notifications)
+"""
+
+RECOUNT_FOLLOWS = """
+    UPDATE users u
+    LEFT JOIN (
+        SELECT followed_id, COUNT(*) AS count FROM follows
+        WHERE followed_id BETWEEN %(first_id)s AND %(last_id)s GROUP BY followed_id
+    ) fr ON fr.followed_id = u.id
+    LEFT JOIN (
+        SELECT follower_id, COUNT(*) AS count FROM follows
+        WHERE follower_id BETWEEN %(first_id)s AND %(last_id)s GROUP BY follower_id
+    ) fg ON fg.follower_id = u.id
+    SET u.follower_count = COALESCE(fr.count, 0),
+        u.following_count = COALESCE(fg.count, 0)
+    WHERE u.id BETWEEN %(first_id)s AND %(last_id)s
+"""
+
+def id_batches(cursor, table, batch_size):
+    """Yield ``(first_id, last_id)`` ranges covering ``table``'s primary keys."""
+    cursor.execute(f"SELECT MIN(id) AS min_id, MAX(id) AS max_id FROM {table}")
+    row = cursor.fetchone()
+    if not row or row['min_id'] is None:
+        return
+    for first_id in range(row['min_id'], row['max_id'] + 1, batch_size):
+        yield first_id, min(first_id + batch_size - 1, row['max_id'])
+
+def _reconcile(conn, counter, recount_sql, batch_size):
+    with conn.cursor() as cursor:
+        batches = list(id_batches(cursor, counter.table, batch_size))
+    return sum(counter.reconcile(conn, recount_sql, first_id, last_id) for first_id, last_id in batches)
+
+def reconcile_like_counts(conn, batch_size=1000):
+    """Recount posts.likes_count and comments.likes_count from the like rows.
+
+    Repairs deltas lost when a process died before ``backend.counters`` flushed
+    them. Safe to run from any process while the app is serving: the recount
+    bumps each row's likes_epoch, so deltas still buffered elsewhere for likes
+    it already counted are dropped at their flush instead of counted twice.
+    Returns ``{'posts': rows_recounted, 'comments': rows_recounted}``.
+    """
+    post_likes.flush()
+    comment_likes.flush()
+    return {
+        'posts': _reconcile(conn, post_likes, RECOUNT_POST_LIKES, batch_size),
+        'comments': _reconcile(conn, comment_likes, RECOUNT_COMMENT_LIKES, batch_size),
+    }
+
+def reconcile_unread_counts(conn, batch_size=1000):
+    """Recount unread messages per conversation from the read watermarks, then
+    user_counters from the conversations and unread notifications.
+
+    Returns the number of user_counters rows affected.
+    """
+    changed = 0
+    with conn.cursor() as cursor:
+        batches = list(id_batches(cursor, 'users', batch_size))
+        for first_id, last_id in batches:
+            cursor.execute(RECOUNT_CONVERSATION_UNREAD, {'first_id': first_id, 'last_id': last_id})
+        for first_id, last_id in batches:
+            cursor.execute(RECOUNT_UNREAD, {'first_id': first_id, 'last_id': last_id})
+            changed += cursor.rowcount
+    return changed
+
+def reconcile_follow_counts(conn, batch_size=1000):
+    """Recount users.follower_count / following_count from follows.
+
+    Returns the number of users whose counts changed.
+    """
+    changed = 0
+    with conn.cursor() as cursor:
+        for first_id, last_id in list(id_batches(cursor, 'users', batch_size)):
+            cursor.execute(RECOUNT_FOLLOWS, {'first_id': first_id, 'last_id': last_id})
+            changed += cursor.rowcount
+    return changed
+
+def _ensure_variants(path):
+    """Existing thumbnails of ``path``, creating them first if there are none."""
+    variants = list_variants(path)
+    if variants or not os.path.exists(path):
+        return variants
+    try:
+        with Image.open(path) as img:
+            return make_variants(img, path)
+    except Exception as e:
+        print(f"Warning: Failed to create variants of {path}: {e}")
+        return []
+
+def backfill_image_variants(conn, batch_size=1000):
+    """Create thumbnails for post images and avatars uploaded before variants existed.
+
+    Returns ``{'post_images': images_backfilled, 'avatars': avatars_backfilled}``.
+    """
+    result = {'post_images': 0, 'avatars': 0}
+    with conn.cursor() as cursor:
+        for first_id, last_id in list(id_batches(cursor, 'post_images', batch_size)):
+            cursor.execute("SELECT image_url FROM post_images WHERE id BETWEEN %s AND %s", (first_id, last_id))
+            for image in cursor.fetchall():
+                if not list_variants(image['image_url']) and _ensure_variants(image['image_url']):
+                    result['post_images'] += 1
+
+        for first_id, last_id in list(id_batches(cursor, 'users', batch_size)):
+            cursor.execute(
+                "SELECT avatar_url FROM users WHERE id BETWEEN %s AND %s AND avatar_url IS NOT NULL",
+                (first_id, last_id)
+            )
+            for user in cursor.fetchall():
+                if not list_variants(user['avatar_url']) and _ensure_variants(user['avatar_url']):
+                    result['avatars'] += 1
+    return result
+
+# Social graphs only read the last few seconds of follow_events; a day is kept
+# for debugging
+FOLLOW_EVENTS_RETENTION_HOURS = int(os.getenv('FOLLOW_EVENTS_RETENTION_HOURS', 24))
+
+def prune_follow_events(conn, batch_size=1000):
+    """Delete follow_events older than the retention, ``batch_size`` rows per statement.
+
+    Returns the number of rows deleted.
+    """
+    deleted = 0
+    with conn.cursor() as cursor:
+        while True:
+            cursor.execute(
+                "DELETE FROM follow_events WHERE created_at < NOW() - INTERVAL %s HOUR ORDER BY id LIMIT %s",
+                (FOLLOW_EVENTS_RETENTION_HOURS, batch_size)
+            )
+            deleted += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                return deleted
+
+def run_job(conn, job, batch_size):
+    if job == 'reconcile-likes':
+        result = reconcile_like_counts(conn, batch_size)
+        print(f"Recounted likes: {result['posts']} post(s), {result['comments']} comment(s).")
+    elif job == 'reconcile-unread':
+        changed = reconcile_unread_counts(conn, batch_size)
+        print(f"Recounted unread counters: {changed} row(s) affected.")
+    elif job == 'reconcile-follows':
+        changed = reconcile_follow_counts(conn, batch_size)
+        print(f"Recounted follow counts: {changed} user(s) changed.")
+    elif job == 'backfill-image-variants':
+        result = backfill_image_variants(conn, batch_size)
+        print(f"Backfilled variants: {result['post_images']} post image(s), {result['avatars']} avatar(s).")
+    elif job == 'prune-follow-events':
+        deleted = prune_follow_events(conn, batch_size)
+        print(f"Pruned follow events: {deleted} row(s) deleted.")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run data repair jobs.")
+    parser.add_argument('job', choices=['reconcile-likes', 'reconcile-unread', 'reconcile-follows',
+                                            'backfill-image-variants', 'prune-follow-events'])
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--every', type=float, metavar='SECONDS',
+                        help='keep running, repeating the job every SECONDS')
+    args = parser.parse_args(argv)
+
+    conn = db.get_connection()
+    if not conn:
+        print("Failed to connect to database")
+        return 1
+    try:
+        run_job(conn, args.job, args.batch_size)
+        while args.every:
+            time.sleep(args.every)
+            run_job(conn, args.job, args.batch_size)
+        return 0
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,54 @@
-from .database import db
+from .auth_service import AuthService
+from .database import db, fetch_batch
+from .notifications import summarize
+from .pubsub import hub
+from .unread import bump_unread, recount_unread_notifications, unread_totals
+from .pagination import decode_cursor, encode_cursor, keyset_after, keyset_params, keyset_state
 from typing import List, Dict, Any
 
+def conversation_pair(user_a: int, user_b: int):
+    """Canonical (user_low, user_high) key of the conversation between two users."""
+    return (user_a, user_b) if user_a < user_b else (user_b, user_a)
+
+def conversation_key(user_a: int, user_b: int):
+    """``messages.conversation_key`` of the pair: identical in both directions."""
+    user_low, user_high = conversation_pair(user_a, user_b)
+    return (user_low << 32) | user_high
+
+def unread_column(user_id: int, other_user_id: int):
+    """Column of ``conversations`` holding ``user_id``'s unread count."""
+    return 'unread_low' if user_id < other_user_id else 'unread_high'
+
+def read_column(user_id: int, other_user_id: int):
+    """Column of ``conversations`` holding ``user_id``'s read watermark (last read message id)."""
+    return 'read_low' if user_id < other_user_id else 'read_high'
+
+# Keeps the pair's summary row current; the receiver's side gets one more unread.
+# Sends in one conversation can commit out of order, so the summary only moves
+# forward: last_time follows only a newer message id. MySQL applies the
+# assignments left to right, so last_time must be compared before last_message_id
+# is updated.
+TOUCH_CONVERSATION_SQL = """
+    INSERT INTO conversations (user_low, user_high, last_message_id, last_time, unread_low, unread_high)
+    VALUES (%s, %s, %s, CURRENT_TIMESTAMP, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        last_time = IF(VALUES(last_message_id) > last_message_id, VALUES(last_time), last_time),
+        last_message_id = GREATEST(last_message_id, VALUES(last_message_id)),
+        unread_low = unread_low + VALUES(unread_low),
+        unread_high = unread_high + VALUES(unread_high)
+"""
+
+NOTIFICATIONS_SQL = """
+    SELECT n.*,
+           u.nickname as sender_name, u.avatar_url as sender_avatar,
+           p.title as post_title, p.image_url as post_image
+    FROM notifications n
+    JOIN users u ON n.sender_id = u.id
+    LEFT JOIN posts p ON n.target_id = p.id
+    WHERE n.receiver_id = %s
+    ORDER BY n.created_at DESC
+"""
+
 class MessageService:
     @staticmethod
     def send_message(sender_id: int, receiver_id: int, content: str):
@@ -13,209 +61,323 @@ class MessageService:
         if sender_id == receiver_id:
             return False, "不能给自己发消息"
         
-        conn = db.get_connection()
-        if not conn:
-            return False, "Database connection failed"
-
-        try:
-            with conn.cursor() as cursor:
-                # Check if receiver exists
-                check_sql = "SELECT id FROM users WHERE id = %s"
-                cursor.execute(check_sql, (receiver_id,))
-                if not cursor.fetchone():
-                    return False, "接收者不存在"
-
-                sql = """
-                    INSERT INTO messages (sender_id, receiver_id, content) 
-                    VALUES (%s, %s, %s)
-                """
-                cursor.execute(sql, (sender_id, receiver_id, content.strip()))
-            return True, "Message sent successfully"
-        except Exception as e:
-            return False, "Failed to send message"
+        # Check if receiver exists (users cache / request loader)
+        if not AuthService.get_user_by_id(receiver_id):
+            return False, "接收者不存在"
+
+        with db.connection() as conn:
+            if not conn:
+                return False, "Database connection failed"
+
+            try:
+                with conn.cursor() as cursor:
+                    # The message and its conversation summary are written together
+                    conn.begin()
+                    sql = """
+                        INSERT INTO messages (sender_id, receiver_id, content, conversation_key) 
+                        VALUES (%s, %s, %s, %s)
+                    """
+                    cursor.execute(sql, (sender_id, receiver_id, content.strip(),
+                                         conversation_key(sender_id, receiver_id)))
+                    message_id = cursor.lastrowid
+                    user_low, user_high = conversation_pair(sender_id, receiver_id)
+                    cursor.execute(TOUCH_CONVERSATION_SQL, (
+                        user_low, user_high, message_id,
+                        int(receiver_id == user_low), int(receiver_id == user_high)
+                    ))
+                    bump_unread(cursor, receiver_id, messages=1)
+                    conn.commit()
+                    total = unread_totals(cursor, [receiver_id])[receiver_id]
+                message = {
+                    'id': message_id, 'sender_id': sender_id,
+                    'receiver_id': receiver_id, 'content': content.strip(),
+                }
+                # Push to the receiver and to the sender's other open clients
+                hub.publish(receiver_id, 'message', message)
+                hub.publish(sender_id, 'message', message)
+                hub.publish(receiver_id, 'unread', {'source': 'messages', 'delta': 1, 'total': total})
+                return True, "Message sent successfully"
+            except Exception as e:
+                conn.rollback()
+                return False, "Failed to send message"
 
     @staticmethod
     def get_conversation(user1_id: int, user2_id: int, limit: int = 50, offset: int = 0):
         """Get messages between two users."""
-        conn = db.get_connection()
-        if not conn:
+        result = MessageService._load_conversation(user1_id, user2_id, limit, offset=offset)
+        if result is None:
             return []
+        messages, users = result
+        for message in messages:
+            sender, receiver = users.get(message['sender_id'], {}), users.get(message['receiver_id'], {})
+            message.update({
+                'sender_name': sender.get('nickname'), 'sender_avatar': sender.get('avatar_url'),
+                'receiver_name': receiver.get('nickname'), 'receiver_avatar': receiver.get('avatar_url'),
+            })
+        return messages
 
-        try:
-            with conn.cursor() as cursor:
-                sql = """
-                    SELECT m.*, 
-                           s.nickname as sender_name, s.avatar_url as sender_avatar,
-                           r.nickname as receiver_name, r.avatar_url as receiver_avatar
-                    FROM messages m
-                    JOIN users s ON m.sender_id = s.id
-                    JOIN users r ON m.receiver_id = r.id
-                    WHERE (m.sender_id = %s AND m.receiver_id = %s) 
-                       OR (m.sender_id = %s AND m.receiver_id = %s)
-                    ORDER BY m.created_at DESC
-                    LIMIT %s OFFSET %s
-                """
-                cursor.execute(sql, (user1_id, user2_id, user2_id, user1_id, limit, offset))
-                messages = cursor.fetchall()
-                return messages[::-1] # Return in chronological order
-        except Exception as e:
-            print(f"Error fetching conversation: {e}")
-            return []
+    @staticmethod
+    def get_conversation_page(user1_id: int, user2_id: int, limit: int = 50,
+                              before_id: int = None, after_id: int = None):
+        """Get one page of the messages between two users, by message id.
+
+        Without ids returns the latest ``limit`` messages; ``before_id`` scrolls
+        back through older messages and ``after_id`` fetches newer ones.
+        Returns ``{'messages': [...], 'users': {id: profile}, 'has_more': bool}``
+        with messages in chronological order and each profile listed once.
+        """
+        if before_id is not None and after_id is not None:
+            raise ValueError("before_id and after_id are mutually exclusive")
+        result = MessageService._load_conversation(user1_id, user2_id, limit + 1, before_id, after_id)
+        if result is None:
+            return {'messages': [], 'users': {}, 'has_more': False}
+        messages, users = result
+        has_more = len(messages) > limit
+        if has_more:
+            # The extra row is the one furthest from the anchor
+            messages = messages[:limit] if after_id is not None else messages[1:]
+        return {'messages': messages, 'users': users, 'has_more': has_more}
+
+    @staticmethod
+    def conversation_statements(user1_id, user2_id, limit, before_id=None, after_id=None, offset=0):
+        """Statements of ``_load_conversation``: messages, read watermarks, profiles."""
+        user_low, user_high = conversation_pair(user1_id, user2_id)
+        sql = "SELECT id, sender_id, receiver_id, content, created_at FROM messages WHERE conversation_key = %s"
+        params = [conversation_key(user1_id, user2_id)]
+        if after_id is not None:
+            sql += " AND id > %s ORDER BY id ASC LIMIT %s"
+            params.extend([after_id, limit])
+        else:
+            if before_id is not None:
+                sql += " AND id < %s"
+                params.append(before_id)
+            sql += " ORDER BY id DESC LIMIT %s OFFSET %s"
+            params.extend([limit, offset])
+        return [
+            (sql, tuple(params)),
+            ("SELECT read_low, read_high FROM conversations WHERE user_low = %s AND user_high = %s",
+             (user_low, user_high)),
+            ("SELECT id, nickname, avatar_url FROM users WHERE id IN (%s, %s)", (user_low, user_high)),
+        ]
+
+    @staticmethod
+    def _load_conversation(user1_id, user2_id, limit, before_id=None, after_id=None, offset=0):
+        """Messages of a pair in chronological order plus ``{user_id: profile}``.
+
+        One round trip: a range scan on (conversation_key, id), the pair's read
+        watermarks and both profiles. Returns None on error.
+        """
+        user_low, user_high = conversation_pair(user1_id, user2_id)
+        statements = MessageService.conversation_statements(user1_id, user2_id, limit, before_id, after_id, offset)
+
+        with db.connection(batch=True) as conn:
+            if not conn:
+                return None
+
+            try:
+                with conn.cursor() as cursor:
+                    messages, watermarks, users = fetch_batch(cursor, statements)
+            except Exception as e:
+                print(f"Error fetching conversation: {e}")
+                return None
+
+        read = {user_low: 0, user_high: 0}
+        if watermarks:
+            read = {user_low: watermarks[0]['read_low'], user_high: watermarks[0]['read_high']}
+        if after_id is None:
+            messages.reverse()
+        for message in messages:
+            # Read once the receiver's watermark has reached it
+            message['is_read'] = message['id'] <= read.get(message['receiver_id'], 0)
+        return messages, {user['id']: user for user in users}
 
     @staticmethod
     def get_conversations(user_id: int):
         """Get list of recent conversations for a user."""
-        conn = db.get_connection()
-        if not conn:
-            return []
+        return MessageService.get_conversations_page(user_id, limit=None)['conversations']
 
-        try:
-            with conn.cursor() as cursor:
-                # This query is a bit complex. It gets the latest message for each unique conversation partner.
-                # We need to group by the "other" user.
-                sql = """
-                    SELECT 
-                        CASE 
-                            WHEN sender_id = %s THEN receiver_id 
-                            ELSE sender_id 
-                        END as other_user_id,
-                        MAX(created_at) as last_msg_time
-                    FROM messages
-                    WHERE sender_id = %s OR receiver_id = %s
-                    GROUP BY other_user_id
-                    ORDER BY last_msg_time DESC
-                """
-                cursor.execute(sql, (user_id, user_id, user_id))
-                conversations = cursor.fetchall()
-                
-                # Now fetch details for each conversation
-                results = []
-                for conv in conversations:
-                    other_id = conv['other_user_id']
-                    
-                    # Get user info
-                    user_sql = "SELECT id, nickname, avatar_url FROM users WHERE id = %s"
-                    cursor.execute(user_sql, (other_id,))
-                    other_user = cursor.fetchone()
-                    
-                    # Get last message content and unread count
-                    msg_sql = """
-                        SELECT content, is_read, sender_id 
-                        FROM messages 
-                        WHERE (sender_id = %s AND receiver_id = %s) 
-                           OR (sender_id = %s AND receiver_id = %s)
-                        ORDER BY created_at DESC LIMIT 1
-                    """
-                    cursor.execute(msg_sql, (user_id, other_id, other_id, user_id))
-                    last_msg = cursor.fetchone()
-                    
-                    unread_sql = """
-                        SELECT COUNT(*) as count 
-                        FROM messages 
-                        WHERE sender_id = %s AND receiver_id = %s AND is_read = FALSE
-                    """
-                    cursor.execute(unread_sql, (other_id, user_id))
-                    unread = cursor.fetchone()
-                    
-                    if other_user and last_msg:
-                        results.append({
-                            "user": other_user,
-                            "last_message": last_msg,
-                            "unread_count": unread['count'],
-                            "timestamp": conv['last_msg_time']
-                        })
-                return results
-        except Exception as e:
-            print(f"Error fetching conversations: {e}")
-            return []
+    @staticmethod
+    def conversations_page_query(user_id, state, limit):
+        """SQL and params of one page of ``get_conversations_page`` after cursor ``state``."""
+        sides = []
+        params = []
+        for self_column, other_column in (('user_low', 'user_high'), ('user_high', 'user_low')):
+            unread, self_read, other_read = (
+                ('unread_low', 'read_low', 'read_high') if self_column == 'user_low'
+                else ('unread_high', 'read_high', 'read_low')
+            )
+            parts = [f"""
+                SELECT {other_column} AS other_user_id, last_message_id, last_time, {unread} AS unread_count,
+                       {self_read} AS self_read, {other_read} AS other_read
+                FROM conversations WHERE {self_column} = %s
+            """]
+            params.append(user_id)
+            if state:
+                parts.append(keyset_after('last_time', other_column))
+                params.extend(keyset_params(state))
+            parts.append(f"ORDER BY last_time DESC, {other_column} DESC")
+            if limit is not None:
+                parts.append("LIMIT %s")
+                params.append(limit)
+            sides.append("(" + " ".join(parts) + ")")
+
+        sql = f"""
+            SELECT c.other_user_id, c.last_time, c.unread_count,
+                   u.nickname, u.avatar_url, m.content, m.sender_id,
+                   c.last_message_id <= IF(m.sender_id = c.other_user_id, c.self_read, c.other_read) AS is_read
+            FROM ({" UNION ALL ".join(sides)}) c
+            JOIN users u ON u.id = c.other_user_id
+            JOIN messages m ON m.id = c.last_message_id
+            ORDER BY c.last_time DESC, c.other_user_id DESC
+        """
+        if limit is not None:
+            sql += " LIMIT %s"
+            params.append(limit)
+        return sql, tuple(params)
+
+    @staticmethod
+    def get_conversations_page(user_id: int, limit: int = 20, cursor: str = None):
+        """Get one page of a user's conversations, most recent first.
+
+        Reads the ``conversations`` summaries in one query: the user can be
+        either side of a pair, so each side is an index range scan on
+        (user_x, last_time) and the two are merged. Returns
+        ``{'conversations': [...], 'next_cursor': str or None}``.
+        Raises ValueError for a malformed cursor.
+        """
+        state = decode_cursor(cursor) if cursor else {}
+        sql, params = MessageService.conversations_page_query(user_id, state, limit)
+
+        with db.connection() as conn:
+            if not conn:
+                return {'conversations': [], 'next_cursor': None}
+
+            try:
+                with conn.cursor() as db_cursor:
+                    db_cursor.execute(sql, params)
+                    rows = db_cursor.fetchall()
+            except Exception as e:
+                print(f"Error fetching conversations: {e}")
+                return {'conversations': [], 'next_cursor': None}
+
+        conversations = [{
+            "user": {"id": row['other_user_id'], "nickname": row['nickname'], "avatar_url": row['avatar_url']},
+            "last_message": {"content": row['content'], "is_read": bool(row['is_read']), "sender_id": row['sender_id']},
+            "unread_count": row['unread_count'],
+            "timestamp": row['last_time'],
+        } for row in rows]
+        next_cursor = None
+        if limit is not None and rows and len(rows) == limit:
+            next_cursor = encode_cursor(keyset_state(rows[-1]['last_time'], rows[-1]['other_user_id']))
+        return {'conversations': conversations, 'next_cursor': next_cursor}
 
     @staticmethod
     def mark_messages_read(user_id: int, sender_id: int):
-        """Mark all messages from sender_id to user_id as read."""
-        conn = db.get_connection()
-        if not conn:
-            return False
-
-        try:
-            with conn.cursor() as cursor:
-                sql = """
-                    UPDATE messages 
-                    SET is_read = TRUE 
-                    WHERE sender_id = %s AND receiver_id = %s AND is_read = FALSE
-                """
-                cursor.execute(sql, (sender_id, user_id))
-            return True
-        except Exception as e:
-            print(f"Error marking messages read: {e}")
-            return False
+        """Mark all messages from sender_id to user_id as read.
+
+        Moves ``user_id``'s read watermark on the conversation to its last
+        message: one row is written however many messages were unread.
+        """
+        user_low, user_high = conversation_pair(user_id, sender_id)
+        unread, read = unread_column(user_id, sender_id), read_column(user_id, sender_id)
+        with db.connection() as conn:
+            if not conn:
+                return False
+
+            try:
+                with conn.cursor() as cursor:
+                    conn.begin()
+                    cursor.execute(
+                        f"SELECT last_message_id, {unread} AS unread_count, {read} AS last_read "
+                        "FROM conversations WHERE user_low = %s AND user_high = %s FOR UPDATE",
+                        (user_low, user_high)
+                    )
+                    row = cursor.fetchone()
+                    if not row or row['last_read'] >= row['last_message_id']:
+                        conn.commit()
+                        return True
+                    marked = row['unread_count']
+                    cursor.execute(
+                        f"UPDATE conversations SET {read} = last_message_id, {unread} = 0 "
+                        "WHERE user_low = %s AND user_high = %s",
+                        (user_low, user_high)
+                    )
+                    if marked:
+                        bump_unread(cursor, user_id, messages=-marked)
+                    conn.commit()
+                    if marked:
+                        total = unread_totals(cursor, [user_id])[user_id]
+                        hub.publish(user_id, 'unread', {'source': 'messages', 'delta': -marked, 'total': total})
+                hub.publish(sender_id, 'read', {'reader_id': user_id, 'last_read_message_id': row['last_message_id']})
+                return True
+            except Exception as e:
+                conn.rollback()
+                print(f"Error marking messages read: {e}")
+                return False
 
     @staticmethod
     def get_total_unread_count(user_id: int):
-        """Get total count of unread messages and notifications for a user."""
-        conn = db.get_connection()
-        if not conn:
-            return 0
-
-        try:
-            with conn.cursor() as cursor:
-                # Count unread messages
-                msg_sql = "SELECT COUNT(*) as count FROM messages WHERE receiver_id = %s AND is_read = FALSE"
-                cursor.execute(msg_sql, (user_id,))
-                msg_result = cursor.fetchone()
-                msg_count = msg_result['count'] if msg_result else 0
-
-                # Count unread notifications
-                notify_sql = "SELECT COUNT(*) as count FROM notifications WHERE receiver_id = %s AND is_read = FALSE"
-                cursor.execute(notify_sql, (user_id,))
-                notify_result = cursor.fetchone()
-                notify_count = notify_result['count'] if notify_result else 0
-
-                return msg_count + notify_count
-        except Exception as e:
-            print(f"Error getting unread count: {e}")
-            return 0
+        """Get total count of unread messages and notifications for a user.
+
+        Answered from the user's ``user_counters`` row (backend/unread.py).
+        """
+        with db.connection() as conn:
+            if not conn:
+                return 0
+
+            try:
+                with conn.cursor() as cursor:
+                    return unread_totals(cursor, [user_id])[user_id]
+            except Exception as e:
+                print(f"Error getting unread count: {e}")
+                return 0
 
     @staticmethod
     def get_notifications(user_id: int):
         """Get notifications for a user."""
-        conn = db.get_connection()
-        if not conn:
-            return []
+        with db.connection() as conn:
+            if not conn:
+                return []
 
-        try:
-            with conn.cursor() as cursor:
-                sql = """
-                    SELECT n.*, 
-                           u.nickname as sender_name, u.avatar_url as sender_avatar,
-                           p.title as post_title, p.image_url as post_image
-                    FROM notifications n
-                    JOIN users u ON n.sender_id = u.id
-                    LEFT JOIN posts p ON n.target_id = p.id
-                    WHERE n.receiver_id = %s
-                    ORDER BY n.created_at DESC
-                """
-                cursor.execute(sql, (user_id,))
-                notifications = cursor.fetchall()
-                return notifications
-        except Exception as e:
-            print(f"Error fetching notifications: {e}")
-            return []
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(NOTIFICATIONS_SQL, (user_id,))
+                    notifications = cursor.fetchall()
+                    for notification in notifications:
+                        notification['summary'] = summarize(notification)
+                    return notifications
+            except Exception as e:
+                print(f"Error fetching notifications: {e}")
+                return []
 
     @staticmethod
     def mark_notifications_read(user_id: int):
         """Mark all notifications as read."""
-        conn = db.get_connection()
-        if not conn:
-            return False
-
-        try:
-            with conn.cursor() as cursor:
-                sql = "UPDATE notifications SET is_read = TRUE WHERE receiver_id = %s"
-                cursor.execute(sql, (user_id,))
-            return True
-        except Exception as e:
-            print(f"Error marking notifications read: {e}")
-            return False
+        with db.connection() as conn:
+            if not conn:
+                return False
+
+            try:
+                with conn.cursor() as cursor:
+                    # The rows and the counter change together. The counter is
+                    # recounted rather than zeroed, so a notification the worker
+                    # commits in between is still counted.
+                    conn.begin()
+                    # Clearing group_key closes the burst: later events start a new notification
+                    sql = "UPDATE notifications SET is_read = TRUE, group_key = NULL WHERE receiver_id = %s AND is_read = FALSE"
+                    cursor.execute(sql, (user_id,))
+                    marked = cursor.rowcount
+                    if marked:
+                        recount_unread_notifications(cursor, [user_id])
+                    conn.commit()
+                    if marked:
+                        total = unread_totals(cursor, [user_id])[user_id]
+                        hub.publish(user_id, 'unread', {'source': 'notifications', 'delta': -marked, 'total': total})
+                return True
+            except Exception as e:
+                conn.rollback()
+                print(f"Error marking notifications read: {e}")
+                return False
 
 
 
@@ -0,0 +1,273 @@
+"""
+数据库迁移
+按编号顺序执行 migrations/ 目录下的 SQL 文件，并在 schema_migrations 表中记录已执行的版本和校验和。
+已执行的迁移文件被修改时拒绝执行，需要改动请新增一个迁移。
+
+用法:
+    python -m backend.migrations            # 执行未应用的迁移
+    python -m backend.migrations --status   # 查看迁移状态
+    python -m backend.migrations --verify   # EXPLAIN 热点查询，出现全表扫描则失败
+"""
+import argparse
+import hashlib
+import os
+import re
+import sys
+import pymysql
+from .auth_service import USERS_BY_IDS_SQL
+from .database import db
+from .feed import recommend_range_query
+from .maintenance import id_batches
+from .message_service import NOTIFICATIONS_SQL, MessageService
+from .post_service import COMMENTS_SQL, DETAIL_IMAGES_SQL, DETAIL_POST_SQL, DETAIL_STATE_SQL, PostService
+from .search_service import ranked_search_query
+from .unread import RECOUNT_NOTIFICATIONS_SQL, UNREAD_TOTALS_SQL
+from .user_service import MUTUALS_SQL, follow_list_query, follow_rows_query
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+MIGRATION_FILE_RE = re.compile(r'^(\d{4})_([\w-]+)\.sql$')
+
+# An UPDATE whose WHERE takes ``id BETWEEN %(first_id)s AND %(last_id)s`` is run once
+# per MIGRATION_BATCH_SIZE primary keys of its table, so a backfill of a large
+# table never locks or logs the whole table in one statement
+BATCHED_UPDATE_RE = re.compile(r'^UPDATE\s+(\w+)\b.*%\(first_id\)s.*%\(last_id\)s', re.IGNORECASE | re.DOTALL)
+MIGRATION_BATCH_SIZE = int(os.getenv('MIGRATION_BATCH_SIZE', 10000))
+
+# MySQL errors that mean a statement's effect is already in place. Tolerating them
+# lets a migration that failed half-way be re-run without manual cleanup.
+ALREADY_APPLIED_ERRORS = {
+    1050,  # ER_TABLE_EXISTS_ERROR
+    1060,  # ER_DUP_FIELDNAME
+    1061,  # ER_DUP_KEYNAME
+    1091,  # ER_CANT_DROP_FIELD_OR_KEY
+}
+
+CREATE_MIGRATIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        checksum CHAR(64) NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+# Queries issued on every feed/profile/inbox render, built by the same constants
+# and query builders the services execute so the two can't drift. Each must be
+# served by an index; ``verify()`` fails when EXPLAIN reports a full table scan.
+_NEXT_PAGE = {'c': '2024-01-01 00:00:00', 'i': 1000}
+
+HOT_QUERIES = [
+    ("PostService.get_posts_page (category)", *PostService.feed_page_query(None, '美食', {}, 20)),
+    ("PostService.get_posts_page (category, next page)",
+     *PostService.feed_page_query(None, '美食', _NEXT_PAGE, 20)),
+    ("PostService.get_posts_page (search)", *PostService.feed_page_query('穿搭', None, _NEXT_PAGE, 20)),
+    ("PostService.get_posts_page (recommend)", *recommend_range_query(0, 20, lower=0)),
+    ("PostService.get_posts_page (recommend, next page)",
+     *recommend_range_query(0, 20, lower=0, after=(10, 1000))),
+    ("SearchService.search_posts", *ranked_search_query('穿搭', 20, 0)),
+    ("PostService.get_post_detail (post)", DETAIL_POST_SQL, (1,)),
+    ("PostService.get_post_detail (images)", DETAIL_IMAGES_SQL, (1,)),
+    ("PostService.get_post_detail (viewer state)", DETAIL_STATE_SQL, (1, 1, 1)),
+    ("PostService.get_comments", COMMENTS_SQL, (1, 1)),
+    ("PostService.get_viewer_state", *PostService.viewer_state_query(1, [1, 2, 3])),
+    ("PostService.get_user_posts_page", *PostService.user_posts_query(1, False, _NEXT_PAGE, 20)),
+    ("PostService.get_user_liked_posts_page",
+     *PostService.interaction_posts_query('likes', 1, _NEXT_PAGE, 20)),
+    ("PostService.get_user_collected_posts_page",
+     *PostService.interaction_posts_query('collections', 1, _NEXT_PAGE, 20)),
+    ("AuthService.get_users_by_ids", USERS_BY_IDS_SQL.format(placeholders="%s, %s, %s"), (1, 2, 3)),
+    *[(f"MessageService.get_conversation ({part})", sql, params) for part, (sql, params) in zip(
+        ('messages', 'read watermarks', 'profiles'),
+        MessageService.conversation_statements(1, 2, 51, before_id=1000)
+    )],
+    ("MessageService.get_conversations_page", *MessageService.conversations_page_query(1, _NEXT_PAGE, 20)),
+    ("MessageService.get_notifications", NOTIFICATIONS_SQL, (1,)),
+    ("unread.unread_totals", UNREAD_TOTALS_SQL.format(placeholders="%s"), (1,)),
+    ("unread.recount_unread_notifications", RECOUNT_NOTIFICATIONS_SQL.format(placeholders="%s"), (1,)),
+    ("UserService.get_followers_page", *follow_list_query('followers', 1, 2, _NEXT_PAGE, 20)),
+    ("UserService.get_following_page", *follow_list_query('following', 1, 2, _NEXT_PAGE, 20)),
+    ("UserService.get_followers_page (social graph)", *follow_rows_query('followers', [1, 2, 3])),
+    ("UserService.get_mutual_follows", MUTUALS_SQL, (1,)),
+]
+
+def split_sql(script):
+    """Split a SQL script into statements on ``;``, ignoring ``;`` in quotes and comments."""
+    statements = []
+    current = []
+    quote = None
+    i = 0
+    while i < len(script):
+        ch = script[i]
+        if quote:
+            current.append(ch)
+            if ch == '\\' and i + 1 < len(script):
+                current.append(script[i + 1])
+                i += 1
+            elif ch == quote:
+                quote = None
+        elif ch in ("'", '"', '`'):
+            quote = ch
+            current.append(ch)
+        elif script.startswith('--', i) or ch == '#':
+            end = script.find('\n', i)
+            i = len(script) if end == -1 else end
+            continue
+        elif script.startswith('/*', i):
+            end = script.find('*/', i + 2)
+            i = len(script) if end == -1 else end + 2
+            continue
+        elif ch == ';':
+            statement = ''.join(current).strip()
+            if statement:
+                statements.append(statement)
+            current = []
+        else:
+            current.append(ch)
+        i += 1
+    statement = ''.join(current).strip()
+    if statement:
+        statements.append(statement)
+    return statements
+
+def discover_migrations(directory=MIGRATIONS_DIR):
+    """Return ``[(version, name, path), ...]`` sorted by version."""
+    migrations = []
+    seen = {}
+    for filename in sorted(os.listdir(directory)):
+        match = MIGRATION_FILE_RE.match(filename)
+        if not match:
+            continue
+        version = int(match.group(1))
+        if version in seen:
+            raise ValueError(f"Duplicate migration version {version}: {seen[version]} and {filename}")
+        seen[version] = filename
+        migrations.append((version, match.group(2), os.path.join(directory, filename)))
+    return sorted(migrations)
+
+def _checksum(script):
+    return hashlib.sha256(script.encode('utf-8')).hexdigest()
+
+def applied_versions(cursor):
+    """Map of applied version -> checksum."""
+    cursor.execute(CREATE_MIGRATIONS_TABLE)
+    cursor.execute("SELECT version, checksum FROM schema_migrations")
+    return {row['version']: row['checksum'] for row in cursor.fetchall()}
+
+def apply_baseline(conn, schema_path='schema.sql'):
+    """Create the base tables from schema.sql (idempotent, every table uses IF NOT EXISTS)."""
+    with open(schema_path, 'r', encoding='utf-8') as f:
+        statements = split_sql(f.read())
+    with conn.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+def _execute(cursor, statement, batch_size):
+    match = BATCHED_UPDATE_RE.match(statement)
+    if not match:
+        cursor.execute(statement)
+        return
+    for first_id, last_id in list(id_batches(cursor, match.group(1), batch_size)):
+        cursor.execute(statement, {'first_id': first_id, 'last_id': last_id})
+
+def migrate(conn, directory=MIGRATIONS_DIR, batch_size=MIGRATION_BATCH_SIZE):
+    """Apply pending migrations in version order. Returns the versions applied.
+
+    Raises ValueError, before applying anything, when a migration that was
+    already applied has been edited since.
+    """
+    applied = []
+    with conn.cursor() as cursor:
+        done = applied_versions(cursor)
+        migrations = []
+        modified = []
+        for version, name, path in discover_migrations(directory):
+            with open(path, 'r', encoding='utf-8') as f:
+                script = f.read()
+            if version not in done:
+                migrations.append((version, name, script))
+            elif done[version] != _checksum(script):
+                modified.append(f"{version:04d}_{name}")
+        if modified:
+            raise ValueError(f"Applied migrations were modified: {', '.join(modified)}; add a new migration instead")
+
+        for version, name, script in migrations:
+            print(f"Applying migration {version:04d}_{name}...")
+            for statement in split_sql(script):
+                try:
+                    _execute(cursor, statement, batch_size)
+                except pymysql.MySQLError as e:
+                    if e.args and e.args[0] in ALREADY_APPLIED_ERRORS:
+                        print(f"  Skipped (already applied): {e.args[1]}")
+                        continue
+                    raise
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s)",
+                (version, name, _checksum(script))
+            )
+            applied.append(version)
+    return applied
+
+def status(conn, directory=MIGRATIONS_DIR):
+    """Return ``[(version, name, state), ...]`` where state is applied, pending or modified."""
+    with conn.cursor() as cursor:
+        done = applied_versions(cursor)
+    result = []
+    for version, name, path in discover_migrations(directory):
+        if version not in done:
+            state = 'pending'
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                state = 'applied' if done[version] == _checksum(f.read()) else 'modified'
+        result.append((version, name, state))
+    return result
+
+def verify(conn, queries=HOT_QUERIES):
+    """EXPLAIN each hot query. Returns a list of ``(query_name, table)`` full scans."""
+    problems = []
+    with conn.cursor() as cursor:
+        for name, sql, params in queries:
+            cursor.execute("EXPLAIN " + sql, params)
+            for row in cursor.fetchall():
+                # The target of an INSERT ... SELECT and derived/union temporary
+                # tables are reported as ALL; the reads feeding them have their own rows
+                if row.get('select_type') == 'INSERT' or str(row.get('table') or '').startswith('<'):
+                    continue
+                if row.get('type') == 'ALL':
+                    problems.append((name, row.get('table')))
+    return problems
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply or verify database migrations.")
+    parser.add_argument('--status', action='store_true', help='show applied and pending migrations')
+    parser.add_argument('--verify', action='store_true', help='fail if a hot query does a full table scan')
+    args = parser.parse_args(argv)
+
+    conn = db.get_connection()
+    if not conn:
+        print("Failed to connect to database")
+        return 1
+    try:
+        if args.status:
+            for version, name, state in status(conn):
+                print(f"{version:04d}_{name}: {state}")
+            return 0
+        if args.verify:
+            problems = verify(conn)
+            for name, table in problems:
+                print(f"FULL SCAN: {name} on table {table}")
+            if problems:
+                return 1
+            print(f"All {len(HOT_QUERIES)} hot queries use an index.")
+            return 0
+        try:
+            applied = migrate(conn)
+        except ValueError as e:
+            print(e)
+            return 1
+        print(f"Applied {len(applied)} migration(s).")
+        return 0
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
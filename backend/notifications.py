@@ -0,0 +1,254 @@
+"""
+异步通知队列
+点赞、评论、关注等操作只把事件放进内存队列，由后台线程批量写入 notifications 表：
+
+- 同一批次中发给同一接收者、同一目标的事件合并为一条
+- 写入使用 ``INSERT ... ON DUPLICATE KEY UPDATE``，与该接收者尚未读的同组通知继续合并，
+  例如 "A 等 38 人赞了你的帖子"
+- 参与者记录在 notification_actors 表中，actor_count 由它统计：同一个人跨批次反复
+  点赞/取消点赞、关注/取关，只算一人
+- 通知是尽力而为的：队列满时丢弃新事件，写入失败只记录错误，都不会影响点赞等主操作
+- 队列深度、延迟等指标见 ``stats()`` / ``GET /api/system/notifications``
+"""
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from .database import db
+from .pubsub import hub
+from .unread import recount_unread_notifications, unread_totals
+
+# Event types and the text shown after the actor's name
+NOTIFICATION_TEXT = {
+    'like_post': "赞了你的帖子《{title}》",
+    'comment_post': "评论了你的帖子《{title}》",
+    'follow': "关注了你",
+}
+# Types whose target is a post, so the receiver is the post's author
+POST_TYPES = {'like_post', 'comment_post'}
+
+# actor_count is set from notification_actors right after (see _record_actors)
+UPSERT_SQL = """
+    INSERT INTO notifications (receiver_id, sender_id, type, target_id, content, actor_count, group_key)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        sender_id = VALUES(sender_id),
+        content = VALUES(content),
+        created_at = CURRENT_TIMESTAMP
+"""
+
+INSERT_ACTORS_SQL = "INSERT IGNORE INTO notification_actors (notification_id, actor_id) VALUES (%s, %s)"
+
+def group_key(notification_type, target_id):
+    """Key under which unread notifications of one burst are merged."""
+    return notification_type if target_id is None else f"{notification_type}:{target_id}"
+
+def summarize(notification):
+    """Display text of a notification row, e.g. ``A 等38人赞了你的帖子《x》``."""
+    name = notification.get('sender_name') or ''
+    count = notification.get('actor_count') or 1
+    actors = f"{name} 等{count}人" if count > 1 else name
+    return f"{actors}{notification.get('content') or ''}"
+
+class NotificationQueue:
+    """In-memory queue drained into the notifications table by a worker thread."""
+
+    def __init__(self, batch_size=200, flush_interval=0.5, max_size=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self._events = deque()  # (enqueued_at, type, sender_id, receiver_id, target_id)
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._enqueued = 0
+        self._written = 0
+        self._coalesced = 0
+        self._dropped = 0
+        self._failures = 0
+        self._last_lag_ms = 0.0
+        self._max_lag_ms = 0.0
+
+    def enqueue(self, notification_type, sender_id, target_id=None, receiver_id=None):
+        """Queue a notification. For post events the receiver is looked up from ``target_id``."""
+        if notification_type not in NOTIFICATION_TEXT:
+            raise ValueError(f"Unknown notification type: {notification_type}")
+        if receiver_id is not None and receiver_id == sender_id:
+            return False
+        with self._cond:
+            if len(self._events) >= self.max_size:
+                self._dropped += 1
+                return False
+            self._events.append((time.monotonic(), notification_type, sender_id, receiver_id, target_id))
+            self._enqueued += 1
+            self._cond.notify()
+        self._ensure_started()
+        return True
+
+    def flush(self):
+        """Write everything queued so far. Returns the number of rows upserted."""
+        written = 0
+        while True:
+            with self._cond:
+                batch = [self._events.popleft() for _ in range(min(self.batch_size, len(self._events)))]
+            if not batch:
+                return written
+            written += self._write(batch)
+
+    def _write(self, batch):
+        with self._write_lock:
+            try:
+                with db.connection() as conn:
+                    if not conn:
+                        raise RuntimeError("Database connection failed")
+                    with conn.cursor() as cursor:
+                        groups = self._coalesce(cursor, batch)
+                        rows = [row for row, _ in groups]
+                        totals = {}
+                        if rows:
+                            conn.begin()
+                            try:
+                                cursor.executemany(UPSERT_SQL, rows)
+                                rows = self._record_actors(cursor, groups)
+                                receivers = [row[0] for row in rows]
+                                recount_unread_notifications(cursor, receivers)
+                                totals = unread_totals(cursor, receivers)
+                                conn.commit()
+                            except Exception:
+                                conn.rollback()
+                                raise
+            except Exception as e:
+                self._failures += 1
+                print(f"Error writing notifications: {e}")
+                return 0
+            for receiver_id, sender_id, notification_type, target_id, content, actor_count, _ in rows:
+                hub.publish(receiver_id, 'notification', {
+                    'type': notification_type, 'sender_id': sender_id, 'target_id': target_id,
+                    'content': content, 'actor_count': actor_count,
+                })
+            for receiver_id, total in totals.items():
+                hub.publish(receiver_id, 'unread', {'source': 'notifications', 'total': total})
+            lag_ms = (time.monotonic() - batch[0][0]) * 1000
+            self._last_lag_ms = lag_ms
+            self._max_lag_ms = max(self._max_lag_ms, lag_ms)
+            self._written += len(rows)
+            self._coalesced += len(batch) - len(rows)
+            return len(rows)
+
+    def _record_actors(self, cursor, groups):
+        """Add each group's senders to notification_actors and set actor_count to the
+        distinct actors of the row. Returns the rows with their final actor_count."""
+        placeholders = ", ".join(["(%s, %s)"] * len(groups))
+        keys = [value for row, _ in groups for value in (row[0], row[6])]
+        cursor.execute(
+            f"SELECT id, receiver_id, group_key FROM notifications WHERE (receiver_id, group_key) IN ({placeholders})",
+            tuple(keys)
+        )
+        ids = {(row['receiver_id'], row['group_key']): row['id'] for row in cursor.fetchall()}
+        actors = [
+            (ids[(row[0], row[6])], sender_id)
+            for row, senders in groups if (row[0], row[6]) in ids
+            for sender_id in senders
+        ]
+        if not actors:
+            return [row for row, _ in groups]
+        cursor.executemany(INSERT_ACTORS_SQL, actors)
+
+        id_placeholders = ", ".join(["%s"] * len(ids))
+        cursor.execute(
+            f"SELECT notification_id, COUNT(*) AS actors FROM notification_actors "
+            f"WHERE notification_id IN ({id_placeholders}) GROUP BY notification_id",
+            tuple(ids.values())
+        )
+        counts = {row['notification_id']: row['actors'] for row in cursor.fetchall()}
+        cursor.executemany(
+            "UPDATE notifications SET actor_count = %s WHERE id = %s",
+            [(count, notification_id) for notification_id, count in counts.items()]
+        )
+        return [
+            (*row[:5], counts.get(ids.get((row[0], row[6])), row[5]), row[6])
+            for row, _ in groups
+        ]
+
+    def _coalesce(self, cursor, batch):
+        """Resolve receivers of post events and merge events per (receiver, group).
+
+        Returns ``[(upsert row, sender ids), ...]``.
+        """
+        post_ids = {event[4] for event in batch if event[1] in POST_TYPES}
+        posts = {}
+        if post_ids:
+            placeholders = ", ".join(["%s"] * len(post_ids))
+            cursor.execute(f"SELECT id, user_id, title FROM posts WHERE id IN ({placeholders})", tuple(post_ids))
+            posts = {row['id']: row for row in cursor.fetchall()}
+
+        groups = {}
+        for _, notification_type, sender_id, receiver_id, target_id in batch:
+            title = ''
+            if notification_type in POST_TYPES:
+                post = posts.get(target_id)
+                if not post:
+                    continue  # post deleted meanwhile
+                receiver_id, title = post['user_id'], post['title']
+            if receiver_id == sender_id:
+                continue
+            key = (receiver_id, group_key(notification_type, target_id))
+            group = groups.setdefault(key, {
+                'type': notification_type, 'target_id': target_id,
+                'content': NOTIFICATION_TEXT[notification_type].format(title=title),
+                'senders': [],
+            })
+            if sender_id in group['senders']:
+                group['senders'].remove(sender_id)
+            group['senders'].append(sender_id)  # most recent actor last
+
+        return [
+            ((receiver_id, group['senders'][-1], group['type'], group['target_id'],
+              group['content'], len(group['senders']), key), group['senders'])
+            for (receiver_id, key), group in groups.items()
+        ]
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._cond:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="notification-worker", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._events:
+                    self._cond.wait()
+            # Let a burst accumulate so it lands in one batch
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def stats(self):
+        with self._cond:
+            depth = len(self._events)
+            oldest_age_ms = (time.monotonic() - self._events[0][0]) * 1000 if depth else 0.0
+        return {
+            'depth': depth,
+            'oldest_age_ms': round(oldest_age_ms, 1),
+            'last_lag_ms': round(self._last_lag_ms, 1),
+            'max_lag_ms': round(self._max_lag_ms, 1),
+            'enqueued': self._enqueued,
+            'written': self._written,
+            'coalesced': self._coalesced,
+            'dropped': self._dropped,
+            'failures': self._failures,
+        }
+
+    def clear(self):
+        with self._cond:
+            self._events.clear()
+
+notification_queue = NotificationQueue(
+    batch_size=int(os.getenv('NOTIFICATION_BATCH_SIZE', 200)),
+    flush_interval=float(os.getenv('NOTIFICATION_FLUSH_INTERVAL', 0.5)),
+    max_size=int(os.getenv('NOTIFICATION_QUEUE_SIZE', 10000)),
+)
+
+atexit.register(notification_queue.flush)
@@ -0,0 +1,53 @@
+"""
+分页游标
+游标对客户端是不透明的字符串，内部是 URL 安全的 base64 编码 JSON。
+"""
+import base64
+import json
+
+def encode_cursor(state):
+    """Encode a pagination state dict as an opaque cursor string."""
+    raw = json.dumps(state, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by ``encode_cursor``. Raises ValueError if it is malformed."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError("无效的分页游标") from e
+    if not isinstance(state, dict):
+        raise ValueError("无效的分页游标")
+    return state
+
+def keyset_after(time_column, id_column):
+    """SQL fragment selecting rows that come after a cursor position in
+    ``ORDER BY time_column DESC, id_column DESC`` order."""
+    return f"AND ({time_column} < %s OR ({time_column} = %s AND {id_column} < %s))"
+
+def keyset_params(state):
+    """Parameters for the ``keyset_after`` fragment."""
+    return [state['c'], state['c'], int(state['i'])]
+
+def keyset_state(created_at, row_id):
+    """Cursor state for the position of one (created_at, id) row."""
+    if hasattr(created_at, 'isoformat'):
+        created_at = created_at.isoformat(sep=' ')
+    return {'c': created_at, 'i': row_id}
+
+def keyset_query(sql_parts, params, state, limit, time_column, id_column):
+    """Finish a newest-first query on (time_column, id_column) after the cursor ``state``.
+
+    ``sql_parts``/``params`` hold the SELECT and its filters; ``limit=None``
+    leaves the page unbounded. Returns ``(sql, params)``.
+    """
+    sql_parts, params = list(sql_parts), list(params)
+    if state:
+        sql_parts.append(keyset_after(time_column, id_column))
+        params.extend(keyset_params(state))
+    sql_parts.append(f"ORDER BY {time_column} DESC, {id_column} DESC")
+    if limit is not None:
+        sql_parts.append("LIMIT %s")
+        params.append(limit)
+    return " ".join(sql_parts), tuple(params)
@@ -0,0 +1,137 @@
+"""
+密码哈希
+bcrypt 是刻意设计得很慢的 CPU 密集运算（cost 12 约 250ms），放在专用进程池中执行。
+FastAPI 的登录、注册路由用 ``hash_async`` / ``verify_async`` 在事件循环上等待结果，
+哈希期间既不占用数据库线程池，也不占用数据库连接。
+
+- ``BCRYPT_ROUNDS`` 配置 cost；登录成功时发现旧哈希的 cost 不同会自动重新哈希
+- 进行中和排队的哈希共用 ``PASSWORD_WORKERS + PASSWORD_QUEUE_LIMIT`` 个名额（有界信号量），
+  名额用完时直接抛出 ``PasswordHasherBusy``（接口返回 503），登录风暴时快速失败而不是让所有请求一起排队
+- ``PASSWORD_WORKERS=0`` 时在调用线程中直接计算（Streamlit 等单用户场景）
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import bcrypt
+
+class PasswordHasherBusy(Exception):
+    """Too many password hashes are already queued."""
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+def _verify(password, password_hash):
+    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+def hash_rounds(password_hash):
+    """Cost factor of a ``$2b$12$...`` hash, or None if it cannot be parsed."""
+    try:
+        return int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+class PasswordHasher:
+    """Runs bcrypt on a bounded process pool; callers block until their hash is done."""
+
+    def __init__(self, rounds=12, workers=None, queue_limit=64):
+        self.rounds = rounds
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.queue_limit = queue_limit
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(self.workers, 1) + queue_limit)
+        self._executor = None
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._rehashed = 0
+
+    def hash(self, password):
+        return self._run(_hash, password, self.rounds)
+
+    def verify(self, password, password_hash):
+        return self._run(_verify, password, password_hash)
+
+    async def hash_async(self, password):
+        return await self._run_async(_hash, password, self.rounds)
+
+    async def verify_async(self, password, password_hash):
+        return await self._run_async(_verify, password, password_hash)
+
+    def needs_rehash(self, password_hash):
+        return hash_rounds(password_hash) != self.rounds
+
+    def record_rehash(self):
+        with self._lock:
+            self._rehashed += 1
+
+    def _acquire(self):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise PasswordHasherBusy("服务繁忙，请稍后再试")
+        with self._lock:
+            self._in_flight += 1
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+            self._completed += 1
+        self._slots.release()
+
+    def _run(self, func, *args):
+        """Blocks the calling thread until the hash is done (Streamlit, scripts)."""
+        self._acquire()
+        try:
+            if not self.workers:
+                return func(*args)
+            return self._get_executor().submit(func, *args).result()
+        finally:
+            self._release()
+
+    async def _run_async(self, func, *args):
+        """Awaits the hash without holding any thread of the caller's."""
+        self._acquire()
+        if not self.workers:
+            try:
+                return await asyncio.to_thread(func, *args)
+            finally:
+                self._release()
+        try:
+            future = self._get_executor().submit(func, *args)
+        except BaseException:
+            self._release()
+            raise
+        # The slot is held until the worker finishes, even if the request is cancelled meanwhile
+        future.add_done_callback(lambda _: self._release())
+        return await asyncio.wrap_future(future)
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def stats(self):
+        with self._lock:
+            return {
+                'rounds': self.rounds,
+                'workers': self.workers,
+                'queue_limit': self.queue_limit,
+                'in_flight': self._in_flight,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'rehashed': self._rehashed,
+            }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+password_hasher = PasswordHasher(
+    rounds=int(os.getenv('BCRYPT_ROUNDS', 12)),
+    workers=int(os.environ['PASSWORD_WORKERS']) if os.getenv('PASSWORD_WORKERS') else None,
+    queue_limit=int(os.getenv('PASSWORD_QUEUE_LIMIT', 64)),
+)
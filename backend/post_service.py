@@ -1,6 +1,173 @@
 import os
-from .database import db
-from .utils import save_image, save_video
+from .database import db, fetch_batch
+from .utils import list_variants, save_image, save_video, unique_ids
+from .feed import assign_shuffle_keys, fetch_recommend_page, new_feed_seed
+from .search_service import fulltext_filter
+from .pagination import decode_cursor, encode_cursor, keyset_query, keyset_state
+from .counters import comment_likes, post_likes
+from .notifications import notification_queue
+from .cache import MISSING, POST_DETAIL_NEGATIVE_TTL, feed_cache, invalidate_tags, post_detail_cache
+
+def _feed_tags(posts, search_query, category):
+    """Cache tags of a feed page: its filter plus every post and author on it."""
+    tags = {f"category:{category or '推荐'}"}
+    if search_query:
+        tags.add('search')
+    for post in posts:
+        tags.add(f"post:{post.get('id')}")
+        tags.add(f"user:{post.get('user_id')}")
+    return tags
+
+def _fresh_rows(posts, cached=True):
+    """Copies of feed rows with the like deltas they don't include merged in.
+
+    Cached rows also count the batch being flushed until the flush listener
+    folds it into them; rows just read from the database (``cached=False``)
+    already hold whatever the flush committed.
+    """
+    return post_likes.merge([dict(post) for post in posts], cached=cached)
+
+def _cache_feed_page(cache_key, value, posts, search_query, category, generation):
+    """Cache a feed page read from the database at like flush ``generation``.
+
+    A read that overlapped a flush may or may not include its deltas, while
+    the flush listener adds them to cached pages either way, so such a page
+    is not cached, or dropped again if a flush started while it was stored.
+    """
+    if generation % 2:
+        return
+    feed_cache.set(cache_key, value, tags=_feed_tags(posts, search_query, category))
+    if post_likes.generation() != generation:
+        feed_cache.invalidate(cache_key)
+
+def _fold_flushed_likes(deltas):
+    """Add flushed like deltas to the cached feed rows, which were read before the flush.
+
+    Without this a cached count would show the delta while it is pending, then
+    drop back once it is flushed, until the page expired.
+    """
+    for post_id, delta in deltas.items():
+        def bump(page, post_id=post_id, delta=delta):
+            for post in page['posts'] if isinstance(page, dict) else page:
+                if post.get('id') == post_id and post.get('likes_count') is not None:
+                    post['likes_count'] += delta
+        feed_cache.update_tagged(f"post:{post_id}", bump)
+
+post_likes.on_flush(_fold_flushed_likes)
+
+def interaction_statements(table, target_column, parent_table, user_id, target_id, present=None):
+    """Statements adding or removing the ``(user_id, target_id)`` row of likes /
+    collections / comment_likes, to send in one ``fetch_batch``.
+
+    ``present=None`` toggles: the INSERT only runs if the DELETE removed nothing.
+    Both work on the table's unique key and the last statement returns their
+    affected row counts (``removed``, ``added``), so double clicks and retries
+    can't drift the counters. Nothing is inserted if the ``parent_table`` row is gone.
+    """
+    statements = []
+    if present is True:
+        statements.append(("SET @removed = 0", ()))
+    else:
+        statements.append((f"DELETE FROM {table} WHERE user_id = %s AND {target_column} = %s", (user_id, target_id)))
+        statements.append(("SET @removed = ROW_COUNT()", ()))
+    if present is False:
+        statements.append(("SELECT @removed AS removed, 0 AS added", ()))
+        return statements
+    # Affected rows is 0 when the row already exists (FOUND_ROWS is not set)
+    statements.append((f"""
+        INSERT INTO {table} (user_id, {target_column})
+        SELECT %s, id FROM {parent_table} WHERE id = %s AND @removed = 0
+        ON DUPLICATE KEY UPDATE id = id
+    """, (user_id, target_id)))
+    statements.append(("SELECT @removed AS removed, ROW_COUNT() AS added", ()))
+    return statements
+
+def interaction_result(counts, present=None):
+    """``(present, changed)`` from the affected row counts ``interaction_statements`` returns."""
+    if present is not True and (counts['removed'] == 1 or present is False):
+        return False, counts['removed'] == 1
+    return True, counts['added'] == 1
+
+def _delete_files(paths):
+    """Remove uploaded files and the thumbnails next to them, skipping missing ones."""
+    paths = list(dict.fromkeys(path for path in paths if path))
+    paths += [v.path for path in paths for v in list_variants(path)]
+    for file_path in paths:
+        try:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+                print(f"Deleted file: {file_path}")
+        except Exception as e:
+            print(f"Warning: Failed to delete file {file_path}: {e}")
+            # Continue even if file deletion fails
+
+def invalidate_post_caches(post_id=None, category=None):
+    """Drop cached feed pages and details showing ``post_id`` or listing ``category``.
+
+    A category change also drops the recommend feed and search results, which
+    span every category.
+    """
+    if post_id is not None:
+        invalidate_tags(f"post:{post_id}")
+    if category is not None:
+        feed_cache.invalidate_tags(f"category:{category or '推荐'}", 'category:推荐', 'search')
+
+# Hot path SQL. backend.migrations --verify EXPLAINs these same statements, so
+# keep every query a page or detail load runs in a constant or query builder here.
+FEED_POSTS_SQL = """
+    SELECT p.*, u.nickname, u.avatar_url
+    FROM posts p
+    JOIN users u ON p.user_id = u.id
+    WHERE p.is_private = FALSE
+"""
+USER_POSTS_SQL = """
+    SELECT p.*, u.nickname, u.avatar_url
+    FROM posts p
+    JOIN users u ON p.user_id = u.id
+    WHERE p.user_id = %s
+"""
+# {table} is likes or collections
+INTERACTION_POSTS_SQL = """
+    SELECT p.*, u.nickname, u.avatar_url,
+           x.created_at AS interacted_at, x.id AS interaction_id
+    FROM posts p
+    JOIN {table} x ON p.id = x.post_id
+    JOIN users u ON p.user_id = u.id
+    WHERE x.user_id = %s AND p.is_private = FALSE
+"""
+VIEWER_STATE_SQL = """
+    SELECT post_id, 'is_liked' AS flag FROM likes
+    WHERE user_id = %s AND post_id IN ({placeholders})
+    UNION ALL
+    SELECT post_id, 'is_collected' AS flag FROM collections
+    WHERE user_id = %s AND post_id IN ({placeholders})
+"""
+
+# Statements of the batched detail load (see PostService.get_post_detail)
+DETAIL_POST_SQL = """
+    SELECT p.*, u.nickname, u.avatar_url
+    FROM posts p
+    JOIN users u ON p.user_id = u.id
+    WHERE p.id = %s
+"""
+DETAIL_IMAGES_SQL = "SELECT image_url FROM post_images WHERE post_id = %s ORDER BY sort_order ASC"
+# Mutable and per-viewer state; a NULL viewer matches no likes/collections
+DETAIL_STATE_SQL = """
+    SELECT p.likes_count,
+           EXISTS(SELECT 1 FROM likes WHERE user_id = %s AND post_id = p.id) AS is_liked,
+           EXISTS(SELECT 1 FROM collections WHERE user_id = %s AND post_id = p.id) AS is_collected
+    FROM posts p
+    WHERE p.id = %s
+"""
+COMMENTS_SQL = """
+    SELECT c.*, u.nickname, u.avatar_url,
+    CASE WHEN cl.id IS NOT NULL THEN 1 ELSE 0 END as is_liked
+    FROM comments c
+    JOIN users u ON c.user_id = u.id
+    LEFT JOIN comment_likes cl ON c.id = cl.comment_id AND cl.user_id = %s
+    WHERE c.post_id = %s
+    ORDER BY c.created_at ASC
+"""
 
 class PostService:
     @staticmethod
@@ -19,10 +186,8 @@ class PostService:
         if (not image_files or len(image_files) == 0) and not video_file:
             return False, "必须上传图片或视频"
         
-        conn = db.get_connection()
-        if not conn:
-            return False, "Database connection failed"
-
+        # Persist uploads before borrowing a pooled connection so slow file
+        # I/O doesn't keep a connection checked out
         try:
             # Save all images
             image_urls = []
@@ -40,298 +205,444 @@ class PostService:
                 video_url = save_video(video_file)
                 if not video_url:
                     return False, "Failed to save video"
-
-            # First image is the cover (required for both image posts and video posts)
-            if not image_urls:
-                 return False, "必须上传封面图片"
-
-            cover_image = image_urls[0]
-            
-            with conn.cursor() as cursor:
-                # Insert into posts
-                sql = "INSERT INTO posts (user_id, title, content, image_url, video_url, category, is_private) VALUES (%s, %s, %s, %s, %s, %s, FALSE)"
-                cursor.execute(sql, (user_id, title.strip(), content.strip() if content else None, cover_image, video_url, category))
-                post_id = cursor.lastrowid
-                
-                # Insert into post_images
-                if post_id and image_urls:
-                    image_values = [(post_id, url, idx) for idx, url in enumerate(image_urls)]
-                    cursor.executemany(
-                        "INSERT INTO post_images (post_id, image_url, sort_order) VALUES (%s, %s, %s)",
-                        image_values
-                    )
-                
-            return True, "Post created successfully"
         except ValueError as e:
             return False, str(e)  # 文件验证错误
         except Exception as e:
             print(f"Create post error: {e}")
             return False, "Failed to create post"
 
-    @staticmethod
-    def get_posts(limit=20, offset=0, search_query=None, category=None):
-        """Fetch posts with optional search and category filter."""
-        conn = db.get_connection()
-        if not conn:
-            return []
+        # First image is the cover (required for both image posts and video posts)
+        if not image_urls:
+             return False, "必须上传封面图片"
 
-        try:
-            with conn.cursor() as cursor:
-                # Only show public posts in feed
-                sql_parts = ["""
-                    SELECT p.*, u.nickname, u.avatar_url 
-                    FROM posts p 
-                    JOIN users u ON p.user_id = u.id 
-                    WHERE p.is_private = FALSE
-                """]
-                params = []
-                
-                if search_query:
-                    # Simple search logic
-                    sql_parts.append("AND (p.title LIKE %s OR p.content LIKE %s)")
-                    like_query = f"%{search_query}%"
-                    params.extend([like_query, like_query])
+        cover_image = image_urls[0]
+
+        with db.connection() as conn:
+            if not conn:
+                return False, "Database connection failed"
+
+            try:
+                with conn.cursor() as cursor:
+                    # Insert into posts
+                    sql = "INSERT INTO posts (user_id, title, content, image_url, video_url, category, is_private) VALUES (%s, %s, %s, %s, %s, %s, FALSE)"
+                    cursor.execute(sql, (user_id, title.strip(), content.strip() if content else None, cover_image, video_url, category))
+                    post_id = cursor.lastrowid
+
+                    # Give the post a position in the shuffled recommend feed
+                    if post_id:
+                        assign_shuffle_keys(cursor, post_id)
                 
-                if category and category != '推荐':
-                    sql_parts.append("AND p.category = %s")
-                    params.append(category)
-
-                # Randomize for 'Recommend' feed to ensure visibility for all posts
-                if (not category or category == '推荐') and not search_query:
-                    sql_parts.append("ORDER BY RAND() LIMIT %s OFFSET %s")
-                else:
-                    sql_parts.append("ORDER BY p.created_at DESC LIMIT %s OFFSET %s")
-                    
-                params.extend([limit, offset])
-
-                sql = " ".join(sql_parts)
-                cursor.execute(sql, tuple(params))
-                return cursor.fetchall()
-        except Exception as e:
-            print(f"Error fetching posts: {e}")
-            return []
+                    # Insert into post_images
+                    if post_id and image_urls:
+                        image_values = [(post_id, url, idx) for idx, url in enumerate(image_urls)]
+                        cursor.executemany(
+                            "INSERT INTO post_images (post_id, image_url, sort_order) VALUES (%s, %s, %s)",
+                            image_values
+                        )
+
+                invalidate_post_caches(post_id, category or '推荐')
+                return True, "Post created successfully"
+            except Exception as e:
+                print(f"Create post error: {e}")
+                return False, "Failed to create post"
+
+    @staticmethod
+    def _is_recommend_feed(search_query, category):
+        return (not category or category == '推荐') and not search_query
+
+    @staticmethod
+    def _filtered_posts_query(search_query, category):
+        """Base SELECT and params for the public feed filtered by search/category."""
+        # Only show public posts in feed
+        sql_parts = [FEED_POSTS_SQL]
+        params = []
+
+        if search_query:
+            # Full-text (ngram) match, LIKE only for terms too short for the index
+            condition, condition_params = fulltext_filter(search_query)
+            sql_parts.append(condition)
+            params.extend(condition_params)
+
+        if category and category != '推荐':
+            sql_parts.append("AND p.category = %s")
+            params.append(category)
+        return sql_parts, params
+
+    @staticmethod
+    def feed_page_query(search_query, category, state, limit):
+        """SQL and params of one search/category feed page after cursor ``state``."""
+        sql_parts, params = PostService._filtered_posts_query(search_query, category)
+        return keyset_query(sql_parts, params, state, limit, 'p.created_at', 'p.id')
+
+    @staticmethod
+    def user_posts_query(target_user_id, include_private, state, limit):
+        """SQL and params of one page of a user's posts; private ones only for the owner."""
+        sql_parts = [USER_POSTS_SQL]
+        if not include_private:
+            sql_parts.append("AND p.is_private = FALSE")
+        return keyset_query(sql_parts, [target_user_id], state, limit, 'p.created_at', 'p.id')
+
+    @staticmethod
+    def interaction_posts_query(table, user_id, state, limit):
+        """SQL and params of one page of the posts a user liked or collected."""
+        if table not in ('likes', 'collections'):
+            raise ValueError(f"Unsupported interaction table: {table}")
+        return keyset_query([INTERACTION_POSTS_SQL.format(table=table)], [user_id], state, limit,
+                            'x.created_at', 'x.id')
+
+    @staticmethod
+    def viewer_state_query(user_id, post_ids):
+        """SQL and params of the like/collect flags of ``user_id`` for ``post_ids``."""
+        placeholders = ", ".join(["%s"] * len(post_ids))
+        return VIEWER_STATE_SQL.format(placeholders=placeholders), (user_id, *post_ids, user_id, *post_ids)
+
+    @staticmethod
+    def get_posts(limit=20, offset=0, search_query=None, category=None, seed=None):
+        """Fetch posts with optional search and category filter.
+
+        The '推荐' feed is served from the shuffle buckets in ``backend.feed``:
+        pass the same ``seed`` to get a stable ordering across pages, or omit it
+        for a fresh random sample (which is never cached).
+        """
+        recommend = PostService._is_recommend_feed(search_query, category)
+        cacheable = seed is not None or not recommend
+        cache_key = ('posts', category or '推荐', search_query or '', offset, limit, seed)
+        if cacheable:
+            cached = feed_cache.get(cache_key, MISSING)
+            if cached is not MISSING:
+                return _fresh_rows(cached)
+
+        generation = post_likes.generation()
+        with db.connection() as conn:
+            if not conn:
+                return []
+
+            try:
+                with conn.cursor() as cursor:
+                    if recommend:
+                        state = {'seed': seed if seed is not None else new_feed_seed()}
+                        posts, _ = fetch_recommend_page(cursor, limit + offset, state)
+                        posts = posts[offset:]
+                    else:
+                        sql_parts, params = PostService._filtered_posts_query(search_query, category)
+                        sql_parts.append("ORDER BY p.created_at DESC LIMIT %s OFFSET %s")
+                        params.extend([limit, offset])
+
+                        sql = " ".join(sql_parts)
+                        cursor.execute(sql, tuple(params))
+                        posts = list(cursor.fetchall())
+            except Exception as e:
+                print(f"Error fetching posts: {e}")
+                return []
+
+        if cacheable:
+            _cache_feed_page(cache_key, posts, posts, search_query, category, generation)
+        return _fresh_rows(posts, cached=False)
+
+    @staticmethod
+    def _keyset_page(cursor, query, limit, time_key='created_at', id_key='id'):
+        """Run one page of a ``keyset_query`` and compute the state of the next one.
+
+        ``limit=None`` returns every remaining row. Returns ``(rows, next_state)``.
+        """
+        cursor.execute(*query)
+        rows = cursor.fetchall()
+        next_state = None
+        if limit is not None and rows and len(rows) == limit:
+            next_state = keyset_state(rows[-1][time_key], rows[-1][id_key])
+        return rows, next_state
+
+    @staticmethod
+    def get_posts_page(limit=20, cursor=None, search_query=None, category=None):
+        """Fetch one page of the feed using an opaque cursor.
+
+        The recommend feed pages through its shuffle bucket; search and category
+        results page newest-first on (created_at, id), so rows don't shift when
+        new posts arrive. Returns ``{'posts': [...], 'next_cursor': str or None}``.
+        Raises ValueError for a malformed cursor.
+
+        Pages are cached by (category, search, cursor, limit). A first recommend
+        page is cached too, so visitors within one TTL share its seed.
+        """
+        cache_key = ('page', category or '推荐', search_query or '', cursor or '', limit)
+        cached = feed_cache.get(cache_key, MISSING)
+        if cached is not MISSING:
+            return {'posts': _fresh_rows(cached['posts']), 'next_cursor': cached['next_cursor']}
+
+        state = decode_cursor(cursor) if cursor else {}
+        recommend = PostService._is_recommend_feed(search_query, category)
+        if recommend and 'seed' not in state:
+            state['seed'] = new_feed_seed()
+
+        generation = post_likes.generation()
+        with db.connection() as conn:
+            if not conn:
+                return {'posts': [], 'next_cursor': None}
+
+            try:
+                with conn.cursor() as db_cursor:
+                    if recommend:
+                        posts, next_state = fetch_recommend_page(db_cursor, limit, state)
+                    else:
+                        posts, next_state = PostService._keyset_page(
+                            db_cursor, PostService.feed_page_query(search_query, category, state, limit), limit
+                        )
+                    page = {
+                        'posts': list(posts),
+                        'next_cursor': encode_cursor(next_state) if next_state else None
+                    }
+            except Exception as e:
+                print(f"Error fetching posts page: {e}")
+                return {'posts': [], 'next_cursor': None}
+
+        _cache_feed_page(cache_key, page, page['posts'], search_query, category, generation)
+        return {'posts': _fresh_rows(page['posts'], cached=False), 'next_cursor': page['next_cursor']}
 
     @staticmethod
     def get_post_by_id(post_id, current_user_id=None):
         """Get a single post details, optionally with user interaction status."""
-        conn = db.get_connection()
-        if not conn:
-            print("Database connection failed")
+        return PostService.get_post_detail(post_id, current_user_id)
+
+    @staticmethod
+    def get_post_detail(post_id, current_user_id=None, include_comments=False):
+        """Load a post with its images, viewer flags and optionally its comments.
+
+        Everything is fetched in one batched round trip. The post body, images
+        and author are cached in ``post_detail_cache``; likes_count and the
+        viewer's is_liked / is_collected are read fresh on every call. Missing
+        posts are cached briefly so repeated lookups don't reach the database.
+        Returns None when the post doesn't exist or is private to someone else.
+        """
+        cached = post_detail_cache.get(post_id, MISSING)
+        if cached is None:
+            return None
+        if cached is not MISSING and not PostService._can_view(cached, current_user_id):
             return None
 
-        try:
-            with conn.cursor() as cursor:
-                sql = """
-                    SELECT p.*, u.nickname, u.avatar_url 
-                    FROM posts p 
-                    JOIN users u ON p.user_id = u.id 
-                    WHERE p.id = %s
-                """
-                cursor.execute(sql, (post_id,))
-                post = cursor.fetchone()
-                
-                # If post not found, return None
-                if not post:
-                    print(f"Post with id {post_id} not found")
-                    return None
-                
-                # Check privacy
-                if post['is_private'] and (not current_user_id or post['user_id'] != current_user_id):
-                    # If private and not owner, treat as not found or unauthorized
-                    # For now, return None to hide it
-                    print(f"Post {post_id} is private")
-                    return None
-                
-                # Get all images for this post
-                cursor.execute("SELECT image_url FROM post_images WHERE post_id = %s ORDER BY sort_order ASC", (post_id,))
-                images = [row['image_url'] for row in cursor.fetchall()]
-                
-                # If no images in post_images table (legacy posts), use the one from posts table
-                if not images and post['image_url']:
-                    images = [post['image_url']]
-                
-                post['images'] = images
-                
-                # Initialize interaction status
-                post['is_liked'] = False
-                post['is_collected'] = False
-                
-                # Check interaction status if user is logged in
-                if current_user_id:
-                    # Check if liked
-                    cursor.execute(
-                        "SELECT id FROM likes WHERE user_id = %s AND post_id = %s", 
-                        (current_user_id, post_id)
-                    )
-                    post['is_liked'] = bool(cursor.fetchone())
-                    
-                    # Check if collected
-                    cursor.execute(
-                        "SELECT id FROM collections WHERE user_id = %s AND post_id = %s", 
-                        (current_user_id, post_id)
-                    )
-                    post['is_collected'] = bool(cursor.fetchone())
-                    
-                return post
-        except Exception as e:
-            print(f"Error fetching post: {e}")
-            import traceback
-            traceback.print_exc()
+        statements = []
+        if cached is MISSING:
+            statements.append((DETAIL_POST_SQL, (post_id,)))
+            statements.append((DETAIL_IMAGES_SQL, (post_id,)))
+        statements.append((DETAIL_STATE_SQL, (current_user_id, current_user_id, post_id)))
+        if include_comments:
+            statements.append((COMMENTS_SQL, (current_user_id, post_id)))
+
+        with db.connection(batch=True) as conn:
+            if not conn:
+                print("Database connection failed")
+                return None
+
+            try:
+                with conn.cursor() as cursor:
+                    results = fetch_batch(cursor, statements)
+            except Exception as e:
+                print(f"Error fetching post: {e}")
+                return None
+
+        if cached is MISSING:
+            post_rows, image_rows = results.pop(0), results.pop(0)
+            if not post_rows:
+                print(f"Post with id {post_id} not found")
+                post_detail_cache.set(post_id, None, ttl=POST_DETAIL_NEGATIVE_TTL, tags={f"post:{post_id}"})
+                return None
+            cached = post_rows[0]
+            images = [row['image_url'] for row in image_rows]
+            # If no images in post_images table (legacy posts), use the one from posts table
+            if not images and cached['image_url']:
+                images = [cached['image_url']]
+            cached['images'] = images
+            post_detail_cache.set(post_id, cached, tags={f"post:{post_id}", f"user:{cached['user_id']}"})
+            if not PostService._can_view(cached, current_user_id):
+                return None
+
+        state_rows = results.pop(0)
+        if not state_rows:
+            # Deleted since the detail was cached
+            post_detail_cache.invalidate(post_id)
             return None
 
+        post = dict(cached)
+        post['images'] = list(cached['images'])
+        post['likes_count'] = state_rows[0]['likes_count'] + post_likes.pending(post_id)
+        post['is_liked'] = bool(state_rows[0]['is_liked'])
+        post['is_collected'] = bool(state_rows[0]['is_collected'])
+        if include_comments:
+            post['comments'] = comment_likes.merge(results.pop(0))
+        return post
+
+    @staticmethod
+    def get_viewer_state(user_id, post_ids):
+        """Like/collect flags of ``user_id`` for many posts in one query.
+
+        Returns ``{post_id: {'is_liked': bool, 'is_collected': bool}}`` with an
+        entry for every requested id. Served by the (user_id, post_id) unique keys
+        of likes and collections. Raises ValueError for too many ids.
+        """
+        post_ids = unique_ids(post_ids)
+        states = {pid: {'is_liked': False, 'is_collected': False} for pid in post_ids}
+        if not user_id or not post_ids:
+            return states
+
+        with db.connection() as conn:
+            if not conn:
+                return states
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(*PostService.viewer_state_query(user_id, post_ids))
+                    for row in cursor.fetchall():
+                        states[row['post_id']][row['flag']] = True
+            except Exception as e:
+                print(f"Error fetching viewer state: {e}")
+        return states
+
+    @staticmethod
+    def attach_viewer_state(posts, user_id):
+        """Merge ``is_liked`` / ``is_collected`` into a page of posts in place."""
+        states = PostService.get_viewer_state(user_id, [post['id'] for post in posts])
+        for post in posts:
+            post.update(states[post['id']])
+        return posts
+
+    @staticmethod
+    def _can_view(post, current_user_id):
+        """Private posts are only visible to their author."""
+        if post['is_private'] and (not current_user_id or post['user_id'] != current_user_id):
+            print(f"Post {post['id']} is private")
+            return False
+        return True
+
     @staticmethod
     def get_user_posts(target_user_id, current_user_id=None):
         """Get posts by a specific user."""
-        conn = db.get_connection()
-        if not conn:
-            return []
-        try:
-            with conn.cursor() as cursor:
-                sql = """
-                    SELECT p.*, u.nickname, u.avatar_url 
-                    FROM posts p
-                    JOIN users u ON p.user_id = u.id
-                    WHERE p.user_id = %s 
-                """
-                params = [target_user_id]
-                
-                # If not owner, only show public posts
-                if str(target_user_id) != str(current_user_id):
-                    sql += " AND p.is_private = FALSE"
-                
-                sql += " ORDER BY p.created_at DESC"
-                
-                cursor.execute(sql, tuple(params))
-                return cursor.fetchall()
-        except Exception as e:
-            print(f"Error fetching user posts: {e}")
-            return []
+        return PostService.get_user_posts_page(target_user_id, current_user_id, limit=None)['posts']
+
+    @staticmethod
+    def get_user_posts_page(target_user_id, current_user_id=None, limit=20, cursor=None):
+        """Get one page of a user's posts, newest first."""
+        state = decode_cursor(cursor) if cursor else {}
+        with db.connection() as conn:
+            if not conn:
+                return {'posts': [], 'next_cursor': None}
+            try:
+                with conn.cursor() as db_cursor:
+                    # If not owner, only show public posts
+                    is_owner = str(target_user_id) == str(current_user_id)
+                    posts, next_state = PostService._keyset_page(
+                        db_cursor, PostService.user_posts_query(target_user_id, is_owner, state, limit), limit
+                    )
+                    return {'posts': post_likes.merge(list(posts)), 'next_cursor': encode_cursor(next_state) if next_state else None}
+            except Exception as e:
+                print(f"Error fetching user posts: {e}")
+                return {'posts': [], 'next_cursor': None}
 
     @staticmethod
     def get_user_liked_posts(user_id):
         """Get posts liked by a specific user."""
-        conn = db.get_connection()
-        if not conn:
-            return []
-        try:
-            with conn.cursor() as cursor:
-                sql = """
-                    SELECT p.*, u.nickname, u.avatar_url 
-                    FROM posts p
-                    JOIN likes l ON p.id = l.post_id
-                    JOIN users u ON p.user_id = u.id
-                    WHERE l.user_id = %s AND p.is_private = FALSE
-                    ORDER BY l.created_at DESC
-                """
-                cursor.execute(sql, (user_id,))
-                return cursor.fetchall()
-        except Exception as e:
-            print(f"Error fetching liked posts: {e}")
-            return []
+        return PostService.get_user_liked_posts_page(user_id, limit=None)['posts']
+
+    @staticmethod
+    def get_user_liked_posts_page(user_id, limit=20, cursor=None):
+        """Get one page of posts liked by a user, most recently liked first."""
+        return PostService._interaction_posts_page('likes', user_id, limit, cursor)
 
     @staticmethod
     def get_user_collected_posts(user_id):
         """Get posts collected by a specific user."""
-        conn = db.get_connection()
-        if not conn:
-            return []
-        try:
-            with conn.cursor() as cursor:
-                sql = """
-                    SELECT p.*, u.nickname, u.avatar_url 
-                    FROM posts p
-                    JOIN collections c ON p.id = c.post_id
-                    JOIN users u ON p.user_id = u.id
-                    WHERE c.user_id = %s AND p.is_private = FALSE
-                    ORDER BY c.created_at DESC
-                """
-                cursor.execute(sql, (user_id,))
-                return cursor.fetchall()
-        except Exception as e:
-            print(f"Error fetching collected posts: {e}")
-            return []
+        return PostService.get_user_collected_posts_page(user_id, limit=None)['posts']
+
+    @staticmethod
+    def get_user_collected_posts_page(user_id, limit=20, cursor=None):
+        """Get one page of posts collected by a user, most recently collected first."""
+        return PostService._interaction_posts_page('collections', user_id, limit, cursor)
+
+    @staticmethod
+    def _interaction_posts_page(table, user_id, limit, cursor):
+        """Page through the public posts a user liked or collected ('likes' / 'collections')."""
+        state = decode_cursor(cursor) if cursor else {}
+        query = PostService.interaction_posts_query(table, user_id, state, limit)
+        with db.connection() as conn:
+            if not conn:
+                return {'posts': [], 'next_cursor': None}
+            try:
+                with conn.cursor() as db_cursor:
+                    posts, next_state = PostService._keyset_page(
+                        db_cursor, query, limit, time_key='interacted_at', id_key='interaction_id'
+                    )
+                    for post in posts:
+                        post.pop('interacted_at', None)
+                        post.pop('interaction_id', None)
+                    return {'posts': post_likes.merge(list(posts)), 'next_cursor': encode_cursor(next_state) if next_state else None}
+            except Exception as e:
+                print(f"Error fetching {table} posts: {e}")
+                return {'posts': [], 'next_cursor': None}
 
     @staticmethod
     def toggle_like(user_id, post_id):
         """Toggle like on a post."""
-        conn = db.get_connection()
-        if not conn:
-            return False, "DB Error"
+        return PostService._apply_like(user_id, post_id, None)
 
-        try:
-            with conn.cursor() as cursor:
-                # Check if already liked
-                check_sql = "SELECT id FROM likes WHERE user_id = %s AND post_id = %s"
-                cursor.execute(check_sql, (user_id, post_id))
-                existing_like = cursor.fetchone()
-
-                if existing_like:
-                    # Unlike
-                    delete_sql = "DELETE FROM likes WHERE id = %s"
-                    cursor.execute(delete_sql, (existing_like['id'],))
-                    update_sql = "UPDATE posts SET likes_count = likes_count - 1 WHERE id = %s"
-                    cursor.execute(update_sql, (post_id,))
-                    return True, "Unliked"
-                else:
-                    # Like
-                    insert_sql = "INSERT INTO likes (user_id, post_id) VALUES (%s, %s)"
-                    cursor.execute(insert_sql, (user_id, post_id))
-                    update_sql = "UPDATE posts SET likes_count = likes_count + 1 WHERE id = %s"
-                    cursor.execute(update_sql, (post_id,))
-
-                    # Notification: Send a message to the post owner
-                    try:
-                        # Get post owner and title
-                        post_sql = "SELECT user_id, title FROM posts WHERE id = %s"
-                        cursor.execute(post_sql, (post_id,))
-                        post = cursor.fetchone()
-
-                        if post and post['user_id'] != user_id:
-                            owner_id = post['user_id']
-                            title = post['title']
-                            content = f"赞了你的帖子《{title}》"
-                            
-                            # Insert notification
-                            content = f"赞了你的帖子《{title}》"
-                            notify_sql = """
-                                INSERT INTO notifications (receiver_id, sender_id, type, target_id, content) 
-                                VALUES (%s, %s, 'like_post', %s, %s)
-                            """
-                            cursor.execute(notify_sql, (owner_id, user_id, post_id, content))
-                    except Exception as e:
-                        print(f"Error sending like notification: {e}")
-                        # Continue even if notification fails
-
-                    return True, "Liked"
-        except Exception as e:
-            return False, str(e)
+    @staticmethod
+    def set_like(user_id, post_id, liked):
+        """Like or unlike a post. Idempotent, so clients can retry it safely."""
+        return PostService._apply_like(user_id, post_id, bool(liked))
+
+    @staticmethod
+    def _apply_like(user_id, post_id, liked):
+        with db.connection(batch=True) as conn:
+            if not conn:
+                return False, "DB Error"
+
+            try:
+                with conn.cursor() as cursor:
+                    conn.begin()
+                    # The post's counter epoch is share-locked until commit (see
+                    # backend/counters.py); it is read in the same round trip as the write
+                    epochs, *_, (counts,) = fetch_batch(cursor, [
+                        post_likes.epoch_query(post_id),
+                        *interaction_statements('likes', 'post_id', 'posts', user_id, post_id, liked),
+                    ])
+                    if not epochs:
+                        conn.rollback()
+                        return False, "帖子不存在"
+                    epoch = epochs[0]['epoch']
+                    liked, changed = interaction_result(counts, liked)
+                    conn.commit()
+                    if changed:
+                        # likes_count is written back in batches (backend/counters.py)
+                        post_likes.add(post_id, 1 if liked else -1, epoch)
+                    if liked and changed:
+                        # Notify the post owner asynchronously (backend/notifications.py)
+                        notification_queue.enqueue('like_post', user_id, post_id)
+                    return True, "Liked" if liked else "Unliked"
+            except Exception as e:
+                conn.rollback()
+                return False, str(e)
 
     @staticmethod
     def toggle_collection(user_id, post_id):
         """Toggle collection on a post."""
-        conn = db.get_connection()
-        if not conn:
-            return False, "DB Error"
+        return PostService._apply_collection(user_id, post_id, None)
 
-        try:
-            with conn.cursor() as cursor:
-                # Check if already collected
-                check_sql = "SELECT id FROM collections WHERE user_id = %s AND post_id = %s"
-                cursor.execute(check_sql, (user_id, post_id))
-                existing_collection = cursor.fetchone()
-
-                if existing_collection:
-                    # Uncollect
-                    delete_sql = "DELETE FROM collections WHERE id = %s"
-                    cursor.execute(delete_sql, (existing_collection['id'],))
-                    return True, "Uncollected"
-                else:
-                    # Collect
-                    insert_sql = "INSERT INTO collections (user_id, post_id) VALUES (%s, %s)"
-                    cursor.execute(insert_sql, (user_id, post_id))
-                    return True, "Collected"
-        except Exception as e:
-            return False, str(e)
+    @staticmethod
+    def set_collection(user_id, post_id, collected):
+        """Collect or uncollect a post. Idempotent."""
+        return PostService._apply_collection(user_id, post_id, bool(collected))
+
+    @staticmethod
+    def _apply_collection(user_id, post_id, collected):
+        with db.connection(batch=True) as conn:
+            if not conn:
+                return False, "DB Error"
+
+            try:
+                with conn.cursor() as cursor:
+                    *_, (counts,) = fetch_batch(
+                        cursor, interaction_statements('collections', 'post_id', 'posts', user_id, post_id, collected)
+                    )
+                    collected, _ = interaction_result(counts, collected)
+                    return True, "Collected" if collected else "Uncollected"
+            except Exception as e:
+                return False, str(e)
 
     @staticmethod
     def add_comment(user_id, post_id, content):
@@ -342,160 +653,143 @@ class PostService:
         if len(content) > 1000:
             return False, "评论内容不能超过1000个字符"
         
-        conn = db.get_connection()
-        if not conn:
-            return False, "Database connection failed"
-
-        try:
-            with conn.cursor() as cursor:
-                # 验证帖子是否存在
-                cursor.execute("SELECT id FROM posts WHERE id = %s", (post_id,))
-                if not cursor.fetchone():
-                    return False, "帖子不存在"
+        with db.connection() as conn:
+            if not conn:
+                return False, "Database connection failed"
+
+            try:
+                with conn.cursor() as cursor:
+                    # 验证帖子是否存在
+                    cursor.execute("SELECT id FROM posts WHERE id = %s", (post_id,))
+                    if not cursor.fetchone():
+                        return False, "帖子不存在"
                 
-                sql = "INSERT INTO comments (user_id, post_id, content) VALUES (%s, %s, %s)"
-                cursor.execute(sql, (user_id, post_id, content.strip()))
-            return True, "评论成功"
-        except Exception as e:
-            print(f"Error adding comment: {e}")
-            return False, "评论失败"
+                    sql = "INSERT INTO comments (user_id, post_id, content) VALUES (%s, %s, %s)"
+                    cursor.execute(sql, (user_id, post_id, content.strip()))
+                notification_queue.enqueue('comment_post', user_id, post_id)
+                return True, "评论成功"
+            except Exception as e:
+                print(f"Error adding comment: {e}")
+                return False, "评论失败"
 
     @staticmethod
     def get_comments(post_id, current_user_id=None):
         """Get comments for a post."""
-        conn = db.get_connection()
-        if not conn:
-            return []
-
-        try:
-            with conn.cursor() as cursor:
-                if current_user_id:
-                    sql = """
-                        SELECT c.*, u.nickname, u.avatar_url,
-                        CASE WHEN cl.id IS NOT NULL THEN 1 ELSE 0 END as is_liked
-                        FROM comments c 
-                        JOIN users u ON c.user_id = u.id 
-                        LEFT JOIN comment_likes cl ON c.id = cl.comment_id AND cl.user_id = %s
-                        WHERE c.post_id = %s 
-                        ORDER BY c.created_at ASC
-                    """
-                    cursor.execute(sql, (current_user_id, post_id))
-                else:
-                    sql = """
-                        SELECT c.*, u.nickname, u.avatar_url, 0 as is_liked
-                        FROM comments c 
-                        JOIN users u ON c.user_id = u.id 
-                        WHERE c.post_id = %s 
-                        ORDER BY c.created_at ASC
-                    """
-                    cursor.execute(sql, (post_id,))
-                return cursor.fetchall()
-        except Exception as e:
-            print(f"Error fetching comments: {e}")
-            return []
+        with db.connection() as conn:
+            if not conn:
+                return []
+
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(COMMENTS_SQL, (current_user_id, post_id))
+                    return comment_likes.merge(list(cursor.fetchall()))
+            except Exception as e:
+                print(f"Error fetching comments: {e}")
+                return []
 
     @staticmethod
     def toggle_comment_like(user_id, comment_id):
         """Toggle like on a comment."""
-        conn = db.get_connection()
-        if not conn:
-            return False, "DB Error"
+        return PostService._apply_comment_like(user_id, comment_id, None)
 
-        try:
-            with conn.cursor() as cursor:
-                # Check if already liked
-                check_sql = "SELECT id FROM comment_likes WHERE user_id = %s AND comment_id = %s"
-                cursor.execute(check_sql, (user_id, comment_id))
-                existing_like = cursor.fetchone()
-
-                if existing_like:
-                    # Unlike
-                    delete_sql = "DELETE FROM comment_likes WHERE id = %s"
-                    cursor.execute(delete_sql, (existing_like['id'],))
-                    update_sql = "UPDATE comments SET likes_count = likes_count - 1 WHERE id = %s"
-                    cursor.execute(update_sql, (comment_id,))
-                    return True, "Unliked"
-                else:
-                    # Like
-                    insert_sql = "INSERT INTO comment_likes (user_id, comment_id) VALUES (%s, %s)"
-                    cursor.execute(insert_sql, (user_id, comment_id))
-                    update_sql = "UPDATE comments SET likes_count = likes_count + 1 WHERE id = %s"
-                    cursor.execute(update_sql, (comment_id,))
-                    return True, "Liked"
-        except Exception as e:
-            return False, str(e)
+    @staticmethod
+    def set_comment_like(user_id, comment_id, liked):
+        """Like or unlike a comment. Idempotent."""
+        return PostService._apply_comment_like(user_id, comment_id, bool(liked))
+
+    @staticmethod
+    def _apply_comment_like(user_id, comment_id, liked):
+        with db.connection(batch=True) as conn:
+            if not conn:
+                return False, "DB Error"
+
+            try:
+                with conn.cursor() as cursor:
+                    conn.begin()
+                    epochs, *_, (counts,) = fetch_batch(cursor, [
+                        comment_likes.epoch_query(comment_id),
+                        *interaction_statements('comment_likes', 'comment_id', 'comments', user_id, comment_id, liked),
+                    ])
+                    if not epochs:
+                        conn.rollback()
+                        return False, "评论不存在"
+                    epoch = epochs[0]['epoch']
+                    liked, changed = interaction_result(counts, liked)
+                    conn.commit()
+                    if changed:
+                        comment_likes.add(comment_id, 1 if liked else -1, epoch)
+                    return True, "Liked" if liked else "Unliked"
+            except Exception as e:
+                conn.rollback()
+                return False, str(e)
 
     @staticmethod
     def delete_post(post_id, user_id):
         """Delete a post and its associated files."""
-        conn = db.get_connection()
-        if not conn:
-            return False, "Database connection failed"
+        with db.connection() as conn:
+            if not conn:
+                return False, "Database connection failed"
         
-        try:
-            with conn.cursor() as cursor:
-                # Verify ownership
-                cursor.execute("SELECT user_id, image_url, video_url FROM posts WHERE id = %s", (post_id,))
-                post = cursor.fetchone()
-                if not post:
-                    return False, "Post not found"
-                if post['user_id'] != user_id:
-                    return False, "Permission denied"
-                
-                # Collect all file paths to delete
-                files_to_delete = []
+            try:
+                with conn.cursor() as cursor:
+                    # Verify ownership
+                    cursor.execute("SELECT user_id, category, image_url, video_url FROM posts WHERE id = %s", (post_id,))
+                    post = cursor.fetchone()
+                    if not post:
+                        return False, "Post not found"
+                    if post['user_id'] != user_id:
+                        return False, "Permission denied"
                 
-                # Add cover image if exists
-                if post.get('image_url'):
-                    files_to_delete.append(post['image_url'])
+                    # Collect all file paths to delete
+                    files_to_delete = []
                 
-                # Add video if exists
-                if post.get('video_url'):
-                    files_to_delete.append(post['video_url'])
+                    # Add cover image if exists
+                    if post.get('image_url'):
+                        files_to_delete.append(post['image_url'])
                 
-                # Get all images from post_images table
-                cursor.execute("SELECT image_url FROM post_images WHERE post_id = %s", (post_id,))
-                post_images = cursor.fetchall()
-                for img in post_images:
-                    if img.get('image_url'):
-                        files_to_delete.append(img['image_url'])
+                    # Add video if exists
+                    if post.get('video_url'):
+                        files_to_delete.append(post['video_url'])
                 
-                # Delete physical files
-                for file_path in files_to_delete:
-                    try:
-                        if file_path and os.path.exists(file_path):
-                            os.remove(file_path)
-                            print(f"Deleted file: {file_path}")
-                    except Exception as e:
-                        print(f"Warning: Failed to delete file {file_path}: {e}")
-                        # Continue even if file deletion fails
+                    # Get all images from post_images table
+                    cursor.execute("SELECT image_url FROM post_images WHERE post_id = %s", (post_id,))
+                    post_images = cursor.fetchall()
+                    for img in post_images:
+                        if img.get('image_url'):
+                            files_to_delete.append(img['image_url'])
                 
-                # Delete from database (CASCADE will handle related records)
-                cursor.execute("DELETE FROM posts WHERE id = %s", (post_id,))
-                conn.commit()
-                return True, "Post deleted successfully"
-        except Exception as e:
-            conn.rollback()
-            return False, f"Failed to delete post: {str(e)}"
+                    # Delete from database (CASCADE will handle related records)
+                    cursor.execute("DELETE FROM posts WHERE id = %s", (post_id,))
+                    conn.commit()
+            except Exception as e:
+                conn.rollback()
+                return False, f"Failed to delete post: {str(e)}"
+
+        # Files go once the connection is back in the pool, so slow disk I/O
+        # doesn't keep it checked out
+        invalidate_post_caches(post_id, post.get('category'))
+        _delete_files(files_to_delete)
+        return True, "Post deleted successfully"
 
     @staticmethod
     def update_post_visibility(post_id, user_id, is_private):
         """Update post visibility."""
-        conn = db.get_connection()
-        if not conn:
-            return False, "Database connection failed"
+        with db.connection() as conn:
+            if not conn:
+                return False, "Database connection failed"
             
-        try:
-            with conn.cursor() as cursor:
-                # Verify ownership
-                cursor.execute("SELECT user_id FROM posts WHERE id = %s", (post_id,))
-                post = cursor.fetchone()
-                if not post:
-                    return False, "Post not found"
-                if post['user_id'] != user_id:
-                    return False, "Permission denied"
+            try:
+                with conn.cursor() as cursor:
+                    # Verify ownership
+                    cursor.execute("SELECT user_id, category FROM posts WHERE id = %s", (post_id,))
+                    post = cursor.fetchone()
+                    if not post:
+                        return False, "Post not found"
+                    if post['user_id'] != user_id:
+                        return False, "Permission denied"
                 
-                cursor.execute("UPDATE posts SET is_private = %s WHERE id = %s", (is_private, post_id))
-                return True, "Visibility updated successfully"
-        except Exception as e:
-            return False, f"Failed to update visibility: {str(e)}"
+                    cursor.execute("UPDATE posts SET is_private = %s WHERE id = %s", (is_private, post_id))
+                    invalidate_post_caches(post_id, post.get('category'))
+                    return True, "Visibility updated successfully"
+            except Exception as e:
+                return False, f"Failed to update visibility: {str(e)}"
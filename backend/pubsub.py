@@ -0,0 +1,120 @@
+"""
+进程内推送中心
+server.py 的 ``/api/stream`` 为每个连接订阅一个有界的 asyncio 队列；服务层（运行在数据库线程池中）
+调用 ``hub.publish(user_id, event, data)`` 把新私信、通知、未读数变化推给该用户的所有连接。
+
+- ``publish`` 线程安全，没有订阅者时几乎零开销（Streamlit 进程中即是如此）
+- 背压：某个连接的队列满了说明客户端读得太慢，清空积压并只留一条 ``resync`` 事件，
+  客户端收到后重新拉取一次状态，而不是让内存无限增长
+- 只在当前进程内有效：多进程部署时每个进程只能推送自己处理的写操作
+"""
+import asyncio
+import itertools
+import json
+import os
+import threading
+import time
+
+QUEUE_SIZE = int(os.getenv('SSE_QUEUE_SIZE', 100))
+HEARTBEAT_INTERVAL = float(os.getenv('SSE_HEARTBEAT_INTERVAL', 15))
+
+class Subscription:
+    """One connected client: a bounded queue owned by the server's event loop."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, user_id, loop, queue_size):
+        self.id = next(self._ids)
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.connected_at = time.time()
+
+class PubSubHub:
+    def __init__(self, queue_size=QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = {}  # user_id -> {subscription_id: Subscription}
+        self._published = 0
+        self._delivered = 0
+        self._overflows = 0
+
+    def subscribe(self, user_id):
+        """Register a connection of ``user_id``. Must be called on the event loop."""
+        subscription = Subscription(user_id, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, {})[subscription.id] = subscription
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscribers.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.pop(subscription.id, None)
+                if not subscriptions:
+                    del self._subscribers[subscription.user_id]
+
+    def publish(self, user_id, event, data=None):
+        """Send ``event`` to every connection of ``user_id``. Safe from any thread."""
+        with self._lock:
+            subscriptions = list(self._subscribers.get(user_id, {}).values())
+            self._published += 1
+        message = {'event': event, 'data': data if data is not None else {}}
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(self._deliver, subscription, message)
+            except RuntimeError:
+                # Event loop already closed; the stream's cleanup will unsubscribe it
+                pass
+        return len(subscriptions)
+
+    def _deliver(self, subscription, message):
+        queue = subscription.queue
+        if queue.full():
+            # Slow client: drop the backlog and ask it to refetch instead
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait({'event': 'resync', 'data': {}})
+            with self._lock:
+                self._overflows += 1
+            return
+        queue.put_nowait(message)
+        with self._lock:
+            self._delivered += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'connections': sum(len(s) for s in self._subscribers.values()),
+                'users': len(self._subscribers),
+                'published': self._published,
+                'delivered': self._delivered,
+                'overflows': self._overflows,
+                'queue_size': self.queue_size,
+            }
+
+def format_sse(event, data):
+    """Encode one Server-Sent Events frame."""
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+async def event_stream(user_id, heartbeat_interval=HEARTBEAT_INTERVAL):
+    """Async generator of SSE frames for one connection of ``user_id``.
+
+    Sends a comment line every ``heartbeat_interval`` seconds of silence so
+    proxies keep the connection open and dead clients are detected.
+    """
+    subscription = hub.subscribe(user_id)
+    try:
+        yield format_sse('ready', {'user_id': user_id})
+        while True:
+            try:
+                message = await asyncio.wait_for(subscription.queue.get(), timeout=heartbeat_interval)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            yield format_sse(message['event'], message['data'])
+    finally:
+        hub.unsubscribe(subscription)
+
+hub = PubSubHub()
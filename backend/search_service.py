@@ -0,0 +1,133 @@
+"""
+笔记全文搜索
+基于 MySQL FULLTEXT 索引（ngram 分词器，适用于中文），见 migrations/0004_post_fulltext_search.sql。
+InnoDB 在 create_post / delete_post 的同一事务中增量维护全文索引，可见性在查询时按 is_private 过滤，
+因此发布、删除、修改可见性后搜索结果立即生效，无需额外的重建任务。
+"""
+import html
+import re
+from .counters import post_likes
+from .database import db
+from .pagination import decode_cursor, encode_cursor
+
+# InnoDB ngram_token_size defaults to 2: shorter terms can't match the index
+NGRAM_TOKEN_SIZE = 2
+TITLE_WEIGHT = 2
+SNIPPET_LENGTH = 80
+MAX_TERMS = 8
+# Characters with a meaning in BOOLEAN MODE queries
+_BOOLEAN_OPERATORS = re.compile(r'[+\-<>()~*"@]+')
+
+def search_terms(query):
+    """Split a user query into distinct search terms (operators stripped)."""
+    terms = []
+    for term in _BOOLEAN_OPERATORS.sub(' ', query or '').split():
+        if term not in terms:
+            terms.append(term)
+    return terms[:MAX_TERMS]
+
+def is_fulltext_query(terms):
+    """Whether every term is long enough to be answered by the ngram index."""
+    return bool(terms) and all(len(term) >= NGRAM_TOKEN_SIZE for term in terms)
+
+def build_boolean_query(terms):
+    """BOOLEAN MODE query requiring every term as an ngram phrase."""
+    return ' '.join(f'+"{term}"' for term in terms)
+
+def fulltext_filter(query):
+    """SQL condition and params restricting posts ``p`` to those matching ``query``.
+
+    Falls back to LIKE when a term is shorter than the ngram size.
+    """
+    terms = search_terms(query)
+    if is_fulltext_query(terms):
+        return "AND MATCH(p.title, p.content) AGAINST (%s IN BOOLEAN MODE)", [build_boolean_query(terms)]
+    like_query = f"%{(query or '').strip()}%"
+    return "AND (p.title LIKE %s OR p.content LIKE %s)", [like_query, like_query]
+
+FULLTEXT_SEARCH_SQL = """
+    SELECT p.*, u.nickname, u.avatar_url,
+           MATCH(p.title) AGAINST (%s IN BOOLEAN MODE) * %s
+           + MATCH(p.title, p.content) AGAINST (%s IN BOOLEAN MODE) AS relevance
+    FROM posts p
+    JOIN users u ON p.user_id = u.id
+    WHERE p.is_private = FALSE
+      AND MATCH(p.title, p.content) AGAINST (%s IN BOOLEAN MODE)
+    ORDER BY relevance DESC, p.id DESC
+    LIMIT %s OFFSET %s
+"""
+LIKE_SEARCH_SQL = """
+    SELECT p.*, u.nickname, u.avatar_url,
+           (p.title LIKE %s) * %s + 1 AS relevance
+    FROM posts p
+    JOIN users u ON p.user_id = u.id
+    WHERE p.is_private = FALSE AND (p.title LIKE %s OR p.content LIKE %s)
+    ORDER BY relevance DESC, p.created_at DESC, p.id DESC
+    LIMIT %s OFFSET %s
+"""
+
+def ranked_search_query(query, limit, offset):
+    """SQL and params of one page of ``query``'s results ranked by relevance."""
+    terms = search_terms(query)
+    if is_fulltext_query(terms):
+        boolean_query = build_boolean_query(terms)
+        return FULLTEXT_SEARCH_SQL, (boolean_query, TITLE_WEIGHT, boolean_query, boolean_query, limit, offset)
+    like_query = f"%{(query or '').strip()}%"
+    return LIKE_SEARCH_SQL, (like_query, TITLE_WEIGHT, like_query, like_query, limit, offset)
+
+def highlight(text, terms, max_length=None):
+    """HTML-escape ``text`` and wrap occurrences of ``terms`` in ``<em>``.
+
+    With ``max_length`` the result is a snippet of roughly that many characters
+    centred on the first match.
+    """
+    if not text:
+        return ''
+    if max_length and len(text) > max_length:
+        first = min((pos for pos in (text.lower().find(t.lower()) for t in terms) if pos >= 0), default=0)
+        start = max(0, first - max_length // 4)
+        end = min(len(text), start + max_length)
+        text = ('…' if start > 0 else '') + text[start:end] + ('…' if end < len(text) else '')
+
+    escaped = html.escape(text)
+    if not terms:
+        return escaped
+    pattern = re.compile('|'.join(re.escape(html.escape(t)) for t in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+    return pattern.sub(lambda m: f"<em>{m.group(0)}</em>", escaped)
+
+class SearchService:
+    @staticmethod
+    def search_posts(query, limit=20, cursor=None):
+        """Search public posts ranked by relevance, with highlighted title and snippet.
+
+        Returns ``{'posts': [...], 'next_cursor': str or None}``; each post has
+        ``relevance`` and ``highlight`` (``{'title', 'content'}``) fields.
+        Raises ValueError for a malformed cursor.
+        """
+        terms = search_terms(query)
+        if not terms:
+            return {'posts': [], 'next_cursor': None}
+        # Ranked results are scored as a whole, so the cursor carries an offset
+        offset = int(decode_cursor(cursor).get('o', 0)) if cursor else 0
+
+        with db.connection() as conn:
+            if not conn:
+                return {'posts': [], 'next_cursor': None}
+
+            try:
+                with conn.cursor() as db_cursor:
+                    db_cursor.execute(*ranked_search_query(query, limit, offset))
+                    posts = db_cursor.fetchall()
+            except Exception as e:
+                print(f"Error searching posts: {e}")
+                return {'posts': [], 'next_cursor': None}
+
+        post_likes.merge(posts)
+        for post in posts:
+            post['relevance'] = float(post.get('relevance') or 0)
+            post['highlight'] = {
+                'title': highlight(post.get('title'), terms),
+                'content': highlight(post.get('content'), terms, SNIPPET_LENGTH),
+            }
+        next_cursor = encode_cursor({'o': offset + len(posts)}) if len(posts) == limit else None
+        return {'posts': posts, 'next_cursor': next_cursor}
@@ -0,0 +1,425 @@
+"""
+进程内关注关系索引
+把 follows 表加载成每个用户的整数数组，两个方向各两份：按用户 id 排序的 ``array('i')``
+用于 is_following、关注状态和互相关注（二分查找、有序归并）；按关注顺序排列的
+``(follow_id, user_id)`` 两个并行数组用于粉丝/关注列表分页（新关注在前）。都是内存操作，不再访问数据库。
+
+- 首次使用时在后台线程中构建，构建完成前各方法返回 None，调用方回退到 SQL
+- 本进程内的关注/取关通过 ``add`` / ``remove`` 立即更新
+- 其他进程（Streamlit、其他 worker）的关注/取关写入 follow_events 表，后台线程每
+  ``SOCIAL_GRAPH_POLL_INTERVAL`` 秒增量拉取一次并应用，其他进程的写入最多延迟这么久可见；
+  连续几轮拉取失败时索引不再应答，调用方回退到 SQL
+- 每 ``SOCIAL_GRAPH_MAX_AGE`` 秒在后台全量重建一次作为兜底，重建期间旧索引继续应答
+- 内存占用等指标见 ``stats()`` / ``GET /api/system/social-graph``
+"""
+import os
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+# follow_events are re-read this many seconds back, so an event that committed
+# after a later-numbered one is still picked up
+EVENT_GRACE_SECONDS = 10
+# The graph stops answering after this many poll intervals without a successful poll
+MAX_MISSED_POLLS = 3
+
+def _insert(ids, value):
+    i = bisect_left(ids, value)
+    if i < len(ids) and ids[i] == value:
+        return False
+    ids.insert(i, value)
+    return True
+
+def _remove(ids, value):
+    i = bisect_left(ids, value)
+    if i < len(ids) and ids[i] == value:
+        del ids[i]
+        return True
+    return False
+
+def _contains(ids, value):
+    i = bisect_left(ids, value)
+    return i < len(ids) and ids[i] == value
+
+def _intersect(a, b):
+    """Sorted intersection of two sorted arrays."""
+    result = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        if a[i] == b[j]:
+            result.append(a[i])
+            i += 1
+            j += 1
+        elif a[i] < b[j]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+def _new_log():
+    return array('i'), array('i')
+
+def _log_insert(log, follow_id, user_id):
+    follow_ids, user_ids = log
+    i = bisect_left(follow_ids, follow_id)
+    if i < len(follow_ids) and follow_ids[i] == follow_id:
+        return
+    follow_ids.insert(i, follow_id)
+    user_ids.insert(i, user_id)
+
+def _log_remove(log, user_id):
+    follow_ids, user_ids = log
+    try:
+        i = user_ids.index(user_id)
+    except ValueError:
+        return
+    del follow_ids[i]
+    del user_ids[i]
+
+def build_adjacency(edges):
+    """Adjacency of ``(follow_id, follower_id, followed_id)`` rows given in follow id order.
+
+    Returns ``(following, followers, following_log, followers_log)``: the first
+    two map a user to the sorted ids at the other end of their edges, the logs
+    map a user to parallel ``(follow_ids, user_ids)`` arrays in follow order.
+    """
+    following, followers, following_log, followers_log = {}, {}, {}, {}
+    for follow_id, follower_id, followed_id in edges:
+        following.setdefault(follower_id, array('i')).append(followed_id)
+        followers.setdefault(followed_id, array('i')).append(follower_id)
+        for log, user_id, other_id in ((following_log, follower_id, followed_id),
+                                       (followers_log, followed_id, follower_id)):
+            follow_ids, user_ids = log.setdefault(user_id, _new_log())
+            follow_ids.append(follow_id)
+            user_ids.append(other_id)
+    for adjacency in (following, followers):
+        for uid, ids in adjacency.items():
+            adjacency[uid] = array('i', sorted(set(ids)))
+    return following, followers, following_log, followers_log
+
+class SocialGraph:
+    """Follow edges held as integer arrays per user, in both directions."""
+
+    def __init__(self, max_age=3600.0, poll_interval=2.0, batch_size=50000):
+        self.max_age = max_age
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._following = {}  # follower_id -> sorted followed ids
+        self._followers = {}  # followed_id -> sorted follower ids
+        self._following_log = {}  # follower_id -> (follow ids, followed ids) in follow order
+        self._followers_log = {}  # followed_id -> (follow ids, follower ids) in follow order
+        self._event_ids = {}  # (follower_id, followed_id) -> newest follow_events id applied
+        self._poll_since = None  # follow_events.created_at the next poll reads from
+        self._ready = False
+        self._loading = False
+        self._generation = 0  # bumped by clear(), so a build or poll started before it is dropped
+        self._poller = None
+        self._loaded_at = 0.0
+        self._polled_at = 0.0
+        self._build_ms = 0.0
+        self._builds = 0
+        self._polls = 0
+        self._events_applied = 0
+        self._failures = 0
+        self._hits = 0
+        self._fallbacks = 0
+
+    @property
+    def ready(self):
+        return self._available()
+
+    def load(self):
+        """Rebuild the graph from the follows table. Returns the edge count, or None on error.
+
+        The graph being replaced keeps answering until the new one is swapped in.
+        """
+        from .database import db
+
+        with self._lock:
+            self._loading = True
+            generation = self._generation
+        started_at = time.monotonic()
+        start = time.perf_counter()
+        try:
+            with db.connection() as conn:
+                if not conn:
+                    raise RuntimeError("Database connection failed")
+                with conn.cursor() as cursor:
+                    since = self._event_window(cursor)
+                    adjacency = build_adjacency(self._edges(cursor))
+                    # Follows and unfollows committed while the snapshot was read
+                    events = self._events(cursor, since)
+        except Exception as e:
+            with self._lock:
+                if generation == self._generation:
+                    self._loading = False
+                self._failures += 1
+            print(f"Error loading social graph: {e}")
+            return None
+
+        with self._lock:
+            if generation != self._generation:
+                return None  # cleared while building
+            self._following, self._followers, self._following_log, self._followers_log = adjacency
+            self._event_ids = {}
+            self._replay(events)
+            self._poll_since = since
+            self._loading = False
+            self._ready = True
+            self._loaded_at = started_at
+            self._polled_at = time.monotonic()
+            self._build_ms = (time.perf_counter() - start) * 1000
+            self._builds += 1
+        return sum(len(ids) for ids in adjacency[0].values())
+
+    def poll(self):
+        """Apply the follows and unfollows committed by any process since the last poll.
+
+        Returns the number of events that changed the graph, or None when it
+        isn't loaded or the poll failed.
+        """
+        from .database import db
+
+        with self._lock:
+            if not self._ready:
+                return None
+            generation, since = self._generation, self._poll_since
+        try:
+            with db.connection() as conn:
+                if not conn:
+                    raise RuntimeError("Database connection failed")
+                with conn.cursor() as cursor:
+                    next_since = self._event_window(cursor)
+                    events = self._events(cursor, since)
+        except Exception as e:
+            self._failures += 1
+            print(f"Error polling social graph: {e}")
+            return None
+
+        with self._lock:
+            if generation != self._generation or not self._ready:
+                return None
+            # Only events in the window can be replayed again, so older ids can go
+            floor = events[0]['id'] if events else None
+            self._event_ids = {
+                pair: event_id for pair, event_id in self._event_ids.items()
+                if floor is not None and event_id >= floor
+            }
+            applied = self._replay(events)
+            self._poll_since = max(self._poll_since, next_since)
+            self._polled_at = time.monotonic()
+            self._polls += 1
+            self._events_applied += applied
+        return applied
+
+    def _event_window(self, cursor):
+        cursor.execute("SELECT NOW() - INTERVAL %s SECOND AS since", (EVENT_GRACE_SECONDS,))
+        return cursor.fetchone()['since']
+
+    def _events(self, cursor, since):
+        cursor.execute(
+            "SELECT id, follower_id, followed_id, follow_id FROM follow_events WHERE created_at >= %s ORDER BY id",
+            (since,)
+        )
+        return list(cursor.fetchall())
+
+    def _edges(self, cursor):
+        """Stream ``(follow_id, follower_id, followed_id)`` from follows in primary key batches."""
+        last_id = 0
+        while True:
+            cursor.execute(
+                "SELECT id, follower_id, followed_id FROM follows WHERE id > %s ORDER BY id LIMIT %s",
+                (last_id, self.batch_size)
+            )
+            rows = cursor.fetchall()
+            for row in rows:
+                yield row['id'], row['follower_id'], row['followed_id']
+            if len(rows) < self.batch_size:
+                return
+            last_id = rows[-1]['id']
+
+    def _fresh(self):
+        """Loaded, and caught up with the other processes' writes recently enough."""
+        if not self._ready:
+            return False
+        return not self.poll_interval or time.monotonic() - self._polled_at <= self.poll_interval * MAX_MISSED_POLLS
+
+    def _start_load(self):
+        with self._lock:
+            if self._loading:
+                return
+            self._loading = True
+        threading.Thread(target=self.load, name="social-graph-loader", daemon=True).start()
+
+    def _available(self):
+        """Whether lookups can be served; starts the first build and the poller."""
+        if not self._ready:
+            self._start_load()
+        elif self.poll_interval and self._poller is None:
+            with self._lock:
+                start = self._poller is None
+                if start:
+                    self._poller = threading.Thread(target=self._run, name="social-graph-poller", daemon=True)
+            if start:
+                self._poller.start()
+        fresh = self._fresh()
+        if not fresh:
+            self._fallbacks += 1
+        return fresh
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_interval)
+            if self.max_age and time.monotonic() - self._loaded_at > self.max_age:
+                # Safety net for writes that bypassed follow_events
+                self._start_load()
+            self.poll()
+
+    def _replay(self, events):
+        applied = 0
+        for event in events:
+            op = 'add' if event['follow_id'] is not None else 'remove'
+            applied += self._apply(op, event['follower_id'], event['followed_id'], event['follow_id'], event['id'])
+        return applied
+
+    def _apply(self, op, follower_id, followed_id, follow_id=None, event_id=None):
+        # An event older than one already applied to the pair (say a poll read
+        # from before this process's own follow committed) is stale
+        if event_id is not None:
+            pair = (follower_id, followed_id)
+            if self._event_ids.get(pair, 0) >= event_id:
+                return 0
+            self._event_ids[pair] = event_id
+        if op == 'add':
+            if not _insert(self._following.setdefault(follower_id, array('i')), followed_id):
+                return 0
+            _insert(self._followers.setdefault(followed_id, array('i')), follower_id)
+            _log_insert(self._following_log.setdefault(follower_id, _new_log()), follow_id, followed_id)
+            _log_insert(self._followers_log.setdefault(followed_id, _new_log()), follow_id, follower_id)
+        else:
+            if not _remove(self._following.get(follower_id, array('i')), followed_id):
+                return 0
+            _remove(self._followers.get(followed_id, array('i')), follower_id)
+            _log_remove(self._following_log.get(follower_id, _new_log()), followed_id)
+            _log_remove(self._followers_log.get(followed_id, _new_log()), follower_id)
+        return 1
+
+    def add(self, follower_id, followed_id, follow_id, event_id=None):
+        """Record a follow committed by this process (``follow_id`` is its follows row)."""
+        with self._lock:
+            if self._ready:
+                self._apply('add', follower_id, followed_id, follow_id, event_id)
+
+    def remove(self, follower_id, followed_id, event_id=None):
+        """Record an unfollow committed by this process."""
+        with self._lock:
+            if self._ready:
+                self._apply('remove', follower_id, followed_id, event_id=event_id)
+
+    def is_following(self, follower_id, followed_id):
+        if not self._available():
+            return None
+        self._hits += 1
+        return _contains(self._following.get(follower_id, ()), followed_id)
+
+    def following_states(self, follower_id, user_ids):
+        """``{user_id: bool}`` for ``user_ids``, or None while the graph is not loaded."""
+        if not self._available():
+            return None
+        self._hits += 1
+        following = self._following.get(follower_id, ())
+        return {uid: _contains(following, uid) for uid in user_ids}
+
+    def followers(self, user_id, before=None, limit=None):
+        """``[(follow_id, follower_id)]`` of ``user_id``, newest follow first, with follow ids below ``before``."""
+        return self._page(self._followers_log, user_id, before, limit)
+
+    def following(self, user_id, before=None, limit=None):
+        """``[(follow_id, followed_id)]`` of ``user_id``, newest follow first, with follow ids below ``before``."""
+        return self._page(self._following_log, user_id, before, limit)
+
+    def _page(self, logs, user_id, before, limit):
+        if not self._available():
+            return None
+        self._hits += 1
+        # Under the lock: an update moves both parallel arrays
+        with self._lock:
+            follow_ids, user_ids = logs.get(user_id, ((), ()))
+            end = bisect_left(follow_ids, before) if before is not None else len(follow_ids)
+            start = max(end - limit, 0) if limit is not None else 0
+            return [(follow_ids[i], user_ids[i]) for i in range(end - 1, start - 1, -1)]
+
+    def mutuals(self, user_id):
+        """Ids that ``user_id`` follows and that follow ``user_id`` back, in id order."""
+        if not self._available():
+            return None
+        self._hits += 1
+        with self._lock:
+            return _intersect(self._following.get(user_id, ()), self._followers.get(user_id, ()))
+
+    def counts(self, user_id):
+        if not self._available():
+            return None
+        self._hits += 1
+        return {
+            'followers': len(self._followers.get(user_id, ())),
+            'following': len(self._following.get(user_id, ())),
+        }
+
+    def memory_bytes(self):
+        """Approximate footprint of the adjacency maps (dicts, array objects and their buffers)."""
+        total = 0
+        for adjacency in (self._following, self._followers):
+            total += sys.getsizeof(adjacency)
+            for ids in adjacency.values():
+                total += sys.getsizeof(ids)
+        for logs in (self._following_log, self._followers_log):
+            total += sys.getsizeof(logs)
+            for log in logs.values():
+                total += sys.getsizeof(log) + sum(sys.getsizeof(ids) for ids in log)
+        return total
+
+    def stats(self):
+        with self._lock:
+            edges = sum(len(ids) for ids in self._following.values())
+            memory = self.memory_bytes()
+            return {
+                'ready': self._ready,
+                'fresh': self._fresh(),
+                'loading': self._loading,
+                'users': len(self._following.keys() | self._followers.keys()),
+                'edges': edges,
+                'memory_bytes': memory,
+                'bytes_per_edge': round(memory / edges, 1) if edges else 0.0,
+                'age_seconds': round(time.monotonic() - self._loaded_at, 1) if self._ready else None,
+                'poll_age_seconds': round(time.monotonic() - self._polled_at, 1) if self._ready else None,
+                'build_ms': round(self._build_ms, 1),
+                'builds': self._builds,
+                'polls': self._polls,
+                'events_applied': self._events_applied,
+                'failures': self._failures,
+                'hits': self._hits,
+                'fallbacks': self._fallbacks,
+            }
+
+    def clear(self):
+        """Drop the graph; a build or poll still running is discarded when it finishes."""
+        with self._lock:
+            self._following, self._followers = {}, {}
+            self._following_log, self._followers_log = {}, {}
+            self._event_ids = {}
+            self._poll_since = None
+            self._generation += 1
+            self._ready = False
+            self._loading = False
+            self._loaded_at = 0.0
+            self._polled_at = 0.0
+
+social_graph = SocialGraph(
+    max_age=float(os.getenv('SOCIAL_GRAPH_MAX_AGE', 3600)),
+    poll_interval=float(os.getenv('SOCIAL_GRAPH_POLL_INTERVAL', 2)),
+    batch_size=int(os.getenv('SOCIAL_GRAPH_BATCH_SIZE', 50000)),
+)
@@ -0,0 +1,49 @@
+"""
+未读计数
+user_counters 表为每个用户维护未读私信数和未读通知数，未读角标只需按主键读一行。
+写入方在修改 messages / notifications 的同一事务中调整计数；
+``python -m backend.maintenance reconcile-unread`` 按源表重新统计，修正可能的偏差。
+"""
+
+BUMP_SQL = """
+    INSERT INTO user_counters (user_id, unread_messages, unread_notifications)
+    VALUES (%s, GREATEST(%s, 0), GREATEST(%s, 0))
+    ON DUPLICATE KEY UPDATE
+        unread_messages = GREATEST(unread_messages + %s, 0),
+        unread_notifications = GREATEST(unread_notifications + %s, 0)
+"""
+
+# Unread notifications are unread rows: a coalesced burst counts once
+RECOUNT_NOTIFICATIONS_SQL = """
+    INSERT INTO user_counters (user_id, unread_notifications)
+    SELECT u.id, (SELECT COUNT(*) FROM notifications n WHERE n.receiver_id = u.id AND n.is_read = FALSE)
+    FROM users u WHERE u.id IN ({placeholders})
+    ON DUPLICATE KEY UPDATE unread_notifications = VALUES(unread_notifications)
+"""
+
+UNREAD_TOTALS_SQL = """
+    SELECT user_id, unread_messages + unread_notifications AS total
+    FROM user_counters WHERE user_id IN ({placeholders})
+"""
+
+def bump_unread(cursor, user_id, messages=0, notifications=0):
+    """Add (or with negative values subtract) to a user's unread counters."""
+    cursor.execute(BUMP_SQL, (user_id, messages, notifications, messages, notifications))
+
+def recount_unread_notifications(cursor, user_ids):
+    """Recount unread notifications of ``user_ids`` (after a batch of upserts)."""
+    user_ids = sorted(set(user_ids))
+    if user_ids:
+        placeholders = ", ".join(["%s"] * len(user_ids))
+        cursor.execute(RECOUNT_NOTIFICATIONS_SQL.format(placeholders=placeholders), tuple(user_ids))
+
+def unread_totals(cursor, user_ids):
+    """``{user_id: unread messages + notifications}`` for ``user_ids`` (0 when no row)."""
+    user_ids = sorted(set(user_ids))
+    if not user_ids:
+        return {}
+    placeholders = ", ".join(["%s"] * len(user_ids))
+    cursor.execute(UNREAD_TOTALS_SQL.format(placeholders=placeholders), tuple(user_ids))
+    totals = {user_id: 0 for user_id in user_ids}
+    totals.update({row['user_id']: int(row['total']) for row in cursor.fetchall()})
+    return totals
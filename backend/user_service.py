@@ -1,4 +1,164 @@
-from .database import db
+import os
+from .auth_service import AuthService
+from .database import db, fetch_batch
+from .notifications import notification_queue
+from .pagination import decode_cursor, encode_cursor, keyset_query, keyset_state
+from .social_graph import social_graph
+from .utils import MAX_BATCH_IDS, unique_ids
+
+FOLLOW_PAGE_SIZE = int(os.getenv('FOLLOW_PAGE_SIZE', 20))
+
+# direction -> (column matching the listed user, column of the rows' users, users count column)
+FOLLOW_LISTS = {
+    'followers': ('followed_id', 'follower_id', 'follower_count'),
+    'following': ('follower_id', 'followed_id', 'following_count'),
+}
+
+# Taken before touching follows: its FK checks would otherwise take shared locks on
+# both users rows, and two follows of one account upgrading them to exclusive for
+# the count UPDATE deadlock. Locking in primary key order makes them queue instead.
+LOCK_FOLLOW_USERS_SQL = "SELECT id FROM users WHERE id IN (%s, %s) ORDER BY id FOR UPDATE"
+
+BUMP_FOLLOW_COUNTS_SQL = """
+    UPDATE users
+    SET following_count = GREATEST(following_count + IF(id = %s, %s, 0), 0),
+        follower_count = GREATEST(follower_count + IF(id = %s, %s, 0), 0)
+    WHERE id IN (%s, %s)
+"""
+
+# Read by every process's social graph to pick up follows made elsewhere;
+# follow_id is NULL for an unfollow
+INSERT_FOLLOW_EVENT_SQL = "INSERT INTO follow_events (follower_id, followed_id, follow_id) VALUES (%s, %s, %s)"
+
+MUTUALS_SQL = """
+    SELECT f.followed_id AS id
+    FROM follows f
+    JOIN follows b ON b.follower_id = f.followed_id AND b.followed_id = f.follower_id
+    WHERE f.follower_id = %s
+    ORDER BY f.followed_id
+"""
+
+def _lock_follow_users(cursor, follower_id, followed_id):
+    cursor.execute(LOCK_FOLLOW_USERS_SQL, (follower_id, followed_id))
+
+def _bump_follow_counts(cursor, follower_id, followed_id, delta):
+    cursor.execute(BUMP_FOLLOW_COUNTS_SQL, (follower_id, delta, followed_id, delta, follower_id, followed_id))
+
+def follow_list_query(direction, user_id, viewer_id=None, state=None, limit=None):
+    """SQL and params of a follower/following list, newest follow first.
+
+    With ``viewer_id`` each row's ``is_following`` is probed in the same query;
+    without it the flag is 0, to be filled in from the social graph.
+    """
+    match_column, user_column, _ = FOLLOW_LISTS[direction]
+    flag_sql, join_sql, params = "0", "", []
+    if viewer_id:
+        flag_sql = "f2.id IS NOT NULL"
+        join_sql = "LEFT JOIN follows f2 ON f2.follower_id = %s AND f2.followed_id = u.id"
+        params.append(viewer_id)
+    sql = f"""
+        SELECT f.id AS follow_id, f.created_at AS followed_at,
+               u.id, u.username, u.nickname, u.avatar_url, {flag_sql} AS is_following
+        FROM follows f
+        JOIN users u ON u.id = f.{user_column}
+        {join_sql}
+        WHERE f.{match_column} = %s
+    """
+    params.append(user_id)
+    return keyset_query([sql], params, state, limit, 'f.created_at', 'f.id')
+
+def follow_rows_query(direction, follow_ids):
+    """SQL and params of the users behind ``follow_ids``, by primary key."""
+    _, user_column, _ = FOLLOW_LISTS[direction]
+    placeholders = ", ".join(["%s"] * len(follow_ids))
+    sql = f"""
+        SELECT f.id AS follow_id, f.created_at AS followed_at,
+               u.id, u.username, u.nickname, u.avatar_url
+        FROM follows f
+        JOIN users u ON u.id = f.{user_column}
+        WHERE f.id IN ({placeholders})
+    """
+    return sql, tuple(follow_ids)
+
+def _follow_list(direction, user_id, current_user_id):
+    """Every user of a follower/following list, newest follow first."""
+    entries = getattr(social_graph, direction)(user_id)
+    if entries is not None:
+        users = AuthService.get_users_by_ids([uid for _, uid in entries])
+        rows = [dict(users[uid]) for _, uid in entries if uid in users]
+        _set_follow_flags(rows, current_user_id)
+        return rows
+
+    with db.connection() as conn:
+        if not conn:
+            return []
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(*follow_list_query(direction, user_id, current_user_id))
+                rows = cursor.fetchall()
+        except Exception as e:
+            print(f"Error fetching {direction}: {e}")
+            return []
+
+    for row in rows:
+        row['is_following'] = int(row['is_following'])
+        del row['follow_id'], row['followed_at']
+    return rows
+
+def _follow_page(direction, user_id, current_user_id, limit, cursor):
+    """One keyset page of a follower/following list, newest follow first."""
+    limit = FOLLOW_PAGE_SIZE if limit is None else limit
+    if not 1 <= limit <= MAX_BATCH_IDS:
+        raise ValueError(f"limit must be between 1 and {MAX_BATCH_IDS}")
+    state = decode_cursor(cursor) if cursor else {}
+    if state and not isinstance(state.get('i'), int):
+        raise ValueError("无效的分页游标")
+    count_column = FOLLOW_LISTS[direction][2]
+
+    # The graph picks the page's follows; only their rows are read, by primary key
+    entries = getattr(social_graph, direction)(user_id, before=state.get('i'), limit=limit)
+    if entries is None:
+        statements = [follow_list_query(direction, user_id, current_user_id, state, limit)]
+    elif entries:
+        statements = [follow_rows_query(direction, [follow_id for follow_id, _ in entries])]
+    else:
+        statements = []
+    statements.append((f"SELECT {count_column} AS total FROM users WHERE id = %s", (user_id,)))
+
+    with db.connection(batch=True) as conn:
+        if not conn:
+            return {'users': [], 'next_cursor': None, 'total': 0}
+        try:
+            with conn.cursor() as db_cursor:
+                *results, total_rows = fetch_batch(db_cursor, statements)
+        except Exception as e:
+            print(f"Error fetching {direction} page: {e}")
+            return {'users': [], 'next_cursor': None, 'total': 0}
+
+    rows = results[0] if results else []
+    if entries is not None:
+        # In the graph's order; a follow removed since the graph answered is skipped
+        by_follow = {row['follow_id']: row for row in rows}
+        rows = [by_follow[follow_id] for follow_id, _ in entries if follow_id in by_follow]
+        _set_follow_flags(rows, current_user_id)
+    next_cursor = None
+    page_size = len(rows) if entries is None else len(entries)
+    if page_size == limit and rows:
+        next_cursor = encode_cursor(keyset_state(rows[-1]['followed_at'], rows[-1]['follow_id']))
+    for row in rows:
+        row['is_following'] = int(row['is_following'])
+        del row['follow_id']
+    total = total_rows[0]['total'] if total_rows else 0
+    return {'users': rows, 'next_cursor': next_cursor, 'total': total}
+
+def _set_follow_flags(rows, viewer_id):
+    # From the graph, or from follows when it can't answer
+    ids = [row['id'] for row in rows]
+    states = {}
+    for start in range(0, len(ids), MAX_BATCH_IDS):
+        states.update(UserService.get_following_states(viewer_id, ids[start:start + MAX_BATCH_IDS]))
+    for row in rows:
+        row['is_following'] = int(states.get(row['id'], False))
 
 class UserService:
     @staticmethod
@@ -7,144 +167,166 @@ class UserService:
         if follower_id == followed_id:
             return False, "Cannot follow yourself"
             
-        conn = db.get_connection()
-        if not conn:
-            return False, "Database connection failed"
+        with db.connection() as conn:
+            if not conn:
+                return False, "Database connection failed"
             
-        try:
-            with conn.cursor() as cursor:
-                # Check if already following
-                sql_check = "SELECT id FROM follows WHERE follower_id = %s AND followed_id = %s"
-                cursor.execute(sql_check, (follower_id, followed_id))
-                if cursor.fetchone():
-                    return False, "Already following"
-                
-                sql = "INSERT INTO follows (follower_id, followed_id) VALUES (%s, %s)"
-                cursor.execute(sql, (follower_id, followed_id))
+            try:
+                with conn.cursor() as cursor:
+                    # The follows row and both users' counts are written together
+                    conn.begin()
+                    _lock_follow_users(cursor, follower_id, followed_id)
+                    sql = """
+                        INSERT INTO follows (follower_id, followed_id) VALUES (%s, %s)
+                        ON DUPLICATE KEY UPDATE id = id
+                    """
+                    cursor.execute(sql, (follower_id, followed_id))
+                    if cursor.rowcount != 1:
+                        conn.rollback()
+                        return False, "Already following"
+                    follow_id = cursor.lastrowid
+                    cursor.execute(INSERT_FOLLOW_EVENT_SQL, (follower_id, followed_id, follow_id))
+                    event_id = cursor.lastrowid
+                    _bump_follow_counts(cursor, follower_id, followed_id, 1)
+                    conn.commit()
+                social_graph.add(follower_id, followed_id, follow_id, event_id)
+                notification_queue.enqueue('follow', follower_id, receiver_id=followed_id)
                 return True, "Followed successfully"
-        except Exception as e:
-            return False, f"Failed to follow: {str(e)}"
+            except Exception as e:
+                conn.rollback()
+                return False, f"Failed to follow: {str(e)}"
 
     @staticmethod
     def unfollow_user(follower_id, followed_id):
         """Unfollow a user."""
-        conn = db.get_connection()
-        if not conn:
-            return False, "Database connection failed"
+        with db.connection() as conn:
+            if not conn:
+                return False, "Database connection failed"
             
-        try:
-            with conn.cursor() as cursor:
-                sql = "DELETE FROM follows WHERE follower_id = %s AND followed_id = %s"
-                cursor.execute(sql, (follower_id, followed_id))
+            try:
+                with conn.cursor() as cursor:
+                    conn.begin()
+                    _lock_follow_users(cursor, follower_id, followed_id)
+                    sql = "DELETE FROM follows WHERE follower_id = %s AND followed_id = %s"
+                    cursor.execute(sql, (follower_id, followed_id))
+                    removed = cursor.rowcount
+                    if removed:
+                        cursor.execute(INSERT_FOLLOW_EVENT_SQL, (follower_id, followed_id, None))
+                        event_id = cursor.lastrowid
+                        _bump_follow_counts(cursor, follower_id, followed_id, -1)
+                    conn.commit()
+                if removed:
+                    social_graph.remove(follower_id, followed_id, event_id)
                 return True, "Unfollowed successfully"
-        except Exception as e:
-            return False, f"Failed to unfollow: {str(e)}"
+            except Exception as e:
+                conn.rollback()
+                return False, f"Failed to unfollow: {str(e)}"
 
     @staticmethod
     def is_following(follower_id, followed_id):
         """Check if a user is following another user."""
-        conn = db.get_connection()
-        if not conn:
-            return False
+        state = social_graph.is_following(follower_id, followed_id)
+        if state is not None:
+            return state
+        with db.connection() as conn:
+            if not conn:
+                return False
             
-        try:
-            with conn.cursor() as cursor:
-                sql = "SELECT id FROM follows WHERE follower_id = %s AND followed_id = %s"
-                cursor.execute(sql, (follower_id, followed_id))
-                return bool(cursor.fetchone())
-        except Exception as e:
-            print(f"Error checking follow status: {e}")
-            return False
+            try:
+                with conn.cursor() as cursor:
+                    sql = "SELECT id FROM follows WHERE follower_id = %s AND followed_id = %s"
+                    cursor.execute(sql, (follower_id, followed_id))
+                    return bool(cursor.fetchone())
+            except Exception as e:
+                print(f"Error checking follow status: {e}")
+                return False
+
+    @staticmethod
+    def get_following_states(follower_id, user_ids):
+        """Which of ``user_ids`` ``follower_id`` follows, in one query.
+
+        Returns ``{user_id: bool}`` for every requested id. Raises ValueError
+        for too many ids.
+        """
+        user_ids = unique_ids(user_ids)
+        states = {uid: False for uid in user_ids}
+        if not follower_id or not user_ids:
+            return states
+        cached = social_graph.following_states(follower_id, user_ids)
+        if cached is not None:
+            return cached
+
+        with db.connection() as conn:
+            if not conn:
+                return states
+            try:
+                with conn.cursor() as cursor:
+                    placeholders = ", ".join(["%s"] * len(user_ids))
+                    sql = f"SELECT followed_id FROM follows WHERE follower_id = %s AND followed_id IN ({placeholders})"
+                    cursor.execute(sql, (follower_id, *user_ids))
+                    for row in cursor.fetchall():
+                        states[row['followed_id']] = True
+            except Exception as e:
+                print(f"Error checking follow states: {e}")
+        return states
 
     @staticmethod
     def get_followers(user_id, current_user_id=None):
         """Get list of followers for a user."""
-        conn = db.get_connection()
-        if not conn:
-            return []
-            
-        try:
-            with conn.cursor() as cursor:
-                if current_user_id:
-                    sql = """
-                        SELECT u.id, u.username, u.nickname, u.avatar_url,
-                        CASE WHEN f2.id IS NOT NULL THEN 1 ELSE 0 END as is_following
-                        FROM follows f
-                        JOIN users u ON f.follower_id = u.id
-                        LEFT JOIN follows f2 ON f2.follower_id = %s AND f2.followed_id = u.id
-                        WHERE f.followed_id = %s
-                        ORDER BY f.created_at DESC
-                    """
-                    cursor.execute(sql, (current_user_id, user_id))
-                else:
-                    sql = """
-                        SELECT u.id, u.username, u.nickname, u.avatar_url,
-                        0 as is_following
-                        FROM follows f
-                        JOIN users u ON f.follower_id = u.id
-                        WHERE f.followed_id = %s
-                        ORDER BY f.created_at DESC
-                    """
-                    cursor.execute(sql, (user_id,))
-                return cursor.fetchall()
-        except Exception as e:
-            print(f"Error fetching followers: {e}")
-            return []
+        return _follow_list('followers', user_id, current_user_id)
 
     @staticmethod
     def get_following(user_id, current_user_id=None):
         """Get list of users a user is following."""
-        conn = db.get_connection()
-        if not conn:
-            return []
-            
-        try:
-            with conn.cursor() as cursor:
-                if current_user_id:
-                    sql = """
-                        SELECT u.id, u.username, u.nickname, u.avatar_url,
-                        CASE WHEN f2.id IS NOT NULL THEN 1 ELSE 0 END as is_following
-                        FROM follows f
-                        JOIN users u ON f.followed_id = u.id
-                        LEFT JOIN follows f2 ON f2.follower_id = %s AND f2.followed_id = u.id
-                        WHERE f.follower_id = %s
-                        ORDER BY f.created_at DESC
-                    """
-                    cursor.execute(sql, (current_user_id, user_id))
-                else:
-                    sql = """
-                        SELECT u.id, u.username, u.nickname, u.avatar_url,
-                        0 as is_following
-                        FROM follows f
-                        JOIN users u ON f.followed_id = u.id
-                        WHERE f.follower_id = %s
-                        ORDER BY f.created_at DESC
-                    """
-                    cursor.execute(sql, (user_id,))
-                return cursor.fetchall()
-        except Exception as e:
-            print(f"Error fetching following: {e}")
-            return []
-    
+        return _follow_list('following', user_id, current_user_id)
+
+    @staticmethod
+    def get_mutual_follows(user_id):
+        """Users that follow ``user_id`` and are followed back, in id order."""
+        ids = social_graph.mutuals(user_id)
+        if ids is None:
+            with db.connection() as conn:
+                if not conn:
+                    return []
+                try:
+                    with conn.cursor() as cursor:
+                        cursor.execute(MUTUALS_SQL, (user_id,))
+                        ids = [row['id'] for row in cursor.fetchall()]
+                except Exception as e:
+                    print(f"Error fetching mutual follows: {e}")
+                    return []
+        users = AuthService.get_users_by_ids(ids)
+        return [users[uid] for uid in ids if uid in users]
+
+    @staticmethod
+    def get_followers_page(user_id, current_user_id=None, limit=None, cursor=None):
+        """One page of a user's followers, most recent first.
+
+        Returns ``{'users': [...], 'next_cursor': str or None, 'total': int}``;
+        each user carries the viewer's ``is_following`` flag. Raises ValueError
+        for a malformed cursor or an out-of-range ``limit``.
+        """
+        return _follow_page('followers', user_id, current_user_id, limit, cursor)
+
+    @staticmethod
+    def get_following_page(user_id, current_user_id=None, limit=None, cursor=None):
+        """One page of the users a user follows; see ``get_followers_page``."""
+        return _follow_page('following', user_id, current_user_id, limit, cursor)
+
     @staticmethod
     def get_follow_counts(user_id):
-        """Get follower and following counts."""
-        conn = db.get_connection()
-        if not conn:
-            return {'followers': 0, 'following': 0}
+        """Get follower and following counts (maintained on the users row)."""
+        with db.connection() as conn:
+            if not conn:
+                return {'followers': 0, 'following': 0}
             
-        try:
-            with conn.cursor() as cursor:
-                # Count followers
-                cursor.execute("SELECT COUNT(*) as count FROM follows WHERE followed_id = %s", (user_id,))
-                followers = cursor.fetchone()['count']
-                
-                # Count following
-                cursor.execute("SELECT COUNT(*) as count FROM follows WHERE follower_id = %s", (user_id,))
-                following = cursor.fetchone()['count']
-                
-                return {'followers': followers, 'following': following}
-        except Exception as e:
-            print(f"Error counting follows: {e}")
-            return {'followers': 0, 'following': 0}
-
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT follower_count, following_count FROM users WHERE id = %s", (user_id,))
+                    row = cursor.fetchone()
+                    if not row:
+                        return {'followers': 0, 'following': 0}
+                    return {'followers': row['follower_count'], 'following': row['following_count']}
+            except Exception as e:
+                print(f"Error counting follows: {e}")
+                return {'followers': 0, 'following': 0}
@@ -1,11 +1,104 @@
 import os
+import tempfile
 import uuid
+from collections import namedtuple
 from PIL import Image
 
 IMAGE_DIR = "assets"
 MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB (Increased from 10MB)
 ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
 ALLOWED_MIME_TYPES = {'image/jpeg', 'image/png', 'image/gif', 'image/webp'}
+MAX_BATCH_IDS = 100  # 批量查询（如点赞/关注状态）一次最多的 ID 数
+ALLOWED_VIDEO_EXTENSIONS = {'.mp4', '.mov', '.webm'}
+MAX_VIDEO_SIZE = 10 * 1024 * 1024 * 1024  # 10GB
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 上传按 1MB 分块读取、检查大小并写入，内存占用与文件大小无关
+HEADER_SIZE = 16  # 识别文件类型只需要的文件头字节数
+
+EXT_TO_IMAGE_TYPE = {'.jpg': 'jpeg', '.jpeg': 'jpeg', '.png': 'png', '.gif': 'gif', '.webp': 'webp'}
+
+# 上传时为每张图片生成的缩略图宽度：头像 64、卡片 320、详情页 1080
+VARIANT_WIDTHS = (64, 320, 1080)
+# format -> (file extension, Pillow encoder, encoder options)
+VARIANT_FORMATS = {
+    'jpeg': ('.jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('.webp', 'WEBP', {'quality': 80, 'method': 4}),
+}
+
+# A file written to IMAGE_DIR: its path and size in bytes
+StoredFile = namedtuple('StoredFile', ['path', 'size'])
+# A downscaled copy of an image: its width tier, format ('jpeg' / 'webp'), path and size in bytes
+ImageVariant = namedtuple('ImageVariant', ['width', 'format', 'path', 'size'])
+
+def unique_ids(ids, limit=MAX_BATCH_IDS):
+    """Distinct integer ids in input order. Raises ValueError above ``limit``."""
+    result = list(dict.fromkeys(int(i) for i in ids or []))
+    if len(result) > limit:
+        raise ValueError(f"一次最多查询{limit}个ID")
+    return result
+
+def sniff_image_type(header):
+    """Image type from the first bytes of a file ('jpeg', 'png', 'gif', 'webp'), or None."""
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+def sniff_video_type(header):
+    """Container of a video from its first bytes ('mp4', 'webm'), or None."""
+    if header[4:8] in (b'ftyp', b'moov', b'mdat', b'wide', b'free'):
+        return 'mp4'  # ISO base media: .mp4 and .mov
+    if header.startswith(b'\x1a\x45\xdf\xa3'):
+        return 'webm'
+    return None
+
+def _read_header(uploaded_file):
+    uploaded_file.file.seek(0)
+    header = uploaded_file.file.read(HEADER_SIZE)
+    uploaded_file.file.seek(0)
+    return header
+
+def _upload_size(uploaded_file):
+    """Size of a seekable upload without reading it."""
+    uploaded_file.file.seek(0, 2)
+    size = uploaded_file.file.tell()
+    uploaded_file.file.seek(0)
+    return size
+
+def stream_to_file(source, file_path, max_size, chunk_size=UPLOAD_CHUNK_SIZE):
+    """Copy ``source`` to ``file_path`` in chunks.
+
+    Writes to a temporary file in the same directory and renames it into place
+    only once the copy is complete, so readers never see a partial file.
+    Raises ValueError as soon as more than ``max_size`` bytes were read.
+    Returns a ``StoredFile``.
+    """
+    directory = os.path.dirname(file_path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.upload-', suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise ValueError(f"文件大小不能超过 {max_size // (1024*1024)}MB")
+                out.write(chunk)
+        if size == 0:
+            raise ValueError("文件不能为空")
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return StoredFile(file_path, size)
 
 def validate_image_file(uploaded_file):
     """Validate uploaded image file."""
@@ -18,56 +111,38 @@ def validate_image_file(uploaded_file):
     if file_ext not in ALLOWED_EXTENSIONS:
         return False, f"不支持的文件类型，仅支持: {', '.join(ALLOWED_EXTENSIONS)}"
     
-    # 检查文件大小
-    file_content = uploaded_file.file.read()
-    uploaded_file.file.seek(0)  # 重置文件指针
-    
-    if len(file_content) > MAX_FILE_SIZE:
+    # 检查文件大小（不读取内容）
+    size = _upload_size(uploaded_file)
+    if size > MAX_FILE_SIZE:
         return False, f"图片大小不能超过 {MAX_FILE_SIZE // (1024*1024)}MB"
-    
-    if len(file_content) == 0:
+    if size == 0:
         return False, "文件不能为空"
-    
-    # 验证文件内容（检查是否为真实图片）
+
+    # 检查MIME类型
+    if hasattr(uploaded_file, 'content_type') and uploaded_file.content_type:
+        if uploaded_file.content_type not in ALLOWED_MIME_TYPES:
+            return False, "文件类型不匹配"
+
+    # 按文件头识别真实格式，并验证扩展名与内容匹配
+    image_type = sniff_image_type(_read_header(uploaded_file))
+    if not image_type:
+        return False, "无法识别图片格式"
+    if image_type != EXT_TO_IMAGE_TYPE.get(file_ext):
+        return False, "文件扩展名与内容不匹配"
+
+    # 验证文件内容（PIL 从文件对象流式读取，不整体载入内存）
     try:
-        # 使用PIL验证图片
         img = Image.open(uploaded_file.file)
         img.verify()
-        
-        # 使用 format 进行格式检查
-        image_type = img.format.lower() if img.format else None
-        
-        uploaded_file.file.seek(0)  # 重置文件指针
-        
-        # 检查MIME类型
-        if hasattr(uploaded_file, 'content_type') and uploaded_file.content_type:
-            if uploaded_file.content_type not in ALLOWED_MIME_TYPES:
-                return False, "文件类型不匹配"
-        
-        if not image_type:
-            return False, "无法识别图片格式"
-        
-        # 验证扩展名与内容匹配
-        ext_to_type = {
-            '.jpg': 'jpeg', '.jpeg': 'jpeg',
-            '.png': 'png',
-            '.gif': 'gif',
-            '.webp': 'webp'
-        }
-        expected_type = ext_to_type.get(file_ext)
-        if expected_type and image_type != expected_type:
-            return False, "文件扩展名与内容不匹配"
-            
     except Exception as e:
         return False, f"无效的图片文件: {str(e)}"
+    finally:
+        uploaded_file.file.seek(0)  # 重置文件指针
     
     return True, "验证通过"
 
 def validate_video_file(uploaded_file):
     """Validate uploaded video file."""
-    ALLOWED_VIDEO_EXTENSIONS = {'.mp4', '.mov', '.webm'}
-    MAX_VIDEO_SIZE = 10 * 1024 * 1024 * 1024  # 10GB
-
     if not uploaded_file.filename:
         return False, "文件名不能为空"
     
@@ -76,36 +151,32 @@ def validate_video_file(uploaded_file):
         return False, f"不支持的视频类型，仅支持: {', '.join(ALLOWED_VIDEO_EXTENSIONS)}"
     
     # Check file size
-    uploaded_file.file.seek(0, 2) # Seek to end
-    size = uploaded_file.file.tell()
-    uploaded_file.file.seek(0) # Reset
-
+    size = _upload_size(uploaded_file)
     if size > MAX_VIDEO_SIZE:
         return False, f"视频大小不能超过 {MAX_VIDEO_SIZE // (1024*1024*1024)}GB"
     
     if size == 0:
         return False, "文件不能为空"
 
+    expected = 'webm' if file_ext == '.webm' else 'mp4'
+    if sniff_video_type(_read_header(uploaded_file)) != expected:
+        return False, "文件扩展名与内容不匹配"
+
     return True, "验证通过"
 
 def save_video(uploaded_file):
-    """Save uploaded video to assets directory."""
+    """Save uploaded video to assets directory, streaming it in chunks."""
     is_valid, message = validate_video_file(uploaded_file)
     if not is_valid:
         raise ValueError(message)
 
-    if not os.path.exists(IMAGE_DIR):
-        os.makedirs(IMAGE_DIR)
-
     file_ext = os.path.splitext(uploaded_file.filename)[1].lower()
     unique_filename = f"{uuid.uuid4()}{file_ext}"
     file_path = os.path.join(IMAGE_DIR, unique_filename)
 
     uploaded_file.file.seek(0)
-    with open(file_path, "wb") as f:
-        f.write(uploaded_file.file.read())
-    
-    return file_path
+    # The size limit is enforced again while copying: the client may send more than it declared
+    return stream_to_file(uploaded_file.file, file_path, MAX_VIDEO_SIZE).path
 
 def save_image(uploaded_file):
     """Save uploaded image to assets directory and return the path."""
@@ -114,9 +185,6 @@ def save_image(uploaded_file):
     if not is_valid:
         raise ValueError(message)
     
-    if not os.path.exists(IMAGE_DIR):
-        os.makedirs(IMAGE_DIR)
-    
     # 使用安全的文件名（只保留扩展名）
     file_ext = os.path.splitext(uploaded_file.filename)[1].lower()
     # 确保扩展名在允许列表中
@@ -128,24 +196,104 @@ def save_image(uploaded_file):
     
     # 重新打开并保存图片（确保是有效图片）
     try:
-        img = Image.open(uploaded_file.file)
-        # 转换为RGB模式（处理RGBA等）
-        if img.mode in ('RGBA', 'LA', 'P'):
-            rgb_img = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            rgb_img.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-            img = rgb_img
-        elif img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        # 保存图片
-        img.save(file_path, 'JPEG', quality=85, optimize=True)
-        return file_path
+        img = _to_rgb(Image.open(uploaded_file.file))
+        # 保存图片（先写临时文件再原子重命名）
+        save_atomic(img, file_path, 'JPEG', quality=85, optimize=True)
     except Exception as e:
         # 如果处理失败，尝试直接保存
         uploaded_file.file.seek(0)
-        with open(file_path, "wb") as f:
-            f.write(uploaded_file.file.read())
+        return stream_to_file(uploaded_file.file, file_path, MAX_FILE_SIZE).path
+
+    # Thumbnails are best effort: the original is already in place
+    try:
+        make_variants(img, file_path)
+    except Exception as e:
+        print(f"Warning: Failed to create variants of {file_path}: {e}")
+    return file_path
+
+def _to_rgb(img):
+    """``img`` as RGB, flattening transparency onto white."""
+    if img.mode in ('RGBA', 'LA', 'P'):
+        rgb_img = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        rgb_img.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        return rgb_img
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+def variant_path(file_path, width, fmt):
+    """Path of the ``width``/``fmt`` variant of ``file_path``, e.g. ``assets/x_w320.webp``."""
+    return f"{os.path.splitext(file_path)[0]}_w{width}{VARIANT_FORMATS[fmt][0]}"
+
+def make_variants(img, file_path, widths=VARIANT_WIDTHS):
+    """Write JPEG and WebP copies of ``img`` at each width next to ``file_path``.
+
+    Never upscales: the first width at or above the source width is encoded at
+    the source size and wider tiers are skipped. Each tier is resized from the
+    next larger one, so the full-size image is only resampled once.
+    Returns a list of ``ImageVariant``.
+    """
+    img = _to_rgb(img)
+    tiers = []
+    for width in sorted(widths):
+        tiers.append(width)
+        if width >= img.width:
+            break
+
+    variants = []
+    current = img
+    for width in reversed(tiers):
+        if width < current.width:
+            height = max(1, round(current.height * width / current.width))
+            current = current.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+        for fmt, (_, encoder, params) in VARIANT_FORMATS.items():
+            path = variant_path(file_path, width, fmt)
+            save_atomic(current, path, encoder, **params)
+            variants.append(ImageVariant(width, fmt, path, os.path.getsize(path)))
+    variants.sort(key=lambda v: (v.width, v.format))
+    return variants
+
+def list_variants(file_path):
+    """``ImageVariant``s of ``file_path`` that exist on disk, narrowest first."""
+    variants = []
+    for width in VARIANT_WIDTHS:
+        for fmt in VARIANT_FORMATS:
+            path = variant_path(file_path, width, fmt)
+            try:
+                variants.append(ImageVariant(width, fmt, path, os.path.getsize(path)))
+            except OSError:
+                continue
+    return variants
+
+def resolve_variant(file_path, width=None, fmt='jpeg'):
+    """Path to serve for ``file_path`` displayed ``width`` pixels wide.
+
+    The narrowest existing ``fmt`` variant at least ``width`` wide, or the
+    original when no width is given, the request is wider than every tier or
+    the image has no variants (uploaded before they existed).
+    """
+    if not width or not file_path:
         return file_path
+    for tier in VARIANT_WIDTHS:
+        if tier >= width:
+            path = variant_path(file_path, tier, fmt)
+            if os.path.exists(path):
+                return path
+    return file_path
+
+def save_atomic(img, file_path, format, **params):
+    """Encode ``img`` to a temporary file next to ``file_path``, then rename it into place."""
+    directory = os.path.dirname(file_path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.upload-', suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            img.save(out, format, **params)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
 
@@ -0,0 +1,122 @@
+"""
+Benchmark: latency of the FastAPI routes with blocking vs. awaited service calls.
+
+Starts ``server.app`` under uvicorn in a child process, drives it with many
+concurrent HTTP clients and reports p50/p99 latency for two modes:
+
+* ``blocking`` - service methods run inline on the event loop (the old behaviour)
+* ``async``    - service methods are awaited through ``backend.async_service``
+
+By default the database is simulated by a ``time.sleep`` of ``--query-ms`` inside
+``PostService.get_posts`` so the benchmark runs without MySQL; pass ``--real-db``
+to hit the database configured in ``.env`` instead.
+
+Usage:
+    python benchmarks/bench_async_routes.py --clients 200 --requests 5
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import httpx
+
+def serve(mode, port, query_ms, real_db):
+    """Child process: run the API with the requested service call mode."""
+    import uvicorn
+    from backend import async_service
+    from backend.post_service import PostService
+    from server import app
+
+    if not real_db:
+        def fake_get_posts(*_args, **_kwargs):
+            time.sleep(query_ms / 1000)
+            return []
+        PostService.get_posts = staticmethod(fake_get_posts)
+
+    if mode == "blocking":
+        async def inline(func, *args, **kwargs):
+            return func(*args, **kwargs)
+        async_service.run_in_db_executor = inline
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning",
+                access_log=False, timeout_keep_alive=120)
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server did not start on port {port}")
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+async def run_clients(base_url, clients, requests_per_client):
+    latencies = []
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=300) as client:
+        async def worker():
+            for _ in range(requests_per_client):
+                start = time.perf_counter()
+                response = await client.get("/api/posts", params={"category": "美食"})
+                latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+    return latencies, elapsed
+
+def report(mode, latencies, elapsed):
+    print(
+        f"{mode:>8}: n={len(latencies)} "
+        f"p50={statistics.median(latencies) * 1000:.1f}ms "
+        f"p99={percentile(latencies, 99) * 1000:.1f}ms "
+        f"max={max(latencies) * 1000:.1f}ms "
+        f"throughput={len(latencies) / elapsed:.1f} req/s"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=5, help='requests per client')
+    parser.add_argument('--query-ms', type=float, default=20.0, help='simulated query time')
+    parser.add_argument('--real-db', action='store_true', help='query MySQL instead of simulating it')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--serve', choices=['blocking', 'async'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.query_ms, args.real_db)
+        return
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    for mode in ("blocking", "async"):
+        cmd = [sys.executable, os.path.abspath(__file__), '--serve', mode,
+               '--port', str(args.port), '--query-ms', str(args.query_ms)]
+        if args.real_db:
+            cmd.append('--real-db')
+        server = subprocess.Popen(cmd, cwd=ROOT)
+        try:
+            wait_for_port(args.port)
+            latencies, elapsed = asyncio.run(run_clients(base_url, args.clients, args.requests))
+            report(mode, latencies, elapsed)
+        finally:
+            server.terminate()
+            server.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark: bytes served per feed page, full-size uploads vs. thumbnail variants.
+
+Generates ``--posts`` synthetic photo-like covers (``--width`` px wide, 3:4)
+and as many avatars, stores each through ``save_image`` into a scratch
+directory (which also writes the 64/320/1080 JPEG and WebP variants), then
+sums the bytes one feed page downloads - one cover and one avatar per card -
+the way ``GET /assets/{filename}`` resolves them:
+
+* ``original`` - no ``w`` parameter, the full-size upload (the old behaviour)
+* ``jpeg``     - ``?w=320`` for covers and ``?w=64`` for avatars, JPEG
+* ``webp``     - the same widths for a client that sends ``Accept: image/webp``
+
+No database is needed.
+
+Usage:
+    python benchmarks/bench_image_variants.py --posts 20 --width 3024
+"""
+import argparse
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from PIL import Image, ImageFilter
+from backend import utils
+from backend.utils import resolve_variant, save_image
+
+CARD_WIDTH = 320
+AVATAR_WIDTH = 64
+
+def photo(width, height):
+    """JPEG bytes of a smooth random image with some grain, so it compresses like a photo."""
+    small = Image.new('RGB', (16, 12))
+    small.putdata([tuple(random.randrange(256) for _ in range(3)) for _ in range(16 * 12)])
+    img = small.resize((width, height), Image.BICUBIC)
+    noise = Image.effect_noise((width, height), 24).convert('RGB')
+    img = Image.blend(img, noise, 0.12).filter(ImageFilter.SMOOTH)
+    buf = io.BytesIO()
+    img.save(buf, format='JPEG', quality=92)
+    return buf.getvalue()
+
+def upload(data):
+    return SimpleNamespace(filename='photo.jpg', file=io.BytesIO(data), content_type='image/jpeg')
+
+def page_bytes(posts, cover_width=None, avatar_width=None, fmt='jpeg'):
+    total = 0
+    for cover, avatar in posts:
+        total += os.path.getsize(resolve_variant(cover, cover_width, fmt))
+        total += os.path.getsize(resolve_variant(avatar, avatar_width, fmt))
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--posts', type=int, default=20, help='cards per feed page')
+    parser.add_argument('--width', type=int, default=3024, help='width of the uploaded covers')
+    parser.add_argument('--avatar-width', type=int, default=800, help='width of the uploaded avatars')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    scratch = tempfile.mkdtemp(prefix='bench-variants-')
+    utils.IMAGE_DIR = scratch
+    try:
+        posts, upload_ms = [], []
+        for _ in range(args.posts):
+            cover_data = photo(args.width, args.width * 4 // 3)
+            avatar_data = photo(args.avatar_width, args.avatar_width)
+            start = time.perf_counter()
+            cover = save_image(upload(cover_data))
+            upload_ms.append((time.perf_counter() - start) * 1000)
+            posts.append((cover, save_image(upload(avatar_data))))
+
+        original = page_bytes(posts)
+        print(f"{args.posts} cards, covers {args.width}px wide, avatars {args.avatar_width}px")
+        print(f"save_image with variants: {sum(upload_ms) / len(upload_ms):.0f}ms per cover")
+        print(f"{'variant':<10}{'bytes/page':>14}{'vs original':>14}")
+        print(f"{'original':<10}{original:>14,}{'1.00x':>14}")
+        for fmt in ('jpeg', 'webp'):
+            served = page_bytes(posts, CARD_WIDTH, AVATAR_WIDTH, fmt)
+            print(f"{fmt:<10}{served:>14,}{served / original:>13.3f}x")
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
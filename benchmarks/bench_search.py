@@ -0,0 +1,108 @@
+"""
+Benchmark: LIKE scan vs. ngram FULLTEXT search over a large posts corpus.
+
+Builds a scratch table ``bench_search_posts`` in the database configured in
+``.env`` (same columns and FULLTEXT indexes as ``posts``), fills it with
+synthetic Chinese posts and times both query forms used by the app:
+
+* ``like``     - ``title LIKE %q% OR content LIKE %q%`` (the old search)
+* ``fulltext`` - ``MATCH(title, content) AGAINST (... IN BOOLEAN MODE)`` ranked by relevance
+
+Usage:
+    python benchmarks/bench_search.py --rows 1000000
+    python benchmarks/bench_search.py --reuse          # skip re-populating the table
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.database import db
+from backend.search_service import TITLE_WEIGHT, build_boolean_query, search_terms
+
+TABLE = "bench_search_posts"
+WORDS = [
+    "穿搭", "美食", "彩妆", "旅行", "健身", "咖啡", "探店", "周末", "通勤", "早餐",
+    "护肤", "口红", "露营", "海边", "攻略", "收纳", "装修", "职场", "面试", "读书",
+    "电影", "追剧", "游戏", "猫咪", "狗狗", "烘焙", "火锅", "奶茶", "平价", "好物",
+    "分享", "推荐", "日常", "教程", "新手", "宝藏", "小众", "复古", "极简", "秋冬",
+]
+QUERIES = ["穿搭", "火锅 攻略", "小众 宝藏 咖啡", "复古穿搭", "露营"]
+
+def random_text(words):
+    return "".join(random.choice(WORDS) + random.choice("，。！ ") for _ in range(words))
+
+def populate(cursor, rows, batch=5000):
+    cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    cursor.execute(f"""
+        CREATE TABLE {TABLE} (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            title VARCHAR(100) NOT NULL,
+            content TEXT,
+            is_private BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """)
+    start = time.perf_counter()
+    for offset in range(0, rows, batch):
+        values = [(random_text(4)[:100], random_text(40)) for _ in range(min(batch, rows - offset))]
+        cursor.executemany(f"INSERT INTO {TABLE} (title, content) VALUES (%s, %s)", values)
+        print(f"\rinserted {offset + len(values)}/{rows}", end="", flush=True)
+    print(f"\npopulated in {time.perf_counter() - start:.1f}s, building FULLTEXT indexes...")
+    start = time.perf_counter()
+    cursor.execute(f"ALTER TABLE {TABLE} ADD FULLTEXT INDEX ft_title_content (title, content) WITH PARSER ngram")
+    cursor.execute(f"ALTER TABLE {TABLE} ADD FULLTEXT INDEX ft_title (title) WITH PARSER ngram")
+    print(f"indexes built in {time.perf_counter() - start:.1f}s")
+
+def time_query(cursor, sql, params, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cursor.execute(sql, params)
+        cursor.fetchall()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--reuse', action='store_true', help='reuse an already populated table')
+    args = parser.parse_args()
+
+    conn = db.get_connection()
+    if not conn:
+        print("Failed to connect to database")
+        return 1
+    try:
+        with conn.cursor() as cursor:
+            if not args.reuse:
+                populate(cursor, args.rows)
+            print(f"{'query':<16}{'like (ms)':>12}{'fulltext (ms)':>16}{'speedup':>10}")
+            for query in QUERIES:
+                like = f"%{query}%"
+                like_ms = time_query(cursor, f"""
+                    SELECT id, title FROM {TABLE}
+                    WHERE is_private = FALSE AND (title LIKE %s OR content LIKE %s)
+                    ORDER BY created_at DESC LIMIT 20
+                """, (like, like), args.repeat) * 1000
+                boolean_query = build_boolean_query(search_terms(query))
+                fulltext_ms = time_query(cursor, f"""
+                    SELECT id, title,
+                           MATCH(title) AGAINST (%s IN BOOLEAN MODE) * %s
+                           + MATCH(title, content) AGAINST (%s IN BOOLEAN MODE) AS relevance
+                    FROM {TABLE}
+                    WHERE is_private = FALSE AND MATCH(title, content) AGAINST (%s IN BOOLEAN MODE)
+                    ORDER BY relevance DESC, id DESC LIMIT 20
+                """, (boolean_query, TITLE_WEIGHT, boolean_query, boolean_query), args.repeat) * 1000
+                print(f"{query:<16}{like_ms:>12.1f}{fulltext_ms:>16.1f}{like_ms / fulltext_ms:>9.1f}x")
+    finally:
+        conn.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
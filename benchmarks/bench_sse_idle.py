@@ -0,0 +1,159 @@
+"""
+Load test: hold many idle ``/api/stream`` (Server-Sent Events) connections.
+
+Starts ``server.app`` under uvicorn in a child process, opens ``--connections``
+streams in batches, keeps them open for ``--hold`` seconds and checks that every
+stream keeps receiving heartbeats. Reports connect time, server memory per
+connection and the hub's own connection count.
+
+No database is needed: the stream endpoint only touches the in-process hub.
+
+Usage:
+    python benchmarks/bench_sse_idle.py --connections 10000 --hold 30
+"""
+import argparse
+import asyncio
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import httpx
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+def serve(port):
+    """Child process: run the API."""
+    import uvicorn
+    from server import app
+
+    raise_fd_limit()
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning",
+                access_log=False, backlog=16384, timeout_keep_alive=120)
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server did not start on port {port}")
+
+def rss_mb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+class Stream:
+    """One raw SSE connection; counts heartbeats until closed."""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.heartbeats = 0
+        self.reader = None
+        self.writer = None
+
+    async def open(self, port):
+        self.reader, self.writer = await asyncio.open_connection("127.0.0.1", port)
+        self.writer.write(
+            f"GET /api/stream?user_id={self.user_id} HTTP/1.1\r\n"
+            f"Host: 127.0.0.1\r\nAccept: text/event-stream\r\n\r\n".encode()
+        )
+        await self.writer.drain()
+        # Wait for the 'ready' event so the subscription exists server-side
+        while b"event: ready" not in await self.reader.readline():
+            pass
+
+    async def listen(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    return
+                if line.startswith(b": ping"):
+                    self.heartbeats += 1
+        except (ConnectionError, asyncio.CancelledError):
+            return
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+
+async def run(port, connections, batch, hold):
+    streams = [Stream(user_id=i + 1) for i in range(connections)]
+    failures = 0
+    start = time.perf_counter()
+    for offset in range(0, connections, batch):
+        results = await asyncio.gather(
+            *(s.open(port) for s in streams[offset:offset + batch]), return_exceptions=True
+        )
+        failures += sum(isinstance(r, Exception) for r in results)
+    connect_seconds = time.perf_counter() - start
+    opened = [s for s in streams if s.writer and not s.writer.is_closing()]
+
+    listeners = [asyncio.create_task(s.listen()) for s in opened]
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}") as client:
+        hub_stats = (await client.get("/api/system/stream")).json()["hub"]
+    await asyncio.sleep(hold)
+    for task in listeners:
+        task.cancel()
+    for s in opened:
+        s.close()
+    await asyncio.gather(*listeners, return_exceptions=True)
+    alive = sum(1 for s in opened if s.heartbeats > 0)
+    return len(opened), failures, connect_seconds, alive, hub_stats
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--connections', type=int, default=10000)
+    parser.add_argument('--batch', type=int, default=500, help='connections opened concurrently')
+    parser.add_argument('--hold', type=float, default=30.0, help='seconds to hold the connections open')
+    parser.add_argument('--heartbeat', type=float, default=5.0, help='server heartbeat interval')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port)
+        return
+
+    fd_limit = raise_fd_limit()
+    if fd_limit < args.connections + 100:
+        print(f"warning: open file limit is {fd_limit}, lower than --connections {args.connections}")
+
+    env = dict(os.environ, SSE_HEARTBEAT_INTERVAL=str(args.heartbeat))
+    server = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--serve', '--port', str(args.port)], cwd=ROOT, env=env
+    )
+    try:
+        wait_for_port(args.port)
+        baseline = rss_mb(server.pid)
+        opened, failures, connect_seconds, alive, hub_stats = asyncio.run(
+            run(args.port, args.connections, args.batch, args.hold)
+        )
+        loaded = rss_mb(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+
+    per_conn_kb = (loaded - baseline) * 1024 / opened if opened else 0
+    print(f"opened={opened} failed={failures} connect_time={connect_seconds:.1f}s "
+          f"hub_connections={hub_stats['connections']}")
+    print(f"heartbeats: {alive}/{opened} streams alive after {args.hold:.0f}s")
+    print(f"server rss: {baseline:.0f}MB idle -> {loaded:.0f}MB loaded ({per_conn_kb:.1f}KB per connection)")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,17 @@
 import streamlit as st
 import base64
 import os
+from backend.utils import resolve_variant
+
+CARD_IMAGE_WIDTH = 320  # card tiles render about 200px wide
+CARD_AVATAR_WIDTH = 64
+
+def _data_uri(path, width):
+    """Base64 data URI of the smallest WebP variant of ``path`` that fills ``width`` pixels."""
+    path = resolve_variant(path, width, 'webp')
+    mime = 'image/webp' if path.endswith('.webp') else 'image/jpeg'
+    with open(path, "rb") as f:
+        return f"data:{mime};base64,{base64.b64encode(f.read()).decode()}"
 
 def render_card(post, click_handler=None):
     """
@@ -10,20 +21,15 @@ def render_card(post, click_handler=None):
     # Fix path for local Windows environment if needed, or use relative path
     # Assuming 'assets/filename.jpg'
     
-    # Convert local image to base64 for embedding in HTML
-    img_base64 = ""
+    # Embed a card-sized thumbnail instead of the full upload
     if image_url and os.path.exists(image_url):
-        with open(image_url, "rb") as f:
-            img_base64 = base64.b64encode(f.read()).decode()
-        img_src = f"data:image/jpeg;base64,{img_base64}"
+        img_src = _data_uri(image_url, CARD_IMAGE_WIDTH)
     else:
         img_src = "https://via.placeholder.com/300x400?text=No+Image"
         
     user_avatar = "https://via.placeholder.com/24?text=U" # Default
     if post.get('avatar_url') and os.path.exists(post['avatar_url']):
-         with open(post['avatar_url'], "rb") as f:
-            avatar_base64 = base64.b64encode(f.read()).decode()
-         user_avatar = f"data:image/jpeg;base64,{avatar_base64}"
+         user_avatar = _data_uri(post['avatar_url'], CARD_AVATAR_WIDTH)
 
     # Generate unique ID for the button
     btn_key = f"card_btn_{post['id']}"
@@ -1,6 +1,5 @@
-import pymysql
 from backend.database import db
-import os
+from backend.migrations import apply_baseline, migrate
 
 def init_db():
     print("Initializing database...")
@@ -9,25 +8,12 @@ def init_db():
         print("Failed to connect to database")
         return
 
-    # Read schema.sql
-    with open('schema.sql', 'r', encoding='utf-8') as f:
-        schema = f.read()
-
-    # Split by semicolon to execute individual statements
-    # This is a simple parser, might fail on complex statements with semicolons in strings
-    # but schema.sql looks simple enough.
-    statements = schema.split(';')
-    
     try:
-        with conn.cursor() as cursor:
-            for statement in statements:
-                if statement.strip():
-                    try:
-                        cursor.execute(statement)
-                        print(f"Executed: {statement[:50]}...")
-                    except pymysql.MySQLError as e:
-                        # Ignore "Table already exists" errors if any, though IF NOT EXISTS should handle it
-                        print(f"Error executing statement: {e}")
+        # Base tables from schema.sql, then the numbered migrations on top
+        apply_baseline(conn, 'schema.sql')
+        print("Base schema applied.")
+        applied = migrate(conn)
+        print(f"Applied {len(applied)} migration(s).")
         print("Database initialization complete.")
     except Exception as e:
         print(f"Error during initialization: {e}")
@@ -36,4 +22,3 @@ def init_db():
 
 if __name__ == "__main__":
     init_db()
-
@@ -0,0 +1,19 @@
+-- Secondary indexes for the feed, comment, inbox and notification hot paths.
+-- ALGORITHM=INPLACE, LOCK=NONE keeps the tables readable and writable while
+-- InnoDB builds each index; MySQL errors out instead of silently locking.
+
+-- Public feed ordered by time, and per-category feed
+ALTER TABLE posts ADD INDEX idx_posts_private_created (is_private, created_at), ALGORITHM=INPLACE, LOCK=NONE;
+ALTER TABLE posts ADD INDEX idx_posts_category_created (category, created_at), ALGORITHM=INPLACE, LOCK=NONE;
+
+-- Comments of a post in display order
+ALTER TABLE comments ADD INDEX idx_comments_post_created (post_id, created_at), ALGORITHM=INPLACE, LOCK=NONE;
+
+-- Conversation history between two users
+ALTER TABLE messages ADD INDEX idx_messages_pair_created (sender_id, receiver_id, created_at), ALGORITHM=INPLACE, LOCK=NONE;
+
+-- Notification list and unread badge
+ALTER TABLE notifications ADD INDEX idx_notifications_receiver_read_created (receiver_id, is_read, created_at), ALGORITHM=INPLACE, LOCK=NONE;
+
+-- Likes of a post (unique_like is (user_id, post_id) and can't serve post_id lookups)
+ALTER TABLE likes ADD INDEX idx_likes_post (post_id), ALGORITHM=INPLACE, LOCK=NONE;
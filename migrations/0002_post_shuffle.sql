@@ -0,0 +1,22 @@
+-- Precomputed random orderings for the recommend feed (see backend/feed.py).
+-- Every post gets one random shuffle_key per bucket; a session reads one bucket
+-- in key order, so paging costs an index range scan instead of ORDER BY RAND().
+
+CREATE TABLE IF NOT EXISTS post_shuffle (
+    bucket TINYINT UNSIGNED NOT NULL,
+    shuffle_key INT UNSIGNED NOT NULL,
+    post_id INT NOT NULL,
+    PRIMARY KEY (bucket, shuffle_key, post_id),
+    KEY idx_post_shuffle_post (post_id),
+    FOREIGN KEY (post_id) REFERENCES posts(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Backfill existing posts into all 8 buckets (SHUFFLE_BUCKETS in backend/feed.py)
+INSERT INTO post_shuffle (bucket, shuffle_key, post_id)
+SELECT b.bucket, FLOOR(RAND() * 2147483648), p.id
+FROM posts p
+CROSS JOIN (
+    SELECT 0 AS bucket UNION ALL SELECT 1 UNION ALL SELECT 2 UNION ALL SELECT 3
+    UNION ALL SELECT 4 UNION ALL SELECT 5 UNION ALL SELECT 6 UNION ALL SELECT 7
+) b
+WHERE NOT EXISTS (SELECT 1 FROM post_shuffle s WHERE s.post_id = p.id);
@@ -0,0 +1,7 @@
+-- Indexes that let the newest-first keyset pages on (created_at, id) stop after
+-- one page instead of sorting every row of the user. InnoDB appends the primary
+-- key to secondary indexes, so (x, created_at) also orders by id.
+
+ALTER TABLE posts ADD INDEX idx_posts_user_created (user_id, created_at), ALGORITHM=INPLACE, LOCK=NONE;
+ALTER TABLE likes ADD INDEX idx_likes_user_created (user_id, created_at), ALGORITHM=INPLACE, LOCK=NONE;
+ALTER TABLE collections ADD INDEX idx_collections_user_created (user_id, created_at), ALGORITHM=INPLACE, LOCK=NONE;
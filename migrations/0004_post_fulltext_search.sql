@@ -0,0 +1,10 @@
+-- Full-text search over post titles and content (backend/search_service.py).
+-- The ngram parser splits CJK text into bigrams (ngram_token_size=2), so
+-- Chinese queries match without word segmentation. InnoDB maintains the index
+-- on every insert/update/delete.
+--
+-- The first FULLTEXT index rebuilds the table to add FTS_DOC_ID, which InnoDB
+-- can't do with LOCK=NONE; LOCK=SHARED keeps the table readable meanwhile.
+
+ALTER TABLE posts ADD FULLTEXT INDEX ft_posts_title_content (title, content) WITH PARSER ngram, ALGORITHM=INPLACE, LOCK=SHARED;
+ALTER TABLE posts ADD FULLTEXT INDEX ft_posts_title (title) WITH PARSER ngram, ALGORITHM=INPLACE, LOCK=SHARED;
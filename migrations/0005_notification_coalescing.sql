@@ -0,0 +1,14 @@
+-- Coalesced notifications (see backend/notifications.py).
+-- A burst of likes/comments on one post, or of new followers, is folded into a
+-- single unread row per receiver: actor_count counts the actors and sender_id is
+-- the most recent one ("A 等 38 人赞了你的帖子").
+-- group_key identifies the burst (e.g. 'like_post:42') while the row is unread
+-- and is cleared when it is read, so the unique key only spans unread rows
+-- (NULLs never collide) and the next like after reading starts a new row.
+
+ALTER TABLE notifications
+    ADD COLUMN actor_count INT NOT NULL DEFAULT 1,
+    ADD COLUMN group_key VARCHAR(64) NULL,
+    ALGORITHM=INPLACE, LOCK=NONE;
+
+ALTER TABLE notifications ADD UNIQUE INDEX uniq_notifications_unread_group (receiver_id, group_key), ALGORITHM=INPLACE, LOCK=NONE;
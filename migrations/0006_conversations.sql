@@ -0,0 +1,35 @@
+-- One summary row per pair of users who exchanged messages, keyed by the
+-- canonical pair (user_low < user_high). MessageService keeps it current in the
+-- same transaction as send_message / mark_messages_read, so the inbox is a range
+-- scan over these rows instead of a GROUP BY over every message plus three
+-- queries per partner.
+
+CREATE TABLE IF NOT EXISTS conversations (
+    user_low INT NOT NULL,
+    user_high INT NOT NULL,
+    last_message_id INT NOT NULL,
+    last_time TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    unread_low INT NOT NULL DEFAULT 0,   -- messages user_low hasn't read yet
+    unread_high INT NOT NULL DEFAULT 0,  -- messages user_high hasn't read yet
+    PRIMARY KEY (user_low, user_high),
+    -- Inbox of a user, newest first, from either side of the pair
+    KEY idx_conversations_low_time (user_low, last_time),
+    KEY idx_conversations_high_time (user_high, last_time),
+    FOREIGN KEY (user_low) REFERENCES users(id) ON DELETE CASCADE,
+    FOREIGN KEY (user_high) REFERENCES users(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Backfill from existing messages (re-runnable: recomputes every summary)
+INSERT INTO conversations (user_low, user_high, last_message_id, last_time, unread_low, unread_high)
+SELECT LEAST(sender_id, receiver_id), GREATEST(sender_id, receiver_id),
+       MAX(id), MAX(created_at),
+       SUM(receiver_id < sender_id AND is_read = FALSE),
+       SUM(receiver_id > sender_id AND is_read = FALSE)
+FROM messages
+WHERE sender_id <> receiver_id
+GROUP BY LEAST(sender_id, receiver_id), GREATEST(sender_id, receiver_id)
+ON DUPLICATE KEY UPDATE
+    last_message_id = VALUES(last_message_id),
+    last_time = VALUES(last_time),
+    unread_low = VALUES(unread_low),
+    unread_high = VALUES(unread_high);
@@ -0,0 +1,21 @@
+-- Per-user unread counters (see backend/unread.py). The unread badge reads one
+-- primary-key row instead of two COUNT(*) scans over messages and notifications.
+-- Writers adjust the counters in the same transaction as the rows they change;
+-- `python -m backend.maintenance reconcile-unread` recounts them.
+
+CREATE TABLE IF NOT EXISTS user_counters (
+    user_id INT PRIMARY KEY,
+    unread_messages INT NOT NULL DEFAULT 0,
+    unread_notifications INT NOT NULL DEFAULT 0,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Backfill (re-runnable)
+INSERT INTO user_counters (user_id, unread_messages, unread_notifications)
+SELECT u.id,
+       (SELECT COUNT(*) FROM messages m WHERE m.receiver_id = u.id AND m.is_read = FALSE),
+       (SELECT COUNT(*) FROM notifications n WHERE n.receiver_id = u.id AND n.is_read = FALSE)
+FROM users u
+ON DUPLICATE KEY UPDATE
+    unread_messages = VALUES(unread_messages),
+    unread_notifications = VALUES(unread_notifications);
@@ -0,0 +1,22 @@
+-- Per-participant read watermarks on conversations. read_low / read_high is the
+-- id of the last message user_low / user_high has read: a message is read when
+-- its id is at or below the receiver's watermark, so marking a conversation read
+-- updates one conversations row instead of every unread messages row.
+-- messages.is_read is no longer written.
+
+ALTER TABLE conversations
+    ADD COLUMN read_low INT NOT NULL DEFAULT 0,
+    ADD COLUMN read_high INT NOT NULL DEFAULT 0,
+    ALGORITHM=INPLACE, LOCK=NONE;
+
+-- Backfill from is_read: each side has read everything before its oldest
+-- unread message, or the whole conversation when nothing is unread
+UPDATE conversations c
+SET read_low = COALESCE((
+        SELECT MIN(m.id) - 1 FROM messages m
+        WHERE m.sender_id = c.user_high AND m.receiver_id = c.user_low AND m.is_read = FALSE
+    ), c.last_message_id),
+    read_high = COALESCE((
+        SELECT MIN(m.id) - 1 FROM messages m
+        WHERE m.sender_id = c.user_low AND m.receiver_id = c.user_high AND m.is_read = FALSE
+    ), c.last_message_id);
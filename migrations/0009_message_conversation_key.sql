@@ -0,0 +1,15 @@
+-- Canonical conversation key on messages: (user_low << 32) | user_high, the same
+-- for both directions of a pair (see conversation_key() in
+-- backend/message_service.py). History is read with a range scan on
+-- (conversation_key, id) and paged by message id, replacing the
+-- (a, b) OR (b, a) predicate and OFFSET paging.
+
+ALTER TABLE messages ADD COLUMN conversation_key BIGINT NULL, ALGORITHM=INPLACE, LOCK=NONE;
+
+-- Backfilled in primary key ranges (see BATCHED_UPDATE_RE in backend/migrations.py)
+-- so each statement locks and logs a bounded number of rows
+UPDATE messages
+SET conversation_key = (LEAST(sender_id, receiver_id) << 32) | GREATEST(sender_id, receiver_id)
+WHERE id BETWEEN %(first_id)s AND %(last_id)s AND conversation_key IS NULL;
+
+ALTER TABLE messages ADD INDEX idx_messages_conversation (conversation_key, id), ALGORITHM=INPLACE, LOCK=NONE;
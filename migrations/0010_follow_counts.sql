@@ -0,0 +1,14 @@
+-- Denormalized follow counts on users. UserService.follow_user / unfollow_user
+-- adjust them in the same transaction as the follows row, so profile counts are
+-- a primary-key read instead of two COUNT(*) scans over follows.
+-- `python -m backend.maintenance reconcile-follows` recounts them.
+
+ALTER TABLE users
+    ADD COLUMN follower_count INT NOT NULL DEFAULT 0,
+    ADD COLUMN following_count INT NOT NULL DEFAULT 0,
+    ALGORITHM=INPLACE, LOCK=NONE;
+
+-- Backfill (re-runnable)
+UPDATE users u
+SET u.follower_count = (SELECT COUNT(*) FROM follows f WHERE f.followed_id = u.id),
+    u.following_count = (SELECT COUNT(*) FROM follows f WHERE f.follower_id = u.id);
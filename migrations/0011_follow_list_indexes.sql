@@ -0,0 +1,6 @@
+-- Keyset pagination of follower / following lists in (created_at, id) order
+-- (UserService.get_followers_page / get_following_page): each page is an
+-- ordered range scan that stops after LIMIT rows.
+
+ALTER TABLE follows ADD INDEX idx_follows_followed_created (followed_id, created_at, id), ALGORITHM=INPLACE, LOCK=NONE;
+ALTER TABLE follows ADD INDEX idx_follows_follower_created (follower_id, created_at, id), ALGORITHM=INPLACE, LOCK=NONE;
@@ -0,0 +1,8 @@
+-- Epoch of the write-behind like counters (backend/counters.py). A like reads
+-- its row's epoch under a shared lock and tags its buffered delta with it;
+-- `python -m backend.maintenance reconcile-likes` increments the epoch with the
+-- recount, and flushes only apply deltas whose epoch still matches, so a delta
+-- the recount already counted is dropped in whichever process buffers it.
+
+ALTER TABLE posts ADD COLUMN likes_epoch INT NOT NULL DEFAULT 0, ALGORITHM=INPLACE, LOCK=NONE;
+ALTER TABLE comments ADD COLUMN likes_epoch INT NOT NULL DEFAULT 0, ALGORITHM=INPLACE, LOCK=NONE;
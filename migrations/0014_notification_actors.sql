@@ -0,0 +1,17 @@
+-- Distinct actors of each coalesced notification (see backend/notifications.py).
+-- actor_count is derived from these rows instead of being incremented per event,
+-- so one person liking / unliking / liking again, or following again, across
+-- writer batches is still counted once ("A 赞了你的帖子", not "A 等2人").
+
+CREATE TABLE IF NOT EXISTS notification_actors (
+    notification_id INT NOT NULL,
+    actor_id INT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (notification_id, actor_id),
+    FOREIGN KEY (notification_id) REFERENCES notifications(id) ON DELETE CASCADE,
+    FOREIGN KEY (actor_id) REFERENCES users(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Unread bursts written before this table have no actor rows to count from:
+-- close them (they stay unread) so the next event starts a new row.
+UPDATE notifications SET group_key = NULL WHERE group_key IS NOT NULL;
@@ -0,0 +1,14 @@
+-- Log of follows and unfollows, written by UserService.follow_user / unfollow_user
+-- in the same transaction as the follows row. Every process's social graph
+-- (backend/social_graph.py) polls the recent rows to apply follows made by other
+-- processes, instead of reloading all of follows.
+-- `python -m backend.maintenance prune-follow-events` deletes old rows.
+
+CREATE TABLE IF NOT EXISTS follow_events (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    follower_id INT NOT NULL,
+    followed_id INT NOT NULL,
+    follow_id INT NULL,  -- the follows row; NULL for an unfollow
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_follow_events_created (created_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Depends
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Depends, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
@@ -6,12 +6,23 @@ from typing import Optional, List
 import os
 import httpx
 import json
-from backend.auth_service import AuthService
-from backend.post_service import PostService
-from backend.message_service import MessageService
-from backend.user_service import UserService
+from backend.async_service import (
+    AsyncAuthService,
+    AsyncMessageService,
+    AsyncPostService,
+    AsyncSearchService,
+    AsyncUserService,
+)
 from backend.database import db
-from backend.utils import save_image
+from backend.jwt_auth import auth_stats
+from backend.loaders import request_scope
+from backend.passwords import PasswordHasherBusy, password_hasher
+from backend.cache import cache_stats
+from backend.counters import counter_stats
+from backend.notifications import notification_queue
+from backend.pubsub import event_stream, hub
+from backend.social_graph import social_graph
+from backend.utils import VARIANT_FORMATS, resolve_variant, save_image, unique_ids
 
 app = FastAPI()
 
@@ -25,6 +36,20 @@ app.add_middleware(
     expose_headers=["*"]
 )
 
+class UserLoaderScope:
+    """ASGI middleware giving every request its own batched user loader (backend/loaders.py)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        with request_scope():
+            await self.app(scope, receive, send)
+
+app.add_middleware(UserLoaderScope)
+
 # Pydantic Models
 class UserLogin(BaseModel):
     username: str
@@ -42,6 +67,14 @@ class CommentCreate(BaseModel):
 class InteractionCreate(BaseModel):
     user_id: int
 
+class LikeState(BaseModel):
+    user_id: int
+    liked: bool
+
+class CollectState(BaseModel):
+    user_id: int
+    collected: bool
+
 class DeletePost(BaseModel):
     user_id: int
 
@@ -58,13 +91,21 @@ class MarkRead(BaseModel):
     user_id: int
     sender_id: int
 
+class ViewerStateRequest(BaseModel):
+    user_id: int
+    post_ids: List[int] = []
+    user_ids: List[int] = []
+
 class AIPolishRequest(BaseModel):
     content: str
 
 # --- Auth Routes ---
 @app.post("/api/login")
 async def login(user_data: UserLogin):
-    user, msg = AuthService.login_user(user_data.username, user_data.password)
+    try:
+        user, msg = await AsyncAuthService.login_user(user_data.username, user_data.password)
+    except PasswordHasherBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     if user:
         # 生成JWT令牌（可选，如果前端需要）
         # from backend.jwt_auth import create_access_token
@@ -80,7 +121,10 @@ async def register(
     nickname: Optional[str] = Form(None),
     avatar: UploadFile = File(...)
 ):
-    success, msg = AuthService.register_user(username, password, nickname, avatar)
+    try:
+        success, msg = await AsyncAuthService.register_user(username, password, nickname, avatar)
+    except PasswordHasherBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     return {"success": success, "message": msg}
 
 @app.put("/api/user/profile")
@@ -89,9 +133,9 @@ async def update_profile(
     nickname: str = Form(...), 
     avatar: UploadFile = File(None)
 ):
-    success, msg = AuthService.update_user_profile(user_id, nickname, avatar)
+    success, msg = await AsyncAuthService.update_user_profile(user_id, nickname, avatar)
     if success:
-        user = AuthService.get_user_by_id(user_id)
+        user = await AsyncAuthService.get_user_by_id(user_id)
         return {"success": True, "user": user}
     return {"success": False, "message": msg}
 
@@ -101,14 +145,55 @@ async def get_posts(
     limit: int = 20, 
     offset: int = 0, 
     search: Optional[str] = None, 
-    category: Optional[str] = None
+    category: Optional[str] = None,
+    seed: Optional[int] = None,
+    cursor: Optional[str] = None,
+    user_id: Optional[int] = None,
+    with_viewer_state: bool = False
 ):
-    return PostService.get_posts(limit, offset, search, category)
+    # Cursor mode (pass an empty cursor for the first page) returns {"posts", "next_cursor"};
+    # without it the legacy offset list is returned.
+    if cursor is not None:
+        try:
+            page = await AsyncPostService.get_posts_page(limit, cursor or None, search, category)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        posts = page['posts']
+    else:
+        page = posts = await AsyncPostService.get_posts(limit, offset, search, category, seed)
+
+    # Merge the viewer's is_liked / is_collected into the page in one extra query
+    if with_viewer_state:
+        try:
+            await AsyncPostService.attach_viewer_state(posts, user_id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return page
+
+@app.post("/api/viewer-state")
+async def get_viewer_state(request: ViewerStateRequest):
+    try:
+        posts = await AsyncPostService.get_viewer_state(request.user_id, request.post_ids)
+        users = await AsyncUserService.get_following_states(request.user_id, request.user_ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "success": True,
+        "posts": posts,
+        "users": {uid: {"is_following": following} for uid, following in users.items()},
+    }
+
+@app.get("/api/search/posts")
+async def search_posts(q: str, limit: int = 20, cursor: Optional[str] = None):
+    try:
+        return await AsyncSearchService.search_posts(q, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/api/posts/{post_id}")
-async def get_post_detail(post_id: int, user_id: Optional[int] = None):
+async def get_post_detail(post_id: int, user_id: Optional[int] = None, include_comments: bool = False):
     try:
-        post = PostService.get_post_by_id(post_id, user_id)
+        post = await AsyncPostService.get_post_detail(post_id, user_id, include_comments)
         if not post:
             print(f"Post {post_id} not found (user_id: {user_id})")
             raise HTTPException(status_code=404, detail="Post not found")
@@ -134,30 +219,50 @@ async def create_post(
     if not images and not video:
         raise HTTPException(status_code=400, detail="Images or Video required")
 
-    success, msg = PostService.create_post(user_id, title, content, images, category, video)
+    success, msg = await AsyncPostService.create_post(user_id, title, content, images, category, video)
     return {"success": success, "message": msg}
 
 @app.get("/api/posts/user/{user_id}")
-async def get_user_posts(user_id: int, current_user_id: Optional[int] = None):
-    return PostService.get_user_posts(user_id, current_user_id)
+async def get_user_posts(
+    user_id: int,
+    current_user_id: Optional[int] = None,
+    limit: int = 20,
+    cursor: Optional[str] = None
+):
+    if cursor is not None:
+        try:
+            return await AsyncPostService.get_user_posts_page(user_id, current_user_id, limit, cursor or None)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return await AsyncPostService.get_user_posts(user_id, current_user_id)
 
 @app.get("/api/posts/user/{user_id}/liked")
-async def get_user_liked_posts(user_id: int):
-    return PostService.get_user_liked_posts(user_id)
+async def get_user_liked_posts(user_id: int, limit: int = 20, cursor: Optional[str] = None):
+    if cursor is not None:
+        try:
+            return await AsyncPostService.get_user_liked_posts_page(user_id, limit, cursor or None)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return await AsyncPostService.get_user_liked_posts(user_id)
 
 @app.get("/api/posts/user/{user_id}/collected")
-async def get_user_collected_posts(user_id: int):
-    return PostService.get_user_collected_posts(user_id)
+async def get_user_collected_posts(user_id: int, limit: int = 20, cursor: Optional[str] = None):
+    if cursor is not None:
+        try:
+            return await AsyncPostService.get_user_collected_posts_page(user_id, limit, cursor or None)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return await AsyncPostService.get_user_collected_posts(user_id)
 
 # New routes for deletion and visibility
 @app.delete("/api/posts/{post_id}")
 async def delete_post(post_id: int, user_data: DeletePost):
-    success, msg = PostService.delete_post(post_id, user_data.user_id)
+    success, msg = await AsyncPostService.delete_post(post_id, user_data.user_id)
     return {"success": success, "message": msg}
 
 @app.put("/api/posts/{post_id}/visibility")
 async def update_visibility(post_id: int, data: UpdateVisibility):
-    success, msg = PostService.update_post_visibility(post_id, data.user_id, data.is_private)
+    success, msg = await AsyncPostService.update_post_visibility(post_id, data.user_id, data.is_private)
     return {"success": success, "message": msg}
 
 
@@ -169,7 +274,7 @@ async def toggle_like(post_id: int, user_id_data: InteractionCreate):
     if not user_id:
         raise HTTPException(status_code=400, detail="User ID required")
         
-    success, msg = PostService.toggle_like(user_id, post_id)
+    success, msg = await AsyncPostService.toggle_like(user_id, post_id)
     return {"success": success, "message": msg}
 
 @app.post("/api/posts/{post_id}/collect")
@@ -178,16 +283,27 @@ async def toggle_collection(post_id: int, user_id_data: InteractionCreate):
     if not user_id:
         raise HTTPException(status_code=400, detail="User ID required")
         
-    success, msg = PostService.toggle_collection(user_id, post_id)
+    success, msg = await AsyncPostService.toggle_collection(user_id, post_id)
     return {"success": success, "message": msg}
 
+# Set-style variants of the toggles: repeating a request leaves the same state
+@app.put("/api/posts/{post_id}/like")
+async def set_like(post_id: int, data: LikeState):
+    success, msg = await AsyncPostService.set_like(data.user_id, post_id, data.liked)
+    return {"success": success, "message": msg, "liked": data.liked}
+
+@app.put("/api/posts/{post_id}/collect")
+async def set_collection(post_id: int, data: CollectState):
+    success, msg = await AsyncPostService.set_collection(data.user_id, post_id, data.collected)
+    return {"success": success, "message": msg, "collected": data.collected}
+
 @app.get("/api/posts/{post_id}/comments")
 async def get_comments(post_id: int, user_id: Optional[int] = None):
-    return PostService.get_comments(post_id, user_id)
+    return await AsyncPostService.get_comments(post_id, user_id)
 
 @app.post("/api/posts/{post_id}/comments")
 async def add_comment(post_id: int, comment_data: CommentCreate):
-    success = PostService.add_comment(comment_data.user_id, post_id, comment_data.content)
+    success = await AsyncPostService.add_comment(comment_data.user_id, post_id, comment_data.content)
     return {"success": success}
 
 @app.post("/api/comments/{comment_id}/like")
@@ -196,23 +312,52 @@ async def toggle_comment_like(comment_id: int, user_id_data: InteractionCreate):
     if not user_id:
         raise HTTPException(status_code=400, detail="User ID required")
         
-    success, msg = PostService.toggle_comment_like(user_id, comment_id)
+    success, msg = await AsyncPostService.toggle_comment_like(user_id, comment_id)
     return {"success": success, "message": msg}
 
+@app.put("/api/comments/{comment_id}/like")
+async def set_comment_like(comment_id: int, data: LikeState):
+    success, msg = await AsyncPostService.set_comment_like(data.user_id, comment_id, data.liked)
+    return {"success": success, "message": msg, "liked": data.liked}
+
 # --- Static Files ---
 @app.get("/assets/{filename}")
-async def get_image(filename: str):
+async def get_image(
+    request: Request,
+    filename: str,
+    w: Optional[int] = Query(None, ge=1, description="显示宽度（像素），返回不小于该宽度的最小缩略图"),
+    fmt: Optional[str] = Query(None, description="jpeg 或 webp，默认按 Accept 头选择"),
+):
     path = f"assets/{filename}"
-    if os.path.exists(path):
-        response = FileResponse(path)
-        response.headers["Access-Control-Allow-Origin"] = "*"
-        return response
-    raise HTTPException(status_code=404, detail="Image not found")
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Image not found")
+    if fmt is not None and fmt not in VARIANT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"fmt 仅支持: {', '.join(VARIANT_FORMATS)}")
+    if w:
+        negotiated = fmt is None
+        if negotiated:
+            fmt = 'webp' if 'image/webp' in request.headers.get('accept', '') else 'jpeg'
+        path = resolve_variant(path, w, fmt)
+    response = FileResponse(path)
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    if w and negotiated:
+        response.headers["Vary"] = "Accept"
+    return response
 
 # --- User Routes ---
+@app.get("/api/users")
+async def get_users(ids: List[int] = Query(...)):
+    # Several profiles in one request, e.g. ?ids=1&ids=2
+    try:
+        user_ids = unique_ids(ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    users = await AsyncAuthService.get_users_by_ids(user_ids)
+    return {"success": True, "users": [users[uid] for uid in user_ids if uid in users]}
+
 @app.get("/api/users/{user_id}")
 async def get_public_user_profile(user_id: int):
-    user = AuthService.get_user_by_id(user_id)
+    user = await AsyncAuthService.get_user_by_id(user_id)
     if user:
         # Remove sensitive info if any (though get_user_by_id currently only returns safe fields)
         return {"success": True, "user": user}
@@ -221,72 +366,153 @@ async def get_public_user_profile(user_id: int):
 @app.post("/api/users/{user_id}/follow")
 async def follow_user(user_id: int, interaction: InteractionCreate):
     follower_id = interaction.user_id
-    success, msg = UserService.follow_user(follower_id, user_id)
+    success, msg = await AsyncUserService.follow_user(follower_id, user_id)
     return {"success": success, "message": msg}
 
 @app.post("/api/users/{user_id}/unfollow")
 async def unfollow_user(user_id: int, interaction: InteractionCreate):
     follower_id = interaction.user_id
-    success, msg = UserService.unfollow_user(follower_id, user_id)
+    success, msg = await AsyncUserService.unfollow_user(follower_id, user_id)
     return {"success": success, "message": msg}
 
 @app.get("/api/users/{user_id}/is_following")
 async def is_following(user_id: int, current_user_id: int):
-    is_following = UserService.is_following(current_user_id, user_id)
+    is_following = await AsyncUserService.is_following(current_user_id, user_id)
     return {"success": True, "is_following": is_following}
 
 @app.get("/api/users/{user_id}/followers")
-async def get_followers(user_id: int, current_user_id: Optional[int] = None):
-    followers = UserService.get_followers(user_id, current_user_id)
+async def get_followers(user_id: int, current_user_id: Optional[int] = None,
+                        limit: Optional[int] = None, cursor: Optional[str] = None):
+    # With a cursor (empty for the first page) the list is paged and carries the total
+    if cursor is not None:
+        try:
+            page = await AsyncUserService.get_followers_page(user_id, current_user_id, limit, cursor or None)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {"success": True, "followers": page["users"], "next_cursor": page["next_cursor"], "total": page["total"]}
+    followers = await AsyncUserService.get_followers(user_id, current_user_id)
     return {"success": True, "followers": followers}
 
 @app.get("/api/users/{user_id}/following")
-async def get_following(user_id: int, current_user_id: Optional[int] = None):
-    following = UserService.get_following(user_id, current_user_id)
+async def get_following(user_id: int, current_user_id: Optional[int] = None,
+                        limit: Optional[int] = None, cursor: Optional[str] = None):
+    if cursor is not None:
+        try:
+            page = await AsyncUserService.get_following_page(user_id, current_user_id, limit, cursor or None)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {"success": True, "following": page["users"], "next_cursor": page["next_cursor"], "total": page["total"]}
+    following = await AsyncUserService.get_following(user_id, current_user_id)
     return {"success": True, "following": following}
 
+@app.get("/api/users/{user_id}/mutuals")
+async def get_mutual_follows(user_id: int):
+    mutuals = await AsyncUserService.get_mutual_follows(user_id)
+    return {"success": True, "mutuals": mutuals}
+
 @app.get("/api/users/{user_id}/counts")
 async def get_follow_counts(user_id: int):
-    counts = UserService.get_follow_counts(user_id)
+    counts = await AsyncUserService.get_follow_counts(user_id)
     return {"success": True, "counts": counts}
 
 # --- Message Routes ---
 @app.post("/api/messages")
 async def send_message(msg_data: MessageCreate):
-    success, msg = MessageService.send_message(msg_data.sender_id, msg_data.receiver_id, msg_data.content)
+    success, msg = await AsyncMessageService.send_message(msg_data.sender_id, msg_data.receiver_id, msg_data.content)
     return {"success": success, "message": msg}
 
 @app.get("/api/messages/conversations")
-async def get_conversations(user_id: int):
-    conversations = MessageService.get_conversations(user_id)
+async def get_conversations(user_id: int, limit: int = 20, cursor: Optional[str] = None):
+    # With a cursor (empty for the first page) the inbox is paged and next_cursor is returned
+    if cursor is not None:
+        try:
+            page = await AsyncMessageService.get_conversations_page(user_id, limit, cursor or None)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {"success": True, **page}
+    conversations = await AsyncMessageService.get_conversations(user_id)
     return {"success": True, "conversations": conversations}
 
 @app.get("/api/messages/conversation/{other_user_id}")
-async def get_conversation(other_user_id: int, user_id: int, limit: int = 50, offset: int = 0):
-    messages = MessageService.get_conversation(user_id, other_user_id, limit, offset)
+async def get_conversation(other_user_id: int, user_id: int, limit: int = 50, offset: int = 0,
+                           before_id: Optional[str] = None, after_id: Optional[str] = None):
+    # With before_id / after_id (empty before_id for the latest page) history is paged by message id
+    if before_id is not None or after_id is not None:
+        try:
+            page = await AsyncMessageService.get_conversation_page(
+                user_id, other_user_id, limit,
+                before_id=int(before_id) if before_id else None,
+                after_id=int(after_id) if after_id else None,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {"success": True, **page}
+    messages = await AsyncMessageService.get_conversation(user_id, other_user_id, limit, offset)
     return {"success": True, "messages": messages}
 
 @app.put("/api/messages/read")
 async def mark_messages_read(data: MarkRead):
-    success = MessageService.mark_messages_read(data.user_id, data.sender_id)
+    success = await AsyncMessageService.mark_messages_read(data.user_id, data.sender_id)
     return {"success": success}
 
+@app.get("/api/stream")
+async def stream_events(user_id: int):
+    # Server-Sent Events: message, read, notification, unread and resync events
+    return StreamingResponse(
+        event_stream(user_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.get("/api/messages/unread/count")
 async def get_unread_count(user_id: int):
-    count = MessageService.get_total_unread_count(user_id)
+    count = await AsyncMessageService.get_total_unread_count(user_id)
     return {"success": True, "count": count}
 
 @app.get("/api/notifications")
 async def get_notifications(user_id: int):
-    notifications = MessageService.get_notifications(user_id)
+    notifications = await AsyncMessageService.get_notifications(user_id)
     return {"success": True, "notifications": notifications}
 
 @app.put("/api/notifications/read")
 async def mark_notifications_read(data: InteractionCreate):
     # Reusing InteractionCreate just for user_id
-    success = MessageService.mark_notifications_read(data.user_id)
+    success = await AsyncMessageService.mark_notifications_read(data.user_id)
     return {"success": success}
 
+# --- System Routes ---
+@app.get("/api/system/db-pool")
+async def get_db_pool_stats():
+    return {"success": True, "pool": db.pool_stats()}
+
+@app.get("/api/system/cache")
+async def get_cache_stats():
+    return {"success": True, "caches": cache_stats()}
+
+@app.get("/api/system/notifications")
+async def get_notification_queue_stats():
+    return {"success": True, "queue": notification_queue.stats()}
+
+@app.get("/api/system/stream")
+async def get_stream_stats():
+    return {"success": True, "hub": hub.stats()}
+
+@app.get("/api/system/counters")
+async def get_counter_stats():
+    return {"success": True, "counters": counter_stats()}
+
+@app.get("/api/system/auth")
+async def get_auth_stats():
+    return {"success": True, "auth": auth_stats()}
+
+@app.get("/api/system/passwords")
+async def get_password_pool_stats():
+    return {"success": True, "passwords": password_hasher.stats()}
+
+@app.get("/api/system/social-graph")
+async def get_social_graph_stats():
+    return {"success": True, "graph": social_graph.stats()}
+
 # --- AI Polish Route ---
 @app.post("/api/ai/polish")
 async def ai_polish(request: AIPolishRequest):
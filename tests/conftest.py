@@ -1,5 +1,6 @@
 import pytest
 from unittest.mock import MagicMock
+from contextlib import contextmanager
 import sys
 import os
 
@@ -23,7 +24,32 @@ def mock_db(mocker):
     # Configure connection to return this cursor
     mock_conn.cursor.return_value = mock_cursor
     
-    # Patch the get_connection method
+    @contextmanager
+    def fake_connection(batch=False):
+        yield mock_conn
+
+    # Patch the pooled connection context manager and the standalone connection
+    mocker.patch('backend.database.db.connection', side_effect=fake_connection)
     mocker.patch('backend.database.db.get_connection', return_value=mock_conn)
     
     return mock_conn, mock_cursor
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Start every test with empty in-process caches, counter buffers and notification queue."""
+    from backend.cache import CACHES
+    from backend.counters import COUNTERS
+    from backend.notifications import notification_queue
+    stores = (*CACHES.values(), *COUNTERS.values(), notification_queue)
+    for store in stores:
+        store.clear()
+    yield
+    for store in stores:
+        store.clear()
+
+@pytest.fixture(autouse=True)
+def no_social_graph(mocker):
+    """Keep the social graph unloaded so services use SQL; graph tests load their own instance."""
+    from backend.social_graph import social_graph
+    mocker.patch.object(social_graph, '_available', return_value=False)
+    return social_graph
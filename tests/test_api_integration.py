@@ -101,3 +101,51 @@ def test_create_post_validation_error():
     assert response.status_code == 400
     assert "Images or Video required" in response.json()["detail"]
 
+
+def test_api_viewer_state(mock_db):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchall.side_effect = [
+        [{"post_id": 5, "flag": "is_liked"}],
+        [{"followed_id": 2}],
+    ]
+
+    response = client.post("/api/viewer-state", json={"user_id": 1, "post_ids": [5, 6], "user_ids": [2, 3]})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["posts"]["5"] == {"is_liked": True, "is_collected": False}
+    assert data["posts"]["6"] == {"is_liked": False, "is_collected": False}
+    assert data["users"] == {"2": {"is_following": True}, "3": {"is_following": False}}
+
+def test_api_set_like_twice_counts_once(mock_db, mocker):
+    from backend.counters import CounterBuffer, post_likes
+    mocker.patch.object(CounterBuffer, '_ensure_started')
+    mock_conn, mock_cursor = mock_db
+
+    mock_cursor.fetchall.side_effect = [[{"epoch": 0}]] + [[{"removed": 0, "added": 1}]] * 3
+    first = client.put("/api/posts/5/like", json={"user_id": 1, "liked": True})
+    mock_cursor.fetchall.side_effect = [[{"epoch": 0}]] + [[{"removed": 0, "added": 0}]] * 3
+    second = client.put("/api/posts/5/like", json={"user_id": 1, "liked": True})
+
+    assert first.json()["message"] == second.json()["message"] == "Liked"
+    assert post_likes.pending(5) == 1
+
+def test_get_asset_serves_variant_by_width_and_accept(tmp_path, monkeypatch):
+    from backend.utils import make_variants
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "assets").mkdir()
+    img = Image.new('RGB', (1600, 1200), color='red')
+    img.save(tmp_path / "assets" / "a.jpg")
+    make_variants(img, "assets/a.jpg")
+
+    original = client.get("/assets/a.jpg")
+    webp = client.get("/assets/a.jpg?w=200", headers={"Accept": "image/webp,*/*"})
+    jpeg = client.get("/assets/a.jpg?w=200")
+
+    assert Image.open(BytesIO(original.content)).size == (1600, 1200)
+    assert webp.headers["content-type"] == "image/webp"
+    assert "Accept" in webp.headers["vary"]
+    assert Image.open(BytesIO(webp.content)).size == (320, 240)
+    assert Image.open(BytesIO(jpeg.content)).format == "JPEG"
+    assert len(jpeg.content) < len(original.content)
+    assert client.get("/assets/a.jpg?w=200&fmt=png").status_code == 400
@@ -0,0 +1,41 @@
+import asyncio
+import threading
+import time
+from backend.async_service import AsyncPostService
+
+def test_async_service_runs_off_event_loop(mocker):
+    caller_threads = []
+
+    def fake_get_posts(*args, **kwargs):
+        caller_threads.append(threading.current_thread())
+        return [{"id": 1}]
+
+    mocker.patch("backend.post_service.PostService.get_posts", side_effect=fake_get_posts)
+
+    result = asyncio.run(AsyncPostService.get_posts(10, 0))
+
+    assert result == [{"id": 1}]
+    assert caller_threads[0] is not threading.main_thread()
+
+def test_async_service_does_not_block_event_loop(mocker):
+    mocker.patch(
+        "backend.post_service.PostService.get_posts",
+        side_effect=lambda *args, **kwargs: time.sleep(0.2) or [],
+    )
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        await AsyncPostService.get_posts()
+        task.cancel()
+        return ticks
+
+    # The loop keeps ticking while the blocking query runs in the executor
+    assert asyncio.run(scenario()) >= 5
@@ -110,3 +110,24 @@ def test_login_user_not_found(mock_db):
     assert user is None
     assert msg == "用户名或密码错误"
 
+
+def test_update_profile_saves_avatar_before_borrowing_connection(mock_db, mocker):
+    from backend.database import db
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchone.return_value = {"id": 7}
+    save_image = mocker.patch('backend.auth_service.save_image', return_value='assets/avatar.jpg')
+    save_image.side_effect = lambda f: db.connection.assert_not_called() or 'assets/avatar.jpg'
+
+    success, _ = AuthService.update_user_profile(7, "New", avatar_file=create_mock_avatar_file())
+
+    assert success is True
+    save_image.assert_called_once()
+    args, _ = mock_cursor.execute.call_args
+    assert args[1] == ("New", 'assets/avatar.jpg', 7)
+
+def test_update_profile_rejects_invalid_avatar_without_connection(mock_db, mocker):
+    from backend.database import db
+    mocker.patch('backend.auth_service.save_image', side_effect=ValueError("不支持的文件类型"))
+
+    assert AuthService.update_user_profile(7, "New", avatar_file=create_mock_avatar_file()) == (False, "不支持的文件类型")
+    db.connection.assert_not_called()
@@ -0,0 +1,74 @@
+from backend.cache import MISSING, TTLCache, feed_cache
+from backend.post_service import PostService
+
+def test_ttl_cache_hits_and_misses():
+    cache = TTLCache('test-hits', max_entries=4, ttl=60)
+    assert cache.get('a', MISSING) is MISSING
+    cache.set('a', [1])
+    assert cache.get('a') == [1]
+
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+
+def test_ttl_cache_expires_entries(mocker):
+    clock = mocker.patch('backend.cache.time.monotonic', return_value=100.0)
+    cache = TTLCache('test-expiry', ttl=10)
+    cache.set('a', 1)
+    cache.set('b', 2, ttl=60)
+
+    clock.return_value = 111.0
+    assert cache.get('a') is None
+    assert cache.get('b') == 2
+    assert cache.stats()['expirations'] == 1
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache('test-lru', max_entries=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.stats()['evictions'] == 1
+
+def test_ttl_cache_invalidates_by_tag():
+    cache = TTLCache('test-tags', ttl=60)
+    cache.set('page1', 1, tags={'post:1', 'user:7'})
+    cache.set('page2', 2, tags={'post:2', 'user:7'})
+    cache.set('page3', 3, tags={'post:3'})
+
+    assert cache.invalidate_tags('user:7') == 2
+    assert cache.get('page1') is None
+    assert cache.get('page3') == 3
+
+def test_get_posts_page_served_from_cache(mock_db):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchall.return_value = [{"id": 9, "user_id": 2, "created_at": None}]
+
+    first = PostService.get_posts_page(limit=20, category="美食")
+    first["posts"][0]["nickname"] = "mutated"
+    second = PostService.get_posts_page(limit=20, category="美食")
+
+    assert mock_cursor.execute.call_count == 1
+    assert second["posts"] == [{"id": 9, "user_id": 2, "created_at": None}]
+
+def test_visibility_change_invalidates_cached_pages(mock_db):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchall.return_value = [{"id": 9, "user_id": 2, "created_at": None}]
+    PostService.get_posts(category="美食")
+    assert feed_cache.stats()['size'] == 1
+
+    mock_cursor.fetchone.return_value = {"user_id": 2, "category": "美食"}
+    success, _ = PostService.update_post_visibility(9, 2, True)
+
+    assert success is True
+    assert feed_cache.stats()['size'] == 0
+
+def test_unseeded_recommend_feed_is_not_cached(mock_db):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchall.return_value = []
+    PostService.get_posts()
+    PostService.get_posts()
+    assert feed_cache.stats()['size'] == 0
@@ -0,0 +1,133 @@
+import pytest
+from unittest.mock import MagicMock
+from backend.counters import CounterBuffer, post_likes
+from backend.maintenance import RECOUNT_POST_LIKES
+from backend.post_service import PostService
+
+@pytest.fixture
+def counter(mocker):
+    # Keep the background flusher out of these tests
+    mocker.patch.object(CounterBuffer, '_ensure_started')
+    return CounterBuffer('test-counter', 'posts', 'likes_count')
+
+def test_add_accumulates_and_merges_into_reads(counter):
+    counter.add(1, 1)
+    counter.add(1, 1)
+    counter.add(2, 1)
+    counter.add(2, -1)
+
+    rows = counter.merge([{"id": 1, "likes_count": 10}, {"id": 2, "likes_count": 3}])
+
+    assert rows == [{"id": 1, "likes_count": 12}, {"id": 2, "likes_count": 3}]
+    assert counter.stats()['pending_rows'] == 1
+
+def test_flush_writes_one_batched_update(counter, mock_db):
+    mock_conn, mock_cursor = mock_db
+    counter.add(9, 2)
+    counter.add(3, -1)
+
+    assert counter.flush() == 2
+
+    sql, params = mock_cursor.execute.call_args.args
+    assert mock_cursor.execute.call_count == 1
+    assert ("likes_count = likes_count + CASE WHEN id = %s AND likes_epoch = %s THEN %s "
+            "WHEN id = %s AND likes_epoch = %s THEN %s ELSE 0 END") in sql
+    assert params == (3, 0, -1, 9, 0, 2, 3, 9)
+    assert counter.pending(9) == 0
+
+def test_deltas_keep_the_epoch_they_were_made_in(counter, mock_db):
+    mock_conn, mock_cursor = mock_db
+    counter.add(9, 1, epoch=2)
+    counter.add(9, 1, epoch=3)  # made after a recount of row 9
+    assert counter.pending(9) == 2
+
+    counter.flush()
+
+    sql, params = mock_cursor.execute.call_args.args
+    # Only the delta matching the row's current epoch is applied
+    assert params == (9, 2, 1, 9, 3, 1, 9)
+
+def test_failed_flush_keeps_deltas(counter, mock_db):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.execute.side_effect = Exception("lock wait timeout")
+    counter.add(9, 1)
+
+    assert counter.flush() == 0
+    assert counter.pending(9) == 1
+    assert counter.stats()['failures'] == 1
+
+def test_failed_chunk_rolls_back_the_whole_flush(counter, mock_db):
+    mock_conn, mock_cursor = mock_db
+    for row_id in range(1, 502):  # two chunks
+        counter.add(row_id, 1)
+    mock_cursor.execute.side_effect = [None, Exception("lock wait timeout")]
+
+    assert counter.flush() == 0
+
+    mock_conn.begin.assert_called_once()
+    mock_conn.rollback.assert_called_once()
+    mock_conn.commit.assert_not_called()
+    # The first chunk was rolled back too, so retrying all of it applies each delta once
+    assert counter.pending(1) == 1 and counter.pending(501) == 1
+    mock_cursor.execute.side_effect = None
+    assert counter.flush() == 501
+    mock_conn.commit.assert_called_once()
+
+def test_reconcile_locks_rows_and_bumps_epoch(counter):
+    conn = MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    counter.add(5, 2)
+
+    counter.reconcile(conn, RECOUNT_POST_LIKES, 1, 10)
+
+    (lock_sql, lock_params), (recount_sql, recount_params) = [c.args for c in cursor.execute.call_args_list]
+    assert lock_sql.endswith("FOR UPDATE") and lock_params == (1, 10)
+    assert "likes_epoch = p.likes_epoch + 1" in recount_sql
+    assert recount_params == {'first_id': 1, 'last_id': 10}
+    conn.commit.assert_called_once()
+    # Buffered deltas are voided by the epoch at flush time, not subtracted here
+    cursor.executemany.assert_not_called()
+    assert counter.pending(5) == 2
+
+def test_flushed_likes_are_folded_into_cached_feed_rows(mock_db, mocker):
+    from backend.cache import feed_cache
+    from backend.post_service import _fresh_rows
+    mocker.patch.object(CounterBuffer, '_ensure_started')
+    feed_cache.set('page', [{"id": 7, "likes_count": 10}], tags={"post:7"})
+    post_likes.add(7, 1)
+    assert _fresh_rows(feed_cache.get('page'))[0]["likes_count"] == 11
+
+    post_likes.flush()
+
+    # The cached row now carries the flushed like instead of dropping back to 10
+    assert feed_cache.get('page')[0]["likes_count"] == 11
+    assert _fresh_rows(feed_cache.get('page'))[0]["likes_count"] == 11
+
+def test_toggle_like_buffers_count(mock_db, mocker):
+    mocker.patch.object(CounterBuffer, '_ensure_started')
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchall.side_effect = [[{"epoch": 0}]] + [[{"removed": 0, "added": 1}]] * 4
+
+    success, msg = PostService.toggle_like(1, 100)
+
+    assert success is True
+    assert post_likes.pending(100) == 1
+    assert not any("likes_count" in str(call) for call in mock_cursor.execute.call_args_list)
+
+def test_feed_read_during_flush_is_not_double_counted(mock_db, mocker):
+    from backend.cache import feed_cache
+    mock_conn, mock_cursor = mock_db
+    mocker.patch.object(CounterBuffer, '_ensure_started')
+    post_likes.add(7, 1)
+    # Read after the flush committed, before its listener ran: the row already has the like
+    mock_cursor.fetchall.return_value = [{"id": 7, "user_id": 1, "likes_count": 11}]
+    pages = []
+    mocker.patch.object(post_likes, '_write', side_effect=lambda deltas: pages.append(
+        PostService.get_posts_page(category='美食')
+    ))
+
+    post_likes.flush()
+
+    assert pages[0]['posts'][0]["likes_count"] == 11
+    # Not cached, or the listener would have folded the like in a second time
+    assert feed_cache.get(('page', '美食', '', '', 20), None) is None
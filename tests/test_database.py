@@ -0,0 +1,122 @@
+import threading
+import pytest
+from unittest.mock import MagicMock
+from backend.database import ConnectionPool, PoolTimeoutError
+
+def make_pool(**kwargs):
+    """Create a pool whose connections are MagicMocks."""
+    created = []
+
+    def connect():
+        conn = MagicMock()
+        conn.open = True
+        conn.server_status = 0
+        created.append(conn)
+        return conn
+
+    kwargs.setdefault('min_size', 0)
+    return ConnectionPool(connect, **kwargs), created
+
+def test_pool_reuses_released_connection():
+    pool, created = make_pool(max_size=2)
+
+    conn = pool.acquire()
+    pool.release(conn)
+    again = pool.acquire()
+
+    assert again is conn
+    assert len(created) == 1
+
+def test_pool_times_out_when_exhausted():
+    pool, _ = make_pool(max_size=1, timeout=0.05)
+    pool.acquire()
+
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+    assert pool.stats()['timeouts'] == 1
+
+def test_pool_waiter_gets_released_connection():
+    pool, created = make_pool(max_size=1, timeout=2)
+    conn = pool.acquire()
+    result = {}
+
+    def borrower():
+        result['conn'] = pool.acquire()
+
+    t = threading.Thread(target=borrower)
+    t.start()
+    pool.release(conn)
+    t.join(timeout=2)
+
+    assert result['conn'] is conn
+    assert len(created) == 1
+
+def test_pool_replaces_connection_failing_health_check():
+    pool, created = make_pool(max_size=1, ping_interval=0)
+    conn = pool.acquire()
+    pool.release(conn)
+    conn.ping.side_effect = Exception("gone away")
+
+    fresh = pool.acquire()
+
+    assert fresh is not conn
+    assert len(created) == 2
+    assert pool.stats()['health_check_failures'] == 1
+
+def test_pool_recycles_connections_past_max_lifetime():
+    pool, created = make_pool(max_size=1, max_lifetime=0.000001)
+    conn = pool.acquire()
+    pool.release(conn)
+
+    fresh = pool.acquire()
+
+    assert fresh is not conn
+    conn.close.assert_called()
+    assert pool.stats()['recycled'] == 1
+
+def test_pool_rolls_back_open_transaction_on_release():
+    pool, _ = make_pool(max_size=1)
+    conn = pool.acquire()
+    conn.server_status = 1  # SERVER_STATUS_IN_TRANS
+
+    pool.release(conn)
+
+    conn.rollback.assert_called_once()
+
+def test_pool_stats_track_usage():
+    pool, _ = make_pool(max_size=3)
+    with pool.connection():
+        stats = pool.stats()
+        assert stats['in_use'] == 1
+        assert stats['idle'] == 0
+
+    stats = pool.stats()
+    assert stats['in_use'] == 0
+    assert stats['idle'] == 1
+    assert stats['checkouts'] == 1
+
+def test_fetch_batch_reads_each_result_set():
+    from backend.database import fetch_batch
+    cursor = MagicMock()
+    cursor.fetchall.side_effect = [[{"a": 1}], [{"b": 2}]]
+
+    results = fetch_batch(cursor, [("SELECT %s AS a;", (1,)), ("SELECT %s AS b", (2,))])
+
+    sql, params = cursor.execute.call_args.args
+    assert sql == "SELECT %s AS a;\nSELECT %s AS b"
+    assert params == (1, 2)
+    assert cursor.nextset.call_count == 1
+    assert results == [[{"a": 1}], [{"b": 2}]]
+
+def test_only_batch_connections_allow_multi_statements(mocker):
+    from pymysql.constants import CLIENT
+    from backend.database import db
+    connect = mocker.patch('backend.database.pymysql.connect',
+                           side_effect=lambda **kwargs: MagicMock(open=True, server_status=0))
+    mocker.patch.object(db, '_pool', None)
+    mocker.patch.object(db, '_batch_pool', None)
+
+    with db.connection():
+        assert connect.call_args.kwargs['client_flag'] == 0
+    with db.connection(batch=True):
+        assert connect.call_args.kwargs['client_flag'] == CLIENT.MULTI_STATEMENTS
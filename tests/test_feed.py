@@ -0,0 +1,62 @@
+import pytest
+from unittest.mock import MagicMock
+from backend.feed import SHUFFLE_BUCKETS, fetch_recommend_page
+from backend.pagination import decode_cursor, encode_cursor
+from backend.post_service import PostService
+
+def post(post_id, key):
+    return {"id": post_id, "title": f"Post {post_id}", "shuffle_key": key}
+
+def test_cursor_round_trip():
+    state = {"seed": 123, "key": 456, "id": 7, "wrapped": False}
+    assert decode_cursor(encode_cursor(state)) == state
+
+def test_decode_cursor_rejects_garbage():
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor!!")
+
+def test_recommend_page_full_page_returns_next_state():
+    cursor = MagicMock()
+    cursor.fetchall.return_value = [post(1, 10), post(2, 20)]
+
+    posts, next_state = fetch_recommend_page(cursor, 2, {"seed": 5})
+
+    assert [p["id"] for p in posts] == [1, 2]
+    assert "shuffle_key" not in posts[0]
+    assert next_state == {"seed": 5, "key": 20, "id": 2, "wrapped": False}
+    sql, params = cursor.execute.call_args.args
+    assert "ORDER BY s.shuffle_key, s.post_id" in sql
+    assert params[0] == 5 % SHUFFLE_BUCKETS
+
+def test_recommend_page_wraps_around_key_space():
+    cursor = MagicMock()
+    # Tail of the key space has one post, the wrapped head supplies the rest
+    cursor.fetchall.side_effect = [[post(1, 900)], [post(2, 3), post(3, 4)]]
+
+    posts, next_state = fetch_recommend_page(cursor, 3, {"seed": 8})
+
+    assert [p["id"] for p in posts] == [1, 2, 3]
+    assert next_state["wrapped"] is True
+    assert (next_state["key"], next_state["id"]) == (4, 3)
+    wrapped_sql = cursor.execute.call_args_list[1].args[0]
+    assert "s.shuffle_key < %s" in wrapped_sql
+
+def test_recommend_page_exhausted_returns_no_state():
+    cursor = MagicMock()
+    cursor.fetchall.side_effect = [[post(1, 900)], []]
+
+    posts, next_state = fetch_recommend_page(cursor, 5, {"seed": 1, "key": 10, "id": 4, "wrapped": False})
+
+    assert len(posts) == 1
+    assert next_state is None
+
+def test_get_posts_page_recommend_uses_cursor(mock_db):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchall.return_value = [post(1, 10)]
+
+    page = PostService.get_posts_page(limit=1)
+
+    assert [p["id"] for p in page["posts"]] == [1]
+    state = decode_cursor(page["next_cursor"])
+    assert state["key"] == 10 and state["id"] == 1
+    assert not any("RAND()" in str(call) for call in mock_cursor.execute.call_args_list)
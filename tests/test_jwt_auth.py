@@ -0,0 +1,35 @@
+import asyncio
+from fastapi.security import HTTPAuthorizationCredentials
+from backend import jwt_auth
+from backend.auth_service import AuthService
+from backend.jwt_auth import auth_stats, create_access_token, get_current_user
+
+def authenticate(token):
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    return asyncio.run(get_current_user(credentials))
+
+def test_repeated_requests_skip_decode_and_database(mock_db, mocker):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchone.return_value = {"id": 7, "username": "u", "nickname": "U", "avatar_url": None}
+    decode = mocker.spy(jwt_auth.jwt, 'decode')
+    before = auth_stats()
+    token = create_access_token({"sub": "7"})
+
+    for _ in range(3):
+        assert authenticate(token)["id"] == 7
+
+    assert decode.call_count == 1
+    assert mock_cursor.execute.call_count == 1
+    stats = auth_stats()
+    assert stats['user_db_lookups'] - before['user_db_lookups'] == 1
+    assert stats['user_cache_hits'] - before['user_cache_hits'] == 2
+
+def test_profile_update_invalidates_cached_user(mock_db):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchone.return_value = {"id": 7, "username": "u", "nickname": "U", "avatar_url": None}
+    assert AuthService.get_user_by_id(7)["nickname"] == "U"
+
+    AuthService.update_user_profile(7, "New")
+    mock_cursor.fetchone.return_value = {"id": 7, "username": "u", "nickname": "New", "avatar_url": None}
+
+    assert AuthService.get_user_by_id("7")["nickname"] == "New"
@@ -0,0 +1,44 @@
+from backend.auth_service import AuthService
+from backend.loaders import UserLoader, request_scope
+
+def test_loader_batches_primed_ids_and_memoizes(mocker):
+    fetch = mocker.Mock(return_value={1: {"id": 1}, 3: {"id": 3}})
+    loader = UserLoader(fetch)
+
+    loader.prime([1, 2, "3"])
+    assert fetch.call_count == 0
+    assert loader.load(1) == {"id": 1}
+    fetch.assert_called_once_with([1, 2, 3])
+
+    # Memoized, including users that do not exist
+    assert loader.load_many([3, 2]) == {3: {"id": 3}, 2: None}
+    assert fetch.call_count == 1
+
+def test_get_users_by_ids_single_query_for_misses(mock_db):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchall.return_value = [{"id": 4, "username": "d", "nickname": "D", "avatar_url": None}]
+    mock_cursor.fetchone.return_value = {"id": 5, "username": "e", "nickname": "E", "avatar_url": None}
+    AuthService.get_user_by_id(5)  # now cached
+    mock_cursor.execute.reset_mock()
+
+    users = AuthService.get_users_by_ids([4, 5, 4])
+
+    assert set(users) == {4, 5}
+    sql, params = mock_cursor.execute.call_args.args
+    assert "WHERE id IN (%s)" in sql
+    assert params == (4,)
+
+def test_get_user_by_id_uses_request_loader(mock_db):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchall.return_value = [
+        {"id": 1, "username": "a", "nickname": "A", "avatar_url": None},
+        {"id": 2, "username": "b", "nickname": "B", "avatar_url": None},
+    ]
+
+    with request_scope() as loader:
+        loader.prime([1, 2])
+        assert AuthService.get_user_by_id(1)["nickname"] == "A"
+        assert AuthService.get_user_by_id("2")["nickname"] == "B"
+
+    assert mock_cursor.execute.call_count == 1
+    assert loader.batches == 1
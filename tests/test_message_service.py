@@ -0,0 +1,130 @@
+import pytest
+from datetime import datetime
+from backend.message_service import MessageService
+
+def test_send_message_updates_conversation_summary(mock_db):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchone.return_value = {"id": 3}
+    mock_cursor.lastrowid = 77
+
+    success, _ = MessageService.send_message(5, 3, "hi")
+
+    assert success is True
+    statements = [c.args for c in mock_cursor.execute.call_args_list]
+    sql, params = next(s for s in statements if "INSERT INTO conversations" in s[0])
+    # Pair (3, 5): the receiver is user_low, so unread_low goes up
+    assert params == (3, 5, 77, 1, 0)
+    sql, params = next(s for s in statements if "INSERT INTO user_counters" in s[0])
+    assert params == (3, 1, 0, 1, 0)
+    mock_conn.commit.assert_called_once()
+
+def test_conversation_summary_never_moves_backwards():
+    from backend.message_service import TOUCH_CONVERSATION_SQL
+    updates = TOUCH_CONVERSATION_SQL.split("ON DUPLICATE KEY UPDATE")[1]
+    time_at = updates.index("last_time = IF(VALUES(last_message_id) > last_message_id")
+    id_at = updates.index("last_message_id = GREATEST(last_message_id, VALUES(last_message_id))")
+    # Assignments apply left to right: last_time must compare against the old id
+    assert time_at < id_at
+
+def test_total_unread_count_reads_counter_row(mock_db):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchall.return_value = [{"user_id": 4, "total": 7}]
+
+    assert MessageService.get_total_unread_count(4) == 7
+    assert mock_cursor.execute.call_count == 1
+    sql, params = mock_cursor.execute.call_args.args
+    assert "FROM user_counters" in sql
+    assert params == (4,)
+
+    # No counter row yet: nothing unread
+    mock_cursor.fetchall.return_value = []
+    assert MessageService.get_total_unread_count(4) == 0
+
+def test_mark_messages_read_moves_watermark(mock_db, mocker):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchone.return_value = {"last_message_id": 120, "unread_count": 3, "last_read": 80}
+    mock_cursor.fetchall.return_value = [{"user_id": 4, "total": 0}]
+    publish = mocker.patch('backend.message_service.hub.publish')
+
+    assert MessageService.mark_messages_read(4, 9) is True
+
+    statements = [c.args for c in mock_cursor.execute.call_args_list]
+    # One conversations row is updated; messages rows are not touched
+    assert not any(sql.lstrip().startswith("UPDATE messages") for sql, _ in statements)
+    sql, params = next(s for s in statements if s[0].startswith("UPDATE conversations"))
+    assert "read_low = last_message_id, unread_low = 0" in sql
+    assert params == (4, 9)
+    sql, params = next(s for s in statements if "user_counters (" in s[0])
+    assert params == (4, -3, 0, -3, 0)
+    mock_conn.commit.assert_called_once()
+    publish.assert_any_call(9, 'read', {'reader_id': 4, 'last_read_message_id': 120})
+
+def test_mark_messages_read_noop_when_caught_up(mock_db):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchone.return_value = {"last_message_id": 120, "unread_count": 0, "last_read": 120}
+
+    assert MessageService.mark_messages_read(4, 9) is True
+    assert mock_cursor.execute.call_count == 1
+
+def test_mark_notifications_read_recounts_in_one_transaction(mock_db, mocker):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.rowcount = 2
+    mock_cursor.fetchall.return_value = [{"user_id": 4, "total": 0}]
+    publish = mocker.patch('backend.message_service.hub.publish')
+
+    assert MessageService.mark_notifications_read(4) is True
+
+    statements = [c.args[0] for c in mock_cursor.execute.call_args_list]
+    assert statements[0].startswith("UPDATE notifications SET is_read = TRUE")
+    assert "COUNT(*) FROM notifications" in statements[1]
+    mock_conn.begin.assert_called_once()
+    mock_conn.commit.assert_called_once()
+    publish.assert_called_once_with(4, 'unread', {'source': 'notifications', 'delta': -2, 'total': 0})
+
+def test_get_conversations_page_single_query(mock_db):
+    mock_conn, mock_cursor = mock_db
+    last_time = datetime(2024, 5, 1, 8, 0, 0)
+    mock_cursor.fetchall.return_value = [{
+        "other_user_id": 9, "last_time": last_time, "unread_count": 2,
+        "nickname": "B", "avatar_url": None, "content": "yo", "is_read": False, "sender_id": 9,
+    }]
+
+    page = MessageService.get_conversations_page(1, limit=1)
+
+    assert mock_cursor.execute.call_count == 1
+    sql, params = mock_cursor.execute.call_args.args
+    assert "UNION ALL" in sql
+    assert params == (1, 1, 1, 1, 1)
+    assert page["conversations"][0]["user"]["id"] == 9
+    assert page["conversations"][0]["unread_count"] == 2
+    assert page["next_cursor"]
+
+    MessageService.get_conversations_page(1, limit=1, cursor=page["next_cursor"])
+    sql, params = mock_cursor.execute.call_args.args
+    assert "last_time < %s OR (last_time = %s AND user_high < %s)" in sql
+
+def test_conversation_page_by_message_id(mock_db):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchall.side_effect = [
+        # Newest first, one extra row to detect more history
+        [{"id": 30, "sender_id": 5, "receiver_id": 3, "content": "c", "created_at": None},
+         {"id": 20, "sender_id": 3, "receiver_id": 5, "content": "b", "created_at": None},
+         {"id": 10, "sender_id": 5, "receiver_id": 3, "content": "a", "created_at": None}],
+        [{"read_low": 10, "read_high": 20}],
+        [{"id": 3, "nickname": "A", "avatar_url": None}, {"id": 5, "nickname": "B", "avatar_url": None}],
+    ]
+
+    page = MessageService.get_conversation_page(3, 5, limit=2, before_id=40)
+
+    sql, params = mock_cursor.execute.call_args.args
+    assert "conversation_key = %s AND id < %s ORDER BY id DESC" in sql
+    assert params[:3] == ((3 << 32) | 5, 40, 3)
+    assert [m["id"] for m in page["messages"]] == [20, 30]
+    assert page["has_more"] is True
+    # 20 went to user 5 (read up to 20); 30 went to user 3 (read up to 10)
+    assert [m["is_read"] for m in page["messages"]] == [True, False]
+    assert set(page["users"]) == {3, 5}
+
+def test_conversation_page_rejects_both_directions():
+    with pytest.raises(ValueError):
+        MessageService.get_conversation_page(3, 5, before_id=10, after_id=20)
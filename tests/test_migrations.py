@@ -0,0 +1,105 @@
+import pymysql
+import pytest
+from backend.migrations import HOT_QUERIES, _checksum, discover_migrations, migrate, split_sql, verify
+
+def test_split_sql_ignores_semicolons_in_strings_and_comments():
+    script = """
+        -- first; statement
+        CREATE TABLE a (x VARCHAR(10) DEFAULT ';');
+        /* block; comment */
+        INSERT INTO a VALUES ('it''s; fine');
+    """
+    statements = split_sql(script)
+    assert len(statements) == 2
+    assert statements[0].startswith("CREATE TABLE a")
+    assert "'it''s; fine'" in statements[1]
+
+def test_discover_migrations_sorted_and_unique(tmp_path):
+    (tmp_path / "0002_second.sql").write_text("SELECT 2;")
+    (tmp_path / "0001_first.sql").write_text("SELECT 1;")
+    (tmp_path / "notes.txt").write_text("ignored")
+
+    migrations = discover_migrations(str(tmp_path))
+    assert [(v, n) for v, n, _ in migrations] == [(1, "first"), (2, "second")]
+
+    (tmp_path / "0002_duplicate.sql").write_text("SELECT 3;")
+    with pytest.raises(ValueError):
+        discover_migrations(str(tmp_path))
+
+def test_migrate_applies_only_pending_versions(mock_db, tmp_path):
+    mock_conn, mock_cursor = mock_db
+    (tmp_path / "0001_first.sql").write_text("SELECT 1;")
+    (tmp_path / "0002_second.sql").write_text("ALTER TABLE t ADD INDEX i (x); SELECT 2;")
+    mock_cursor.fetchall.return_value = [{"version": 1, "checksum": _checksum("SELECT 1;")}]
+
+    applied = migrate(mock_conn, str(tmp_path))
+
+    assert applied == [2]
+    executed = [call.args[0] for call in mock_cursor.execute.call_args_list]
+    assert "SELECT 1" not in executed
+    assert "ALTER TABLE t ADD INDEX i (x)" in executed
+    assert any("INSERT INTO schema_migrations" in sql for sql in executed)
+
+def test_migrate_refuses_edited_applied_migration(mock_db, tmp_path):
+    mock_conn, mock_cursor = mock_db
+    (tmp_path / "0001_first.sql").write_text("SELECT 1; SELECT 'edited';")
+    (tmp_path / "0002_second.sql").write_text("SELECT 2;")
+    mock_cursor.fetchall.return_value = [{"version": 1, "checksum": _checksum("SELECT 1;")}]
+
+    with pytest.raises(ValueError, match="0001_first"):
+        migrate(mock_conn, str(tmp_path))
+
+    executed = [call.args[0] for call in mock_cursor.execute.call_args_list]
+    assert "SELECT 2" not in executed
+
+def test_migrate_runs_range_updates_in_batches(mock_db, tmp_path):
+    mock_conn, mock_cursor = mock_db
+    (tmp_path / "0001_backfill.sql").write_text(
+        "UPDATE messages SET k = 1 WHERE id BETWEEN %(first_id)s AND %(last_id)s AND k IS NULL;"
+    )
+    mock_cursor.fetchall.return_value = []
+    mock_cursor.fetchone.return_value = {"min_id": 1, "max_id": 25}
+
+    migrate(mock_conn, str(tmp_path), batch_size=10)
+
+    batches = [call.args[1] for call in mock_cursor.execute.call_args_list if call.args[0].startswith("UPDATE")]
+    assert batches == [
+        {"first_id": 1, "last_id": 10}, {"first_id": 11, "last_id": 20}, {"first_id": 21, "last_id": 25},
+    ]
+
+def test_migrate_tolerates_existing_index(mock_db, tmp_path):
+    mock_conn, mock_cursor = mock_db
+    (tmp_path / "0001_index.sql").write_text("ALTER TABLE t ADD INDEX i (x);")
+    mock_cursor.fetchall.return_value = []
+
+    def execute(sql, params=None):
+        if sql.startswith("ALTER TABLE"):
+            raise pymysql.err.OperationalError(1061, "Duplicate key name 'i'")
+
+    mock_cursor.execute.side_effect = execute
+
+    assert migrate(mock_conn, str(tmp_path)) == [1]
+
+def test_verify_reports_full_table_scans(mock_db):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchall.side_effect = [
+        [{"table": "p", "type": "ref"}, {"table": "u", "type": "eq_ref"}],
+        [{"table": "messages", "type": "ALL"}],
+    ]
+    queries = [("feed", "SELECT 1", ()), ("inbox", "SELECT 2", ())]
+
+    assert verify(mock_conn, queries) == [("inbox", "messages")]
+
+def test_verify_ignores_insert_targets_and_derived_tables(mock_db):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchall.return_value = [
+        {"select_type": "INSERT", "table": "user_counters", "type": "ALL"},
+        {"select_type": "PRIMARY", "table": "<derived2>", "type": "ALL"},
+        {"select_type": "DERIVED", "table": "conversations", "type": "ref"},
+    ]
+
+    assert verify(mock_conn, [("recount", "INSERT 1", ())]) == []
+
+def test_hot_queries_bind_every_placeholder():
+    for name, sql, params in HOT_QUERIES:
+        assert sql.count("%s") == len(params), name
@@ -0,0 +1,77 @@
+import pytest
+from backend.notifications import NotificationQueue, summarize
+
+@pytest.fixture
+def queue(mocker):
+    # Drive the queue with flush() instead of the worker thread
+    mocker.patch.object(NotificationQueue, '_ensure_started')
+    return NotificationQueue()
+
+def test_burst_of_likes_coalesces_into_one_row(queue, mock_db):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchall.side_effect = [
+        [{"id": 42, "user_id": 1, "title": "早餐"}],
+        [{"id": 900, "receiver_id": 1, "group_key": "like_post:42"}],
+        [{"notification_id": 900, "actors": 3}],
+        [{"user_id": 1, "total": 4}],
+    ]
+    for sender_id in (2, 3, 4, 3):
+        queue.enqueue('like_post', sender_id, 42)
+
+    assert queue.flush() == 1
+
+    (upsert_sql, rows), (actors_sql, actors), (count_sql, counts) = [
+        c.args for c in mock_cursor.executemany.call_args_list
+    ]
+    assert "ON DUPLICATE KEY UPDATE" in upsert_sql
+    assert rows == [(1, 3, 'like_post', 42, "赞了你的帖子《早餐》", 3, 'like_post:42')]
+    assert actors == [(900, 2), (900, 4), (900, 3)]
+    assert counts == [(3, 900)]
+    stats = queue.stats()
+    assert stats['depth'] == 0
+    assert stats['coalesced'] == 3
+    # The receiver's unread counter is recounted in the same transaction
+    statements = [c.args[0] for c in mock_cursor.execute.call_args_list]
+    assert any("INSERT INTO user_counters" in sql for sql in statements)
+    mock_conn.commit.assert_called_once()
+
+def test_repeat_actor_across_batches_counts_once(queue, mock_db, mocker):
+    from backend.pubsub import hub
+    publish = mocker.patch.object(hub, 'publish')
+    mock_conn, mock_cursor = mock_db
+    # Second batch: follower 2 follows again after unfollowing; already an actor of row 77
+    mock_cursor.fetchall.side_effect = [
+        [{"id": 77, "receiver_id": 5, "group_key": "follow"}],
+        [{"notification_id": 77, "actors": 1}],
+        [{"user_id": 5, "total": 1}],
+    ]
+    queue.enqueue('follow', 2, receiver_id=5)
+
+    queue.flush()
+
+    upsert_sql = mock_cursor.executemany.call_args_list[0].args[0]
+    assert "actor_count + " not in upsert_sql
+    actors_sql, actors = mock_cursor.executemany.call_args_list[1].args
+    assert actors_sql.startswith("INSERT IGNORE INTO notification_actors")
+    assert actors == [(77, 2)]
+    event = publish.call_args_list[0].args
+    assert event[1] == 'notification' and event[2]['actor_count'] == 1
+
+def test_self_notifications_are_skipped(queue, mock_db):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchall.return_value = [{"id": 42, "user_id": 1, "title": "早餐"}]
+    queue.enqueue('like_post', 1, 42)
+
+    assert queue.enqueue('follow', 5, receiver_id=5) is False
+    assert queue.flush() == 0
+    mock_cursor.executemany.assert_not_called()
+
+def test_full_queue_drops_events(queue):
+    queue.max_size = 1
+    assert queue.enqueue('follow', 1, receiver_id=2) is True
+    assert queue.enqueue('follow', 3, receiver_id=2) is False
+    assert queue.stats()['dropped'] == 1
+
+def test_summarize_aggregated_notification():
+    row = {"sender_name": "A", "actor_count": 38, "content": "赞了你的帖子《早餐》"}
+    assert summarize(row) == "A 等38人赞了你的帖子《早餐》"
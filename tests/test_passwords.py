@@ -0,0 +1,86 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+import pytest
+from fastapi.testclient import TestClient
+from backend.auth_service import AuthService
+from backend.passwords import PasswordHasher, PasswordHasherBusy, hash_rounds
+
+@pytest.fixture
+def hasher(mocker):
+    # Inline, cheap hashes for tests
+    hasher = PasswordHasher(rounds=4, workers=0, queue_limit=2)
+    mocker.patch('backend.auth_service.password_hasher', hasher)
+    return hasher
+
+def test_hash_uses_configured_rounds(hasher):
+    password_hash = hasher.hash("secret1")
+    assert hash_rounds(password_hash) == 4
+    assert hasher.verify("secret1", password_hash) is True
+    assert hasher.needs_rehash(password_hash) is False
+
+def test_full_queue_sheds_load(hasher):
+    # Every slot (workers + queue_limit) taken by hashes in progress
+    for _ in range(max(hasher.workers, 1) + hasher.queue_limit):
+        hasher._acquire()
+    with pytest.raises(PasswordHasherBusy):
+        hasher.hash("secret1")
+    assert hasher.stats()['rejected'] == 1
+
+def test_async_hash_runs_on_process_pool():
+    hasher = PasswordHasher(rounds=4, workers=1, queue_limit=0)
+    try:
+        password_hash = asyncio.run(hasher.hash_async("secret1"))
+        assert asyncio.run(hasher.verify_async("secret1", password_hash)) is True
+        assert hasher.stats()['in_flight'] == 0
+    finally:
+        hasher.shutdown()
+
+def test_login_rehashes_when_cost_changed(hasher, mock_db):
+    mock_conn, mock_cursor = mock_db
+    old_hash = bcrypt.hashpw(b"password123", bcrypt.gensalt(5)).decode('utf-8')
+    mock_cursor.fetchone.return_value = {
+        "id": 1, "username": "u", "nickname": "U", "avatar_url": None, "password_hash": old_hash,
+    }
+
+    user, msg = AuthService.login_user("u", "password123")
+
+    assert user == {"id": 1, "username": "u", "nickname": "U", "avatar_url": None}
+    sql, params = mock_cursor.execute.call_args.args
+    assert sql.startswith("UPDATE users SET password_hash")
+    assert hash_rounds(params[0]) == 4
+    assert params[1:] == (1, old_hash)
+    assert hasher.stats()['rehashed'] == 1
+
+def test_login_returns_503_when_busy(hasher, mock_db, mocker):
+    from server import app
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchone.side_effect = lambda: {
+        "id": 1, "username": "u", "nickname": "U", "avatar_url": None, "password_hash": "$2b$04$x",
+    }
+    # Logins whose bcrypt step blocks until released, occupying the hasher's slots
+    release = threading.Event()
+    started = threading.Semaphore(0)
+
+    def slow_verify(password, password_hash):
+        started.release()
+        release.wait(5)
+        return True
+
+    mocker.patch('backend.passwords._verify', slow_verify)
+    client = TestClient(app)
+    login = lambda: client.post("/api/login", json={"username": "u", "password": "password123"})
+    slots = max(hasher.workers, 1) + hasher.queue_limit
+    with ThreadPoolExecutor(slots) as pool:
+        waiting = [pool.submit(login) for _ in range(slots)]
+        for _ in range(slots):
+            assert started.acquire(timeout=5)
+
+        response = login()
+        release.set()
+
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+        assert [f.result().json()["success"] for f in waiting] == [True] * slots
+    assert hasher.stats()['rejected'] == 1
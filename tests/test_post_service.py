@@ -1,6 +1,9 @@
 import pytest
+from contextlib import contextmanager
 from unittest.mock import MagicMock
 from backend.post_service import PostService
+from backend.counters import post_likes
+from backend.notifications import notification_queue
 
 def test_create_post_validation_empty_title():
     result, msg = PostService.create_post(1, "", "content", [])
@@ -37,29 +40,191 @@ def test_create_post_success(mock_db, mocker):
     insert_post_called = any("INSERT INTO posts" in str(call) for call in calls)
     assert insert_post_called
 
+def test_delete_post_removes_files_after_releasing_connection(mocker):
+    from backend.utils import ImageVariant
+    mock_conn, mock_cursor = MagicMock(), MagicMock()
+    mock_cursor.__enter__.return_value = mock_cursor
+    mock_conn.cursor.return_value = mock_cursor
+    mock_cursor.fetchone.return_value = {"user_id": 1, "category": "美食", "image_url": "assets/a.jpg", "video_url": None}
+    mock_cursor.fetchall.return_value = [{"image_url": "assets/a.jpg"}]
+    held = []
+
+    @contextmanager
+    def connection():
+        held.append(mock_conn)
+        yield mock_conn
+        held.pop()
+
+    mocker.patch('backend.database.db.connection', side_effect=connection)
+    mocker.patch('backend.post_service.os.path.exists', return_value=True)
+    removed = []
+    mocker.patch('backend.post_service.os.remove', side_effect=lambda path: removed.append((path, bool(held))))
+    mocker.patch('backend.post_service.list_variants',
+                 return_value=[ImageVariant(320, 'webp', "assets/a_w320.webp", 900)])
+
+    assert PostService.delete_post(7, 1) == (True, "Post deleted successfully")
+    assert "DELETE FROM posts" in mock_cursor.execute.call_args.args[0]
+    # Each file once, with the connection already returned
+    assert removed == [("assets/a.jpg", False), ("assets/a_w320.webp", False)]
+
+def like_batch(epoch, removed, added):
+    """fetch_batch results of a like: the epoch read, then the affected row counts."""
+    epochs = [{"epoch": epoch}] if epoch is not None else []
+    return [epochs] + [[{"removed": removed, "added": added}]] * 4
+
 def test_toggle_like_new(mock_db):
     mock_conn, mock_cursor = mock_db
     
-    # Mock check: not liked yet
-    mock_cursor.fetchone.return_value = None
-    
-    # Mock post fetch for notification
-    # We need to configure side_effect for fetchone because it's called multiple times
-    # 1. check_sql (None)
-    # 2. post_sql (Returns post dict)
-    mock_cursor.fetchone.side_effect = [None, {"user_id": 2, "title": "Test Post"}]
+    # DELETE removes nothing (not liked yet), then the INSERT adds one row
+    mock_cursor.fetchall.side_effect = like_batch(4, 0, 1)
     
     success, msg = PostService.toggle_like(1, 100)
     
     assert success is True
     assert msg == "Liked"
     
-    # Verify INSERT like and UPDATE post count
-    # Also INSERT notification
-    assert mock_cursor.execute.call_count >= 3
+    # Epoch read, DELETE then INSERT like in one batch inside the transaction;
+    # the notification is queued for the background worker
+    mock_cursor.execute.assert_called_once()
+    sql = mock_cursor.execute.call_args.args[0]
+    assert "LOCK IN SHARE MODE" in sql
+    assert sql.index("DELETE FROM likes") < sql.index("ON DUPLICATE KEY")
+    mock_conn.commit.assert_called_once()
+    assert notification_queue.stats()['depth'] == 1
+    assert post_likes.pending(100) == 1
+
+def test_toggle_like_removes_existing_like(mock_db):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchall.side_effect = like_batch(4, 1, 0)
+
+    assert PostService.toggle_like(1, 100) == (True, "Unliked")
+    assert post_likes.pending(100) == -1
+    assert notification_queue.stats()['depth'] == 0
+
+def test_set_like_is_idempotent(mock_db):
+    mock_conn, mock_cursor = mock_db
+    
+    # Already liked: the upsert affects no rows
+    mock_cursor.fetchall.side_effect = like_batch(0, 0, 0)
+    
+    success, msg = PostService.set_like(1, 100, True)
+    
+    assert success is True
+    assert msg == "Liked"
+    sql = mock_cursor.execute.call_args.args[0]
+    assert "DELETE" not in sql
+    assert post_likes.pending(100) == 0
+
+def test_like_missing_post(mock_db):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchall.side_effect = like_batch(None, 0, 0)
+
+    assert PostService.set_like(1, 100, True) == (False, "帖子不存在")
+    mock_conn.rollback.assert_called_once()
 
+def test_get_posts_page_category_uses_keyset_cursor(mock_db):
+    from datetime import datetime
+    mock_conn, mock_cursor = mock_db
+    created = datetime(2024, 5, 1, 12, 0, 0)
+    mock_cursor.fetchall.return_value = [{"id": 9, "created_at": created}, {"id": 8, "created_at": created}]
+
+    page = PostService.get_posts_page(limit=2, category="美食")
+    sql, params = mock_cursor.execute.call_args.args
+    assert "ORDER BY p.created_at DESC, p.id DESC" in sql
+    assert "OFFSET" not in sql
+    assert page["next_cursor"]
+
+    PostService.get_posts_page(limit=2, cursor=page["next_cursor"], category="美食")
+    sql, params = mock_cursor.execute.call_args.args
+    assert "p.created_at < %s OR (p.created_at = %s AND p.id < %s)" in sql
+    assert params[-4:] == ("2024-05-01 12:00:00", "2024-05-01 12:00:00", 8, 2)
+
+def test_get_user_liked_posts_page_orders_by_like_time(mock_db):
+    from datetime import datetime
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchall.return_value = [
+        {"id": 3, "interacted_at": datetime(2024, 5, 2), "interaction_id": 41},
+    ]
+
+    page = PostService.get_user_liked_posts_page(1, limit=1)
+
+    sql, _ = mock_cursor.execute.call_args.args
+    assert "JOIN likes x" in sql
+    assert "ORDER BY x.created_at DESC, x.id DESC" in sql
+    assert page["posts"] == [{"id": 3}]
+    assert page["next_cursor"]
+
+def detail_row(**overrides):
+    row = {"id": 5, "user_id": 2, "title": "T", "image_url": "assets/a.jpg",
+           "is_private": False, "likes_count": 1, "nickname": "n", "avatar_url": None}
+    row.update(overrides)
+    return row
+
+def test_get_post_detail_single_round_trip(mock_db):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchall.side_effect = [
+        [detail_row()],
+        [{"image_url": "assets/a.jpg"}, {"image_url": "assets/b.jpg"}],
+        [{"likes_count": 3, "is_liked": 1, "is_collected": 0}],
+        [{"id": 1, "content": "hi"}],
+    ]
 
+    post = PostService.get_post_detail(5, current_user_id=7, include_comments=True)
 
+    assert mock_cursor.execute.call_count == 1
+    assert post["images"] == ["assets/a.jpg", "assets/b.jpg"]
+    assert post["likes_count"] == 3
+    assert post["is_liked"] is True and post["is_collected"] is False
+    assert post["comments"] == [{"id": 1, "content": "hi"}]
+
+def test_get_post_detail_reuses_cached_body(mock_db):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchall.side_effect = [
+        [detail_row()], [], [{"likes_count": 1, "is_liked": 0, "is_collected": 0}],
+        [{"likes_count": 2, "is_liked": 1, "is_collected": 1}],
+    ]
+
+    PostService.get_post_detail(5)
+    post = PostService.get_post_detail(5, current_user_id=7)
+
+    sql, params = mock_cursor.execute.call_args.args
+    assert "FROM post_images" not in sql
+    assert params == (7, 7, 5)
+    assert post["images"] == ["assets/a.jpg"]
+    assert post["likes_count"] == 2 and post["is_liked"] is True
+
+def test_get_post_detail_caches_missing_and_private(mock_db):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchall.side_effect = [
+        [], [], [],
+        [detail_row(id=6, is_private=True)], [], [{"likes_count": 0, "is_liked": 0, "is_collected": 0}],
+    ]
+
+    assert PostService.get_post_detail(404) is None
+    assert PostService.get_post_detail(404) is None
+    assert PostService.get_post_detail(6, current_user_id=9) is None
+    assert PostService.get_post_detail(6, current_user_id=9) is None
+    assert mock_cursor.execute.call_count == 2
+
+def test_get_viewer_state_one_query_for_page(mock_db):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchall.return_value = [
+        {"post_id": 1, "flag": "is_liked"},
+        {"post_id": 3, "flag": "is_collected"},
+    ]
 
+    states = PostService.get_viewer_state(7, [1, 2, 3, 1])
 
+    assert mock_cursor.execute.call_count == 1
+    sql, params = mock_cursor.execute.call_args.args
+    assert "UNION ALL" in sql
+    assert params == (7, 1, 2, 3, 7, 1, 2, 3)
+    assert states == {
+        1: {"is_liked": True, "is_collected": False},
+        2: {"is_liked": False, "is_collected": False},
+        3: {"is_liked": False, "is_collected": True},
+    }
 
+def test_get_viewer_state_rejects_too_many_ids():
+    with pytest.raises(ValueError):
+        PostService.get_viewer_state(7, range(1000))
@@ -0,0 +1,46 @@
+import asyncio
+import threading
+from backend.pubsub import PubSubHub, event_stream, format_sse, hub
+
+def test_publish_from_worker_thread_reaches_subscriber():
+    async def scenario():
+        local_hub = PubSubHub()
+        subscription = local_hub.subscribe(1)
+        thread = threading.Thread(target=local_hub.publish, args=(1, 'message', {'id': 5}))
+        thread.start()
+        thread.join()
+        message = await asyncio.wait_for(subscription.queue.get(), timeout=1)
+        assert local_hub.publish(2, 'message') == 0
+        return message
+
+    assert asyncio.run(scenario()) == {'event': 'message', 'data': {'id': 5}}
+
+def test_slow_subscriber_gets_resync_instead_of_backlog():
+    async def scenario():
+        local_hub = PubSubHub(queue_size=2)
+        subscription = local_hub.subscribe(1)
+        for i in range(3):
+            local_hub.publish(1, 'message', {'id': i})
+        await asyncio.sleep(0)
+        return subscription, local_hub.stats()
+
+    subscription, stats = asyncio.run(scenario())
+    assert subscription.queue.qsize() == 1
+    assert subscription.queue.get_nowait()['event'] == 'resync'
+    assert stats['overflows'] == 1
+
+def test_event_stream_heartbeat_and_cleanup():
+    async def scenario():
+        stream = event_stream(7, heartbeat_interval=0.01)
+        frames = [await stream.__anext__(), await stream.__anext__()]
+        assert hub.stats()['connections'] == 1
+        hub.publish(7, 'unread', {'delta': 1})
+        frames.append(await stream.__anext__())
+        await stream.aclose()
+        return frames
+
+    frames = asyncio.run(scenario())
+    assert frames[0] == format_sse('ready', {'user_id': 7})
+    assert frames[1] == ": ping\n\n"
+    assert frames[2] == 'event: unread\ndata: {"delta": 1}\n\n'
+    assert hub.stats()['connections'] == 0
@@ -0,0 +1,47 @@
+from backend.search_service import (
+    SearchService,
+    build_boolean_query,
+    fulltext_filter,
+    highlight,
+    search_terms,
+)
+
+def test_search_terms_strip_boolean_operators():
+    assert search_terms('+穿搭 -"美食" 穿搭 (攻略)*') == ["穿搭", "美食", "攻略"]
+
+def test_build_boolean_query_requires_every_term():
+    assert build_boolean_query(["复古", "穿搭"]) == '+"复古" +"穿搭"'
+
+def test_fulltext_filter_falls_back_to_like_for_short_terms():
+    condition, params = fulltext_filter("穿搭")
+    assert "MATCH(p.title, p.content)" in condition
+    assert params == ['+"穿搭"']
+
+    condition, params = fulltext_filter("猫")
+    assert "LIKE" in condition
+    assert params == ["%猫%", "%猫%"]
+
+def test_highlight_escapes_html_and_marks_terms():
+    assert highlight("<b>秋冬穿搭</b>", ["穿搭"]) == "&lt;b&gt;秋冬<em>穿搭</em>&lt;/b&gt;"
+
+def test_highlight_snippet_centres_on_match():
+    text = "开头" * 50 + "复古穿搭" + "结尾" * 50
+    snippet = highlight(text, ["穿搭"], max_length=40)
+    assert "<em>穿搭</em>" in snippet
+    assert snippet.startswith("…") and snippet.endswith("…")
+
+def test_search_posts_ranks_with_fulltext(mock_db):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchall.return_value = [
+        {"id": 1, "title": "复古穿搭", "content": "今日穿搭分享", "relevance": 3.5},
+    ]
+
+    result = SearchService.search_posts("穿搭", limit=1)
+
+    sql, params = mock_cursor.execute.call_args.args
+    assert "ORDER BY relevance DESC" in sql
+    assert "IN BOOLEAN MODE" in sql
+    post = result["posts"][0]
+    assert post["relevance"] == 3.5
+    assert post["highlight"]["title"] == "复古<em>穿搭</em>"
+    assert result["next_cursor"]
@@ -0,0 +1,170 @@
+import pytest
+from datetime import datetime
+from backend.social_graph import SocialGraph, build_adjacency
+from backend.user_service import UserService
+
+EDGES = [(1, 2), (1, 3), (2, 1), (3, 1), (4, 1), (1, 5)]
+SINCE = {"since": datetime(2024, 5, 1, 8, 0, 0)}
+
+def edge_rows(edges):
+    return [{"id": i + 1, "follower_id": a, "followed_id": b} for i, (a, b) in enumerate(edges)]
+
+def event(event_id, follower_id, followed_id, follow_id):
+    return {"id": event_id, "follower_id": follower_id, "followed_id": followed_id, "follow_id": follow_id}
+
+@pytest.fixture
+def graph(mock_db):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchone.return_value = SINCE
+    mock_cursor.fetchall.side_effect = [edge_rows(EDGES), []]
+    graph = SocialGraph(max_age=0, poll_interval=0, batch_size=1000)
+    assert graph.load() == len(EDGES)
+    mock_cursor.fetchall.side_effect = None
+    return graph
+
+def test_build_adjacency_sorts_and_dedupes():
+    following, followers, following_log, followers_log = build_adjacency([(1, 1, 5), (2, 1, 2), (3, 1, 5)])
+    assert list(following[1]) == [2, 5]
+    assert list(followers[5]) == [1]
+    assert list(following_log[1][0]) == [1, 2, 3]
+
+def test_lookups(graph):
+    assert graph.is_following(1, 2) is True
+    assert graph.is_following(2, 3) is False
+    assert graph.following_states(1, [2, 4, 5]) == {2: True, 4: False, 5: True}
+
+def test_pages_newest_follow_first(graph):
+    assert graph.followers(1) == [(5, 4), (4, 3), (3, 2)]
+    assert graph.followers(1, limit=2) == [(5, 4), (4, 3)]
+    assert graph.followers(1, before=4, limit=2) == [(3, 2)]
+    assert graph.following(1) == [(6, 5), (2, 3), (1, 2)]
+    assert graph.followers(9) == []
+
+def test_mutuals_and_counts(graph):
+    assert graph.mutuals(1) == [2, 3]
+    assert graph.counts(1) == {'followers': 3, 'following': 3}
+
+def test_incremental_updates(graph):
+    graph.add(4, 2, 7)
+    graph.remove(1, 3)
+    assert graph.is_following(4, 2) is True
+    assert graph.is_following(1, 3) is False
+    assert graph.following_states(1, [2, 3]) == {2: True, 3: False}
+    assert graph.followers(2) == [(7, 4), (1, 1)]
+    assert graph.mutuals(1) == [2]
+
+def test_stats_report_memory(graph):
+    stats = graph.stats()
+    assert stats['ready'] is True
+    assert stats['edges'] == len(EDGES)
+    assert stats['memory_bytes'] > 0
+
+def test_poll_applies_other_processes_follows(graph, mock_db):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchall.return_value = [event(1, 5, 1, 8), event(2, 2, 1, None)]
+
+    assert graph.poll() == 2
+    assert graph.followers(1) == [(8, 5), (5, 4), (4, 3)]
+    assert graph.is_following(2, 1) is False
+    # Events stay in the window for a while; replaying them changes nothing
+    assert graph.poll() == 0
+
+def test_poll_skips_events_older_than_own_write(graph, mock_db):
+    mock_conn, mock_cursor = mock_db
+    graph.add(2, 3, 9, event_id=5)
+    # A poll that read the log before this process's follow committed
+    mock_cursor.fetchall.return_value = [event(4, 2, 3, None)]
+
+    assert graph.poll() == 0
+    assert graph.is_following(2, 3) is True
+
+def test_graph_stops_answering_when_polls_fail(graph, mock_db):
+    mock_conn, mock_cursor = mock_db
+    graph.poll_interval = 2
+    graph._poller = object()  # keep the test from starting the thread
+    graph._polled_at -= 7
+
+    assert graph.is_following(1, 2) is None
+    assert graph.followers(1) is None
+    assert graph.stats()['fresh'] is False
+
+    mock_cursor.fetchall.return_value = []
+    assert graph.poll() == 0
+    assert graph.is_following(1, 2) is True
+
+def test_clear_discards_a_load_in_progress(graph, mock_db):
+    mock_conn, mock_cursor = mock_db
+    graph._loading = True
+    graph.clear()
+    assert graph.stats()['loading'] is False
+
+    mock_cursor.fetchall.side_effect = [edge_rows(EDGES), []]
+    # Cleared while the edges are being read
+    mock_cursor.execute.side_effect = lambda sql, params: graph.clear() if "FROM follows" in sql else None
+    assert graph.load() is None
+    assert graph.stats()['ready'] is False
+    assert graph.stats()['loading'] is False
+
+def test_user_service_answers_from_graph(graph, mock_db, mocker):
+    mock_conn, mock_cursor = mock_db
+    mocker.patch('backend.user_service.social_graph', graph)
+    mock_cursor.execute.reset_mock()
+
+    assert UserService.is_following(1, 5) is True
+    assert UserService.get_following_states(1, [2, 4]) == {2: True, 4: False}
+    mock_cursor.execute.assert_not_called()
+
+def test_followers_page_reads_graph_page_by_primary_key(graph, mock_db, mocker):
+    mock_conn, mock_cursor = mock_db
+    mocker.patch('backend.user_service.social_graph', graph)
+    followed_at = datetime(2024, 5, 1, 8, 0, 0)
+    mock_cursor.fetchall.side_effect = [
+        [{"follow_id": fid, "followed_at": followed_at, "id": uid, "username": str(uid),
+          "nickname": str(uid), "avatar_url": None} for fid, uid in ((4, 3), (5, 4))],
+        [{"total": 3}],
+    ]
+
+    page = UserService.get_followers_page(1, current_user_id=1, limit=2)
+
+    sql, params = mock_cursor.execute.call_args.args
+    assert "WHERE f.id IN (%s, %s)" in sql
+    assert params == (5, 4, 1)
+    assert [user["id"] for user in page["users"]] == [4, 3]
+    assert [user["is_following"] for user in page["users"]] == [0, 1]
+    assert page["total"] == 3
+
+    mock_cursor.fetchall.side_effect = [
+        [{"follow_id": 3, "followed_at": followed_at, "id": 2, "username": "2",
+          "nickname": "2", "avatar_url": None}],
+        [{"total": 3}],
+    ]
+    page = UserService.get_followers_page(1, current_user_id=1, limit=2, cursor=page["next_cursor"])
+    assert mock_cursor.execute.call_args.args[1] == (3, 1)
+    assert [user["id"] for user in page["users"]] == [2]
+    assert page["next_cursor"] is None
+
+def test_mutual_follows_from_graph(graph, mock_db, mocker):
+    mock_conn, mock_cursor = mock_db
+    mocker.patch('backend.user_service.social_graph', graph)
+    mock_cursor.fetchall.return_value = [
+        {"id": uid, "username": str(uid), "nickname": str(uid), "avatar_url": None} for uid in (2, 3)
+    ]
+
+    assert [user["id"] for user in UserService.get_mutual_follows(1)] == [2, 3]
+    sql = mock_cursor.execute.call_args.args[0]
+    assert "FROM users WHERE id IN" in sql
+
+def test_user_service_falls_back_to_sql_when_graph_is_stale(graph, mock_db, mocker):
+    mock_conn, mock_cursor = mock_db
+    mocker.patch('backend.user_service.social_graph', graph)
+    graph.poll_interval = 2
+    graph._poller = object()
+    graph._polled_at -= 7
+    mock_cursor.execute.reset_mock()
+    # Followed in another process since the last poll
+    mock_cursor.fetchone.return_value = {"id": 9}
+    mock_cursor.fetchall.return_value = [{"followed_id": 4}]
+
+    assert UserService.is_following(1, 4) is True
+    assert UserService.get_following_states(1, [2, 4]) == {2: False, 4: True}
+    assert mock_cursor.execute.call_count == 2
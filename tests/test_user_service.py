@@ -0,0 +1,183 @@
+import threading
+import time
+from contextlib import contextmanager
+import pymysql
+import pytest
+from datetime import datetime
+from backend.user_service import UserService
+from backend.notifications import notification_queue
+
+def test_follow_user_bumps_both_counts(mock_db):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.rowcount = 1
+
+    success, msg = UserService.follow_user(2, 7)
+
+    assert success is True
+    sql, params = mock_cursor.execute.call_args.args
+    assert "UPDATE users" in sql
+    assert params == (2, 1, 7, 1, 2, 7)
+    mock_conn.commit.assert_called_once()
+    assert notification_queue.stats()['depth'] == 1
+
+def test_follow_user_twice_keeps_counts(mock_db):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.rowcount = 0  # ON DUPLICATE KEY UPDATE id = id changed nothing
+
+    success, msg = UserService.follow_user(2, 7)
+
+    assert success is False
+    assert msg == "Already following"
+    assert mock_cursor.execute.call_count == 2  # row locks, then the INSERT
+    mock_conn.commit.assert_not_called()
+
+class UserRowLocks:
+    """InnoDB-style shared/exclusive locks on users rows, with deadlock detection."""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.shared = {}     # user_id -> transactions holding S
+        self.exclusive = {}  # user_id -> transaction holding X
+        self.waiting = {}    # transaction -> user_id it waits to lock X
+        self.counts = {}
+
+    def lock(self, txn, user_id, exclusive):
+        with self.cond:
+            while True:
+                owner = self.exclusive.get(user_id)
+                others = self.shared.get(user_id, set()) - {txn}
+                if owner in (None, txn) and not (exclusive and others):
+                    break
+                # Two holders of S both waiting to upgrade to X: neither can proceed
+                if exclusive and any(self.waiting.get(other) == user_id for other in others):
+                    raise pymysql.err.OperationalError(1213, "Deadlock found when trying to get lock")
+                self.waiting[txn] = user_id
+                assert self.cond.wait(timeout=5), "lock wait timeout"
+            self.waiting.pop(txn, None)
+            if exclusive:
+                self.exclusive[user_id] = txn
+            else:
+                self.shared.setdefault(user_id, set()).add(txn)
+
+    def release(self, txn):
+        with self.cond:
+            for holders in self.shared.values():
+                holders.discard(txn)
+            self.exclusive = {uid: t for uid, t in self.exclusive.items() if t != txn}
+            self.cond.notify_all()
+
+class LockingCursor:
+    """Applies the row locks the follow statements take in MySQL, pausing after each one."""
+
+    def __init__(self, locks, txn):
+        self.locks, self.txn, self.rowcount, self.lastrowid = locks, txn, 0, 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params):
+        if "FOR UPDATE" in sql:
+            for user_id in sorted(params):
+                self.locks.lock(self.txn, user_id, exclusive=True)
+        elif "INSERT INTO follows" in sql:
+            for user_id in params:  # foreign key checks
+                self.locks.lock(self.txn, user_id, exclusive=False)
+            self.rowcount = 1
+        elif "UPDATE users" in sql:
+            follower_id, _, followed_id, delta = params[:4]
+            for user_id in (follower_id, followed_id):
+                self.locks.lock(self.txn, user_id, exclusive=True)
+            self.locks.counts[followed_id] = self.locks.counts.get(followed_id, 0) + delta
+        time.sleep(0.05)  # let the other transaction run its next statement
+
+class LockingConnection:
+    def __init__(self, locks):
+        self.locks = locks
+
+    def cursor(self):
+        return LockingCursor(self.locks, self)
+
+    def begin(self):
+        pass
+
+    def commit(self):
+        self.locks.release(self)
+
+    def rollback(self):
+        self.locks.release(self)
+
+def test_concurrent_follows_of_one_account_do_not_deadlock(mocker):
+    locks = UserRowLocks()
+
+    @contextmanager
+    def connection():
+        yield LockingConnection(locks)
+
+    mocker.patch('backend.database.db.connection', side_effect=connection)
+    results = {}
+    threads = [
+        threading.Thread(target=lambda uid=uid: results.__setitem__(uid, UserService.follow_user(uid, 7)))
+        for uid in (2, 3)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {2: (True, "Followed successfully"), 3: (True, "Followed successfully")}
+    assert locks.counts == {7: 2}
+
+def test_unfollow_user_decrements_counts(mock_db):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.rowcount = 1
+
+    success, _ = UserService.unfollow_user(2, 7)
+
+    assert success is True
+    event_sql, event_params = mock_cursor.execute.call_args_list[-2].args
+    assert "INSERT INTO follow_events" in event_sql
+    assert event_params == (2, 7, None)
+    sql, params = mock_cursor.execute.call_args.args
+    assert params == (2, -1, 7, -1, 2, 7)
+
+def test_get_follow_counts_reads_user_row(mock_db):
+    mock_conn, mock_cursor = mock_db
+    mock_cursor.fetchone.return_value = {"follower_count": 1000000, "following_count": 12}
+
+    assert UserService.get_follow_counts(7) == {'followers': 1000000, 'following': 12}
+    assert mock_cursor.execute.call_count == 1
+    assert "FROM users WHERE id" in mock_cursor.execute.call_args.args[0]
+
+def test_followers_page_keyset_and_total(mock_db):
+    mock_conn, mock_cursor = mock_db
+    followed_at = datetime(2024, 5, 1, 8, 0, 0)
+    mock_cursor.fetchall.side_effect = [
+        [{"follow_id": 31, "followed_at": followed_at, "id": 4, "username": "d",
+          "nickname": "D", "avatar_url": None, "is_following": 1}],
+        [{"total": 1000000}],
+    ]
+
+    page = UserService.get_followers_page(7, current_user_id=2, limit=1)
+
+    sql, params = mock_cursor.execute.call_args.args
+    assert "LEFT JOIN follows f2" in sql
+    assert "ORDER BY f.created_at DESC, f.id DESC LIMIT %s" in sql
+    assert params == (2, 7, 1, 7)
+    assert page["total"] == 1000000
+    assert page["users"] == [{"followed_at": followed_at, "id": 4, "username": "d",
+                              "nickname": "D", "avatar_url": None, "is_following": 1}]
+    assert page["next_cursor"]
+
+    mock_cursor.fetchall.side_effect = [[], [{"total": 1000000}]]
+    page = UserService.get_following_page(7, limit=1, cursor=page["next_cursor"])
+    sql, params = mock_cursor.execute.call_args.args
+    assert "f.created_at < %s OR (f.created_at = %s AND f.id < %s)" in sql
+    assert "WHERE f.follower_id = %s" in sql
+    assert page["next_cursor"] is None
+
+def test_follow_page_limit_is_bounded():
+    with pytest.raises(ValueError):
+        UserService.get_followers_page(7, limit=1000)
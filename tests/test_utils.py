@@ -0,0 +1,100 @@
+import io
+import os
+import pytest
+from types import SimpleNamespace
+from PIL import Image
+from backend import utils
+from backend.utils import (
+    list_variants, make_variants, resolve_variant, save_image, save_video, sniff_image_type, stream_to_file,
+    validate_image_file, variant_path,
+)
+
+class CountingReader(io.BytesIO):
+    """Records the largest single read so tests can assert bounded buffering."""
+    max_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.max_read = max(self.max_read, len(data))
+        return data
+
+def upload(filename, data, content_type=None):
+    return SimpleNamespace(filename=filename, file=CountingReader(data), content_type=content_type)
+
+def jpeg_bytes(size=(40, 30)):
+    buf = io.BytesIO()
+    Image.new('RGB', size, color='red').save(buf, format='JPEG')
+    return buf.getvalue()
+
+@pytest.fixture(autouse=True)
+def image_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, 'IMAGE_DIR', str(tmp_path))
+    return tmp_path
+
+def test_stream_to_file_copies_in_chunks(tmp_path):
+    source = CountingReader(b'x' * 10_000)
+    stored = stream_to_file(source, str(tmp_path / 'a.bin'), max_size=20_000, chunk_size=1024)
+
+    assert stored.size == 10_000
+    assert open(stored.path, 'rb').read() == b'x' * 10_000
+    assert source.max_read == 1024
+    assert os.listdir(tmp_path) == ['a.bin']
+
+def test_stream_to_file_stops_at_limit_and_leaves_nothing(tmp_path):
+    source = CountingReader(b'x' * 10_000)
+    with pytest.raises(ValueError):
+        stream_to_file(source, str(tmp_path / 'a.bin'), max_size=4096, chunk_size=1024)
+    assert source.tell() <= 5 * 1024
+    assert os.listdir(tmp_path) == []
+
+def test_image_type_comes_from_magic_bytes():
+    assert sniff_image_type(jpeg_bytes()[:16]) == 'jpeg'
+    assert validate_image_file(upload('fake.png', jpeg_bytes()))[1] == "文件扩展名与内容不匹配"
+    assert validate_image_file(upload('a.jpg', b'not an image at all'))[1] == "无法识别图片格式"
+
+def test_save_image_and_video(image_dir):
+    path = save_image(upload('a.jpg', jpeg_bytes(), 'image/jpeg'))
+    assert Image.open(path).size == (40, 30)
+
+    video = b'\x00\x00\x00\x18ftypmp42' + b'\x00' * 5000
+    video_upload = upload('clip.mp4', video)
+    path = save_video(video_upload)
+    with open(path, 'rb') as f:
+        assert f.read() == video
+    assert video_upload.file.max_read <= utils.UPLOAD_CHUNK_SIZE
+    assert not [name for name in os.listdir(image_dir) if name.endswith('.part')]
+
+def test_save_video_rejects_mismatched_container():
+    with pytest.raises(ValueError):
+        save_video(upload('clip.mp4', b'\x1a\x45\xdf\xa3' + b'\x00' * 100))
+
+def test_save_image_writes_jpeg_and_webp_variants(image_dir):
+    path = save_image(upload('a.jpg', jpeg_bytes((1600, 1200)), 'image/jpeg'))
+
+    variants = list_variants(path)
+    assert [(v.width, v.format) for v in variants] == [
+        (64, 'jpeg'), (64, 'webp'), (320, 'jpeg'), (320, 'webp'), (1080, 'jpeg'), (1080, 'webp'),
+    ]
+    assert Image.open(variant_path(path, 320, 'webp')).size == (320, 240)
+    assert Image.open(variant_path(path, 64, 'jpeg')).format == 'JPEG'
+    assert all(v.size == os.path.getsize(v.path) for v in variants)
+
+def test_make_variants_never_upscales(image_dir):
+    path = str(image_dir / 'small.jpg')
+    variants = make_variants(Image.new('RGB', (200, 100)), path)
+
+    # 320 is the first tier wider than the source: kept at 200px, 1080 skipped
+    assert {(v.width, v.format) for v in variants} == {(64, 'jpeg'), (64, 'webp'), (320, 'jpeg'), (320, 'webp')}
+    assert Image.open(variant_path(path, 320, 'jpeg')).size == (200, 100)
+    assert Image.open(variant_path(path, 64, 'jpeg')).size == (64, 32)
+
+def test_resolve_variant_picks_narrowest_that_fits(image_dir):
+    path = str(image_dir / 'small.jpg')
+    Image.new('RGB', (200, 100)).save(path)
+    assert resolve_variant(path, 100, 'webp') == path  # no variants yet
+
+    make_variants(Image.open(path), path)
+    assert resolve_variant(path, 50, 'webp') == variant_path(path, 64, 'webp')
+    assert resolve_variant(path, 200, 'jpeg') == variant_path(path, 320, 'jpeg')
+    assert resolve_variant(path, 500, 'webp') == path  # wider than any variant
+    assert resolve_variant(path, None) == path